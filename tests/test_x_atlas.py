@@ -0,0 +1,55 @@
+# Packs the textures of two meshes into an atlas.
+
+import copy
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_atlas
+
+from test_x_writer import BuildScene
+
+
+class AtlasTest(unittest.TestCase):
+    def testPackRectangles(self):
+        Sizes = [(16, 16), (8, 32), (30, 4)]
+        Width, Height, Positions = x_atlas.PackRectangles(Sizes, 2)
+        for Size in (Width, Height):
+            self.assertEqual(Size & (Size - 1), 0)
+        Boxes = [(X - 2, Y - 2, X + SizeX + 2, Y + SizeY + 2)
+            for (X, Y), (SizeX, SizeY) in zip(Positions, Sizes)]
+        for Index, Box in enumerate(Boxes):
+            self.assertTrue(Box[0] >= 0 and Box[1] >= 0 and
+                Box[2] <= Width and Box[3] <= Height)
+            for Other in Boxes[:Index]:
+                self.assertTrue(Box[2] <= Other[0] or Other[2] <= Box[0] or
+                    Box[3] <= Other[1] or Other[3] <= Box[1])
+
+    def testBuildAtlas(self):
+        Red = BuildScene().Frames[0].Children[0].Meshes[0]
+        Blue = copy.deepcopy(Red)
+        Blue.Materials[0].Name = "Blue"
+        Blue.Materials[0].TextureFilename = "blue.png"
+        Images = {"red.png" : numpy.ones((4, 4, 4)),
+            "blue.png" : numpy.zeros((8, 8, 4))}
+        Coords = Red.TextureCoords.copy()
+
+        self.assertIsNone(x_atlas.BuildAtlas([Red], "atlas", Images.get))
+        Atlas = x_atlas.BuildAtlas([Red, Blue], "atlas", Images.get, 1)
+        Height, Width = Atlas.Pixels.shape[:2]
+        for Mesh, Texture in ((Red, "red.png"), (Blue, "blue.png")):
+            X, Y, SizeX, SizeY = Atlas.Regions[Texture]
+            numpy.testing.assert_allclose(Atlas.Pixels[Y:Y + SizeY,
+                X:X + SizeX], Images[Texture])
+            numpy.testing.assert_allclose(Mesh.TextureCoords,
+                (Coords * (SizeX, SizeY) + (X, Y)) / (Width, Height))
+            self.assertIs(Mesh.Materials[0], Atlas.Materials[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+# Computes bounding volumes of small point clouds.
+
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_bounds
+
+
+class BoundsTest(unittest.TestCase):
+    def testSphereEnclosesPoints(self):
+        Random = numpy.random.RandomState(0)
+        for Points in (Random.rand(100, 3), Random.randn(30, 3) * 5,
+            Random.rand(1, 3)):
+            Center, Radius = x_bounds.BoundingSphere(Points)
+            Distances = numpy.sqrt(((Points - Center) ** 2).sum(axis=1))
+            self.assertLessEqual(Distances.max(), Radius + 1e-9)
+
+    def testSphereOfTwoPoints(self):
+        Center, Radius = x_bounds.BoundingSphere([(0, 0, 0), (2, 0, 0)])
+        numpy.testing.assert_allclose(Center, (1, 0, 0))
+        self.assertAlmostEqual(Radius, 1)
+
+    def testEmpty(self):
+        self.assertIsNone(x_bounds.BoundingSphere([]))
+        self.assertIsNone(x_bounds.BoundingBox([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# Builds convex hulls of small point clouds.
+
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_hull
+
+
+class HullTest(unittest.TestCase):
+    def setUp(self):
+        self.Points = numpy.random.RandomState(0).rand(50, 3)
+
+    def testContainsPoints(self):
+        Positions, Triangles = x_hull.ConvexHull(self.Points, 1000)
+        A, B, C = (Positions[Triangles[:, Corner]] for Corner in range(3))
+        Normals = numpy.cross(B - A, C - A)
+        # Every point is behind every outward facing triangle
+        Heights = ((self.Points[:, None] - A[None]) * Normals[None]).sum(
+            axis=2)
+        self.assertLessEqual(Heights.max(), 1e-9)
+        for Position in Positions:
+            self.assertTrue(numpy.any(numpy.all(self.Points == Position,
+                axis=1)))
+
+    def testCube(self):
+        Corners = numpy.array([(X, Y, Z) for X in (0, 1) for Y in (0, 1)
+            for Z in (0, 1)], dtype=numpy.float64)
+        Points = numpy.concatenate((Corners, self.Points * 0.5 + 0.25))
+        Positions, Triangles = x_hull.ConvexHull(Points)
+        self.assertEqual(sorted(map(tuple, Positions)),
+            sorted(map(tuple, Corners)))
+        self.assertEqual(len(Triangles), 12)
+
+    def testMaxVertices(self):
+        Positions, Triangles = x_hull.ConvexHull(self.Points, 6)
+        self.assertLessEqual(len(Positions), 6)
+        self.assertEqual(len(numpy.unique(Triangles)), len(Positions))
+
+    def testFlat(self):
+        Points = self.Points.copy()
+        Points[:, 2] = 0
+        self.assertIsNone(x_hull.ConvexHull(Points))
+        self.assertIsNone(x_hull.ConvexHull(self.Points[:3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+# Merges the static meshes of a small scene.
+
+import copy
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_merge
+import x_scene
+
+from test_x_writer import BuildScene
+
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.Scene = BuildScene()
+        Root = self.Scene.Frames[0]
+        self.Mesh = Root.Children[0].Meshes[0]
+        Other = x_scene.Frame("Other")
+        Other.Matrix[3, :3] = (5, 0, 0)
+        Other.Meshes.append(copy.deepcopy(self.Mesh))
+        Root.Children.append(Other)
+
+    def testKeepsAnimatedFrames(self):
+        self.assertEqual(x_merge.GetAnimatedFrames(
+            self.Scene.AnimationSets), set(["Child"]))
+        Root = x_merge.MergeStatic(self.Scene).Frames[0]
+        self.assertEqual([Frame.Name for Frame in Root.Children], ["Child"])
+        self.assertEqual(len(Root.Children[0].Meshes), 1)
+        self.assertEqual([Mesh.Name for Mesh in Root.Meshes], ["Static_Red"])
+        numpy.testing.assert_allclose(Root.Meshes[0].Positions,
+            self.Mesh.Positions + (5, 0, 0))
+
+    def testMergesStaticFrames(self):
+        self.Scene.AnimationSets = []
+        Root = x_merge.MergeStatic(self.Scene).Frames[0]
+        self.assertEqual(Root.Children, [])
+        Merged = Root.Meshes[0]
+        self.assertEqual(Merged.GetFaceCount(), 6)
+        numpy.testing.assert_allclose(Merged.Positions[:5],
+            self.Mesh.Positions * 2)
+        numpy.testing.assert_allclose(Merged.Positions[5:],
+            self.Mesh.Positions + (5, 0, 0))
+
+    def testMaxVertices(self):
+        self.Scene.AnimationSets = []
+        Root = x_merge.MergeStatic(self.Scene, MaxVertices=5).Frames[0]
+        self.assertEqual([Mesh.Name for Mesh in Root.Meshes],
+            ["Static_Red_0", "Static_Red_1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
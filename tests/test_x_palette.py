@@ -0,0 +1,58 @@
+# Splits a skinned strip of quads into parts with small bone palettes.
+
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_palette
+import x_scene
+
+
+# A row of Quads quads.  Bone i moves the i-th column of vertices, so each
+# quad uses two bones.
+def BuildStrip(Quads):
+    Mesh = x_scene.Mesh("Strip")
+    Mesh.Positions = x_scene.FloatArray([(Column, Row, 0)
+        for Column in range(Quads + 1) for Row in (0, 1)], 3)
+    Mesh.FaceSizes = x_scene.IndexArray([4] * Quads)
+    Mesh.FaceIndices = x_scene.IndexArray([Index for Quad in range(Quads)
+        for Index in (2 * Quad, 2 * Quad + 2, 2 * Quad + 3, 2 * Quad + 1)])
+    Mesh.SkinWeights = [x_scene.SkinWeights("Bone%d" % Column,
+        [2 * Column, 2 * Column + 1], [1, 1]) for Column in range(Quads + 1)]
+    Mesh.MaxSkinWeightsPerVertex = 1
+    Mesh.MaxSkinWeightsPerFace = 2
+    return Mesh
+
+
+class PaletteTest(unittest.TestCase):
+    def testPartition(self):
+        Mesh = BuildStrip(6)
+        Parts = x_palette.PartitionMesh(Mesh, 3)
+        self.assertGreater(len(Parts), 1)
+        self.assertEqual(sum(Part.GetFaceCount() for Part in Parts), 6)
+        Bones = set()
+        for Part in Parts:
+            self.assertTrue(Part.BonePalette)
+            self.assertLessEqual(len(Part.SkinWeights), 3)
+            Bones.update(Skin.FrameName for Skin in Part.SkinWeights)
+            # Every vertex of the part is still fully weighted
+            Totals = numpy.zeros(Part.GetVertexCount())
+            for Skin in Part.SkinWeights:
+                numpy.add.at(Totals, Skin.Indices, Skin.Weights)
+            numpy.testing.assert_allclose(Totals, 1)
+        self.assertEqual(Bones, set("Bone%d" % Bone for Bone in range(7)))
+
+    def testFits(self):
+        Mesh = BuildStrip(2)
+        self.assertEqual(x_palette.PartitionMesh(Mesh, 3), [Mesh])
+        self.assertTrue(Mesh.BonePalette)
+        self.assertRaises(ValueError, x_palette.PartitionMesh, Mesh, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# Splits a small scene into one file per root object and reads the manifest
+# back.
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_scene
+import x_split
+import x_writer
+
+from test_x_writer import BuildScene
+
+
+class SplitTest(unittest.TestCase):
+    def setUp(self):
+        self.Directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.Directory)
+
+    def testWriteFiles(self):
+        Scene = BuildScene()
+        Root = Scene.Frames[0]
+        Root.Children.append(x_scene.Frame("Other"))
+        Files = [x_split.SplitFile("animations", os.path.join(self.Directory,
+            "scene.animations.x"), x_split.TakeAnimations(Scene))]
+        for Name, Part in x_split.SplitScene(Scene, Root,
+            [("Child", Root.Children[:1]), ("Other", Root.Children[1:])]):
+            Files.append(x_split.SplitFile(Name, os.path.join(self.Directory,
+                "scene_%s.x" % Name), Part))
+
+        ManifestPath = os.path.join(self.Directory, "scene.manifest.json")
+        x_split.WriteFiles(Files, lambda File, Split: x_writer.XWriter(File),
+            ManifestPath, Jobs=2)
+
+        with open(ManifestPath, 'r') as File:
+            Manifest = json.load(File)
+        self.assertEqual(Manifest["Version"], x_split.MANIFEST_VERSION)
+        self.assertEqual([Entry["Name"] for Entry in Manifest["Files"]],
+            ["animations", "Child", "Other"])
+        Child = Manifest["Files"][1]
+        self.assertEqual(Child["File"], "scene_Child.x")
+        self.assertEqual(Child["Frames"], ["Root", "Child"])
+        self.assertEqual(Child["Materials"], ["Red"])
+        self.assertEqual(Manifest["Files"][0]["AnimationSets"], ["Move"])
+        for Entry in Manifest["Files"]:
+            Path = os.path.join(self.Directory, Entry["File"])
+            with open(Path, 'r') as File:
+                self.assertTrue(File.read().startswith("xof "))
+        self.assertEqual(sorted(os.listdir(self.Directory)), sorted(
+            ["scene.animations.x", "scene_Child.x", "scene_Other.x",
+            "scene.manifest.json"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+# Compresses a small image to .dds and reads it back.
+
+import io
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_texture
+
+
+class TextureTest(unittest.TestCase):
+    def setUp(self):
+        self.Pixels = numpy.random.RandomState(0).rand(8, 16, 4).astype(
+            numpy.float32)
+
+    def testMipChain(self):
+        Mips = x_texture.GenerateMipChain(self.Pixels)
+        self.assertEqual([Mip.shape[:2] for Mip in Mips], [(8, 16), (4, 8),
+            (2, 4), (1, 2), (1, 1)])
+        numpy.testing.assert_allclose(Mips[-1][0, 0],
+            self.Pixels.mean(axis=(0, 1)), rtol=1e-5)
+
+    def testDDSRoundTrip(self):
+        Mips = x_texture.GenerateMipChain(self.Pixels)
+        for Format, BlockSize in (("DXT1", 8), ("DXT5", 16)):
+            File = io.BytesIO()
+            x_texture.WriteDDS(File, Mips, Format)
+            File.seek(0)
+            Read, Width, Height, Levels = x_texture.ReadDDS(File)
+            self.assertEqual((Read, Width, Height), (Format, 16, 8))
+            self.assertEqual(Levels, [x_texture.EncodeBlocks(Mip, Format)
+                for Mip in Mips])
+            self.assertEqual([len(Level) for Level in Levels],
+                [BlockSize * Blocks for Blocks in (8, 2, 1, 1, 1)])
+            self.assertEqual(File.read(), b"")
+
+    def testReadInvalid(self):
+        self.assertRaises(ValueError, x_texture.ReadDDS, io.BytesIO(b"PNG"))
+        File = io.BytesIO()
+        x_texture.WriteDDS(File, [self.Pixels], "DXT1")
+        self.assertRaises(ValueError, x_texture.ReadDDS, io.BytesIO(
+            File.getvalue()[:-1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
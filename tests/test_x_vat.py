@@ -0,0 +1,71 @@
+# Lays out vertex animation textures and writes them.
+
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_vat
+
+
+class VatTest(unittest.TestCase):
+    def setUp(self):
+        # 10 vertices take 3 rows of 4, so a page of 8 rows holds 2 frames
+        self.Animation = x_vat.VertexAnimation("Body", 10, 24, MaxWidth=4,
+            MaxHeight=8)
+        self.Positions = numpy.arange(3 * 10 * 3, dtype=numpy.float32)
+        self.Animation.AddClip("Walk", self.Positions,
+            numpy.zeros(3 * 10 * 3))
+
+    def testLayout(self):
+        Animation = self.Animation
+        self.assertEqual((Animation.Width, Animation.RowsPerFrame), (4, 3))
+        self.assertEqual(Animation.GetFrameCount(), 3)
+        self.assertEqual(Animation.GetFramesPerPage(), 2)
+        self.assertEqual(Animation.GetPageCount(), 2)
+        self.assertEqual(Animation.GetHeight(), 6)
+        numpy.testing.assert_allclose(Animation.GetTextureCoords([0, 5, 9]),
+            [(0.5 / 4, 0.5 / 6), (1.5 / 4, 1.5 / 6), (1.5 / 4, 2.5 / 6)])
+        self.assertRaises(ValueError, x_vat.VertexAnimation, "Body", 100,
+            MaxWidth=4, MaxHeight=8)
+
+    def testSave(self):
+        Directory = tempfile.mkdtemp()
+        try:
+            Path = os.path.join(Directory, "model.vat.json")
+            x_vat.Save([self.Animation], Path)
+            with open(Path, 'r') as File:
+                Index = json.load(File)
+            self.assertEqual(Index["Version"], x_vat.VAT_VERSION)
+            self.assertEqual(Index["FrameRate"], 24)
+            Entry = Index["Meshes"][0]
+            self.assertEqual(Entry["Positions"], ["model_Body.positions.0.dds",
+                "model_Body.positions.1.dds"])
+            self.assertEqual(Entry["Clips"], [{"Name" : "Walk",
+                "FirstFrame" : 0, "FrameCount" : 3}])
+
+            # The third frame starts the second page
+            with open(os.path.join(Directory, Entry["Positions"][1]),
+                'rb') as File:
+                Data = File.read()
+            self.assertEqual(struct.unpack("<II", Data[12:20]), (6, 4))
+            Pixels = numpy.frombuffer(Data[128:], dtype='<f4').reshape(6, 4,
+                4)
+            numpy.testing.assert_allclose(Pixels.reshape(-1, 4)[:10, :3],
+                self.Positions.reshape(3, 10, 3)[2])
+            self.assertEqual(sorted(os.listdir(Directory)), sorted([
+                "model.vat.json"] + Entry["Positions"] + Entry["Normals"]))
+        finally:
+            shutil.rmtree(Directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# Round trips a small scene through the Blender-free scene IR, the .x
+# serializer and scene snapshots.
+
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_scene
+import x_snapshot
+import x_writer
+
+
+def BuildScene():
+    Mesh = x_scene.Mesh("Box")
+    Mesh.Positions = x_scene.FloatArray([(0, 0, 0), (1, 0, 0), (1, 1, 0),
+        (0, 1, 0), (0.5, 0.5, 1)], 3)
+    Mesh.FaceSizes = x_scene.IndexArray([4, 3, 3])
+    Mesh.FaceIndices = x_scene.IndexArray([0, 1, 2, 3, 0, 1, 4, 1, 2, 4])
+    Mesh.Normals = x_scene.FloatArray([(0, 0, -1), (0, -1, 0), (1, 0, 0)], 3)
+    Mesh.NormalFaceIndices = x_scene.IndexArray([0, 0, 0, 0, 1, 1, 1, 2, 2,
+        2])
+    Mesh.TextureCoords = x_scene.FloatArray([(0, 0), (1, 0), (1, 1), (0, 1),
+        (0.5, 0.5)], 2)
+
+    Material = x_scene.Material("Red")
+    Material.Diffuse = x_scene.FloatArray((1, 0, 0, 1))
+    Material.TextureFilename = "red.png"
+    Mesh.Materials = [Material]
+    Mesh.MaterialIndices = x_scene.IndexArray([0, 0, 0])
+
+    Root = x_scene.Frame("Root")
+    Child = x_scene.Frame("Child", numpy.diag([2.0, 2.0, 2.0, 1.0]))
+    Child.Meshes.append(Mesh)
+    Root.Children.append(Child)
+
+    Track = x_scene.AnimationTrack("Child", [0, 10])
+    Track.PositionKeys = x_scene.FloatArray([(0, 0, 0), (0, 3, 0)], 3)
+
+    Scene = x_scene.Scene()
+    Scene.Frames.append(Root)
+    Scene.AnimationSets.append(x_scene.AnimationSet("Move", [Track]))
+    Scene.FrameRate = 24
+    return Scene
+
+
+def WriteX(Scene, **Options):
+    File = io.StringIO()
+    x_writer.XWriter(File, **Options).Write(Scene)
+    return File.getvalue()
+
+
+# The rows of the first list of Count vectors of Size floats after Header
+def ReadVectors(Text, Header, Count, Size):
+    Body = Text[Text.index(Header) + len(Header):]
+    Numbers = re.findall(r"-?\d+(?:\.\d+)?(?:e[-+]?\d+)?", Body)
+    Numbers = [float(Number) for Number in Numbers[:1 + Count * Size]]
+    assert int(Numbers[0]) == Count, Numbers[0]
+    return numpy.array(Numbers[1:]).reshape(Count, Size)
+
+
+class XWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.Scene = BuildScene()
+        self.Mesh = self.Scene.Frames[0].Children[0].Meshes[0]
+
+    def testStructure(self):
+        Text = WriteX(self.Scene)
+        self.assertTrue(Text.startswith("xof 0303txt 0032"))
+        for Block in ("Frame Root {", "Frame Child {", "Mesh {",
+            "MeshNormals {", "MeshTextureCoords {", "MeshMaterialList {",
+            "Material Red {", 'TextureFilename {"red.png";}',
+            "AnimTicksPerSecond {", "AnimationSet Move {", "{Child}"):
+            self.assertIn(Block, Text)
+        self.assertEqual(Text.count("{"), Text.count("}"))
+
+    def testValuesRoundTrip(self):
+        for Compact in (False, True):
+            Text = WriteX(self.Scene, Compact=Compact)
+            Positions = ReadVectors(Text, "Mesh {" if Compact else
+                "Mesh { // Box mesh", 5, 3)
+            numpy.testing.assert_allclose(Positions, self.Mesh.Positions)
+            Coords = ReadVectors(Text, "MeshTextureCoords {", 5, 2)
+            numpy.testing.assert_allclose(Coords, self.Mesh.TextureCoords)
+
+    def testPrecision(self):
+        self.Mesh.Positions[0] = (0.123456789, 0, 0)
+        Text = WriteX(self.Scene, Precision={"Positions" : 2})
+        self.assertIn("0.12;", Text)
+        self.assertNotIn("0.123", Text)
+
+    def testSnapshotRoundTrip(self):
+        Directory = tempfile.mkdtemp()
+        try:
+            Path = os.path.join(Directory, "scene.xsnap")
+            x_snapshot.Save(self.Scene, Path)
+            for MemoryMap in (False, True):
+                self.assertEqual(WriteX(x_snapshot.Load(Path, MemoryMap)),
+                    WriteX(self.Scene))
+        finally:
+            shutil.rmtree(Directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
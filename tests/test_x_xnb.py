@@ -0,0 +1,51 @@
+# Writes the framing of .xnb files.
+
+import io
+import os
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "xexportscripts"))
+
+import x_xnb
+
+
+class XnbTest(unittest.TestCase):
+    def testWrite7BitInt(self):
+        for Value, Expected in ((0, b"\x00"), (127, b"\x7f"),
+            (128, b"\x80\x01"), (300, b"\xac\x02"),
+            (2 ** 21, b"\x80\x80\x80\x01")):
+            Stream = io.BytesIO()
+            x_xnb._Write7BitInt(Stream, Value)
+            self.assertEqual(Stream.getvalue(), Expected)
+
+    def testHeader(self):
+        for HiDef in (False, True):
+            File = io.BytesIO()
+            x_xnb._WriteXnb(File, ["Reader"], b"asset", [b"shared"], HiDef)
+            Data = File.getvalue()
+            Magic, Platform, Version, Flags, Size = struct.unpack("<3scBBI",
+                Data[:10])
+            self.assertEqual((Magic, Platform, Version), (b"XNB", b"w",
+                x_xnb.XNB_VERSION))
+            self.assertEqual(Flags, x_xnb.FLAG_HIDEF if HiDef else 0)
+            self.assertEqual(Size, len(Data))
+            # Reader count, name and version, then the resource count
+            self.assertEqual(Data[10:22], b"\x01\x06Reader\x00\x00\x00\x00")
+            self.assertEqual(Data[22:], b"\x01assetshared")
+
+    def testWriteTexture(self):
+        Levels = [b"\x00" * 32, b"\x00" * 8]
+        for Width, HiDef in ((8, False), (4096, True)):
+            File = io.BytesIO()
+            x_xnb.WriteTexture(File, "DXT1", Width, 4, Levels)
+            Data = File.getvalue()
+            self.assertEqual(bool(Data[5] & x_xnb.FLAG_HIDEF), HiDef)
+            self.assertEqual(struct.unpack("<I", Data[6:10])[0], len(Data))
+            self.assertTrue(Data.endswith(struct.pack("<I", 8) + Levels[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -72,83 +72,173 @@ Compressed = False #Always false, not yet supported.
 #Output file.
 out = None
   
+#Number of characters XFile buffers before writing to disk.
+BUFFERSIZE = 256 * 1024
+
+#Number of list items formatted at a time.
+CHUNKSIZE = 1024
+  
 class XFile:
-    """Simple file-like class. Writes contents
-       into a file only when closed. """
+    """Simple file-like class. Buffers writes into a temporary
+       file, which replaces the target file only when closed,
+       so a failed export never leaves a truncated file behind."""
     def __init__(self, filename):
         name = filename.strip().lower()
         if name[-2:] != ".x":
             name += ".x"
     
         self.fname = name
+        self.tempname = name + ".tmp"
         self.contents = []
+        self.size = 0
         print "\nExporting to '%s'..." % self.fname
+
+        if Compressed:
+            assert 0
+        self.f = file(self.tempname, "w")
+        self.f.write(HEADERTEXT)
         
     def write(self, string):
         self.contents.append(string)
+        self.size += len(string)
+        if self.size >= BUFFERSIZE:
+            self.flush()
+
+    def writelines(self, strings):
+        for string in strings:
+            self.write(string)
+
+    def flush(self):
+        self.f.write("".join(self.contents))
+        self.contents = []
+        self.size = 0
   
     def close(self):
-        self.f = file(self.fname, "w")
-    
-        if Compressed:
-            assert 0
-        else:
-            self.f.write(HEADERTEXT)
-            self.f.write("".join(self.contents))
+        self.flush()
         self.f.close()
+
+        if os.path.exists(self.fname):
+            #os.rename() can't overwrite files on Windows.
+            os.remove(self.fname)
+        os.rename(self.tempname, self.fname)
+
+    def abort(self):
+        """Discards everything written so far."""
+        self.contents = []
+        self.f.close()
+        os.remove(self.tempname)
+
+def JoinChunks(items, separator=",\n", terminator=";\n"):
+    """Joins formatted list items like "".join() would, but yields
+       the result in chunks of CHUNKSIZE items."""
+    chunk = []
+    for item in items:
+        if len(chunk) == CHUNKSIZE:
+            yield separator.join(chunk) + separator
+            chunk = []
+        chunk.append(item)
+    if chunk:
+        yield separator.join(chunk) + terminator
   
-def GetVertexData(data, mesh):
-    """Returns formatted vertex data."""
-    result = []
-    for i, vertex in enumerate(data.verts):
-        if UseWTrans:
-            x, y, z = mesh.matrixWorld[3][0], mesh.matrixWorld[3][1], mesh.matrixWorld[3][2]
-        else:
-            x, y, z = 0.0, 0.0, 0.0
-            
-        if SwapYZ and ExportType != 2:
-            result.append("%f; %f; %f;" % (vertex.co.x + x, vertex.co.z + z, vertex.co.y + y))
-        else:
-            result.append("%f; %f; %f;" % (vertex.co.x + x, vertex.co.y + y, vertex.co.z + z))
-            
-        if i == len(data.verts) - 1:
-            result.append(";\n")
-        else:
-            result.append(",\n")
-    return "".join(result)
-    
-def GetFaceData(data):
-    """Returns formatted face data."""
-    result = []
-    result.append("%i;\n" % len(data.faces))
-    for i, face in enumerate(data.faces):
-        result.append("%i; " % len(face.v))
-        result.append(", ".join([str(v.index) for v in face.v]))  
-        if i == len(data.faces) - 1:
-            result.append(";;")
-        else:
-            result.append(";,")
-        result.append("\n")
-    return "".join(result)
-    
-def GetNormalData(data):
-    """Returns formatted normal data."""
-    result = []
-    for i, vertex in enumerate(data.verts):
-        if SwapYZ and ExportType != 2:
-            result.append("%f; %f; %f;" % (vertex.no.x, vertex.no.z, vertex.no.y))  
-        else:
-            result.append("%f; %f; %f;" % (vertex.no.x, vertex.no.y, vertex.no.z))  
-            
-        if i == len(data.verts) - 1:
-            result.append(";\n")
-        else:
-            result.append(",\n")
-    return "".join(result)
+def Normalize(x, y, z):
+    """Returns the given vector scaled to unit length."""
+    length = (x * x + y * y + z * z) ** 0.5
+    if length == 0.0:
+        return x, y, z
+    return x / length, y / length, z / length
+
+def GetNormalMatrix(matrix):
+    """Returns the inverse-transpose of the 3x3 part of the
+       given matrix, used to transform normals."""
+    m = Mathutils.Matrix(
+        [matrix[0][0], matrix[0][1], matrix[0][2]],
+        [matrix[1][0], matrix[1][1], matrix[1][2]],
+        [matrix[2][0], matrix[2][1], matrix[2][2]])
+    try:
+        m.invert()
+    except ValueError:
+        #Degenerate (zero scale) object, leave normals alone.
+        return None
+    m.transpose()
+    return m
+
+def TransformVertices(data, mesh):
+    """Transforms all vertex positions and normals of the mesh in one
+       pass. Returns two lists of (x, y, z) tuples ready for output."""
+    verts = data.verts
+    coords = [tuple(v.co) for v in verts]
+    normals = [tuple(v.no) for v in verts]
+
+    if UseWTrans:
+        #Fetch the world matrix only once and apply the full
+        #affine transform (row vectors, translation in row 3).
+        m = mesh.matrixWorld
+        m00, m01, m02 = m[0][0], m[0][1], m[0][2]
+        m10, m11, m12 = m[1][0], m[1][1], m[1][2]
+        m20, m21, m22 = m[2][0], m[2][1], m[2][2]
+        tx, ty, tz = m[3][0], m[3][1], m[3][2]
+        coords = [(x * m00 + y * m10 + z * m20 + tx,
+                   x * m01 + y * m11 + z * m21 + ty,
+                   x * m02 + y * m12 + z * m22 + tz)
+                  for x, y, z in coords]
+
+        n = GetNormalMatrix(m)
+        if n is not None:
+            n00, n01, n02 = n[0][0], n[0][1], n[0][2]
+            n10, n11, n12 = n[1][0], n[1][1], n[1][2]
+            n20, n21, n22 = n[2][0], n[2][1], n[2][2]
+            normals = [(x * n00 + y * n10 + z * n20,
+                        x * n01 + y * n11 + z * n21,
+                        x * n02 + y * n12 + z * n22)
+                       for x, y, z in normals]
+            #Scaling changes the length, renormalize.
+            normals = [Normalize(x, y, z) for x, y, z in normals]
+
+    if SwapYZ and ExportType != 2:
+        coords = [(x, z, y) for x, y, z in coords]
+        normals = [(x, z, y) for x, y, z in normals]
+
+    return coords, normals
+
+def GetVertexData(coords):
+    """Yields formatted vertex data."""
+    return JoinChunks(("%f; %f; %f;" % c for c in coords))
+    
+def GetFaceData(data, remap=None):
+    """Yields formatted face data. Vertex indices are passed
+       through remap if given."""
+    yield "%i;\n" % len(data.faces)
+    if remap is None:
+        faces = ("%i; %s" % (len(face.v), ", ".join([str(v.index) for v in face.v]))
+            for face in data.faces)
+    else:
+        faces = ("%i; %s" % (len(face.v), ", ".join([str(remap[v.index]) for v in face.v]))
+            for face in data.faces)
+    for chunk in JoinChunks(faces, ";,\n", ";;\n"):
+        yield chunk
+    
+def DeduplicateNormals(normals):
+    """Returns the distinct normals, formatted, and for every
+       vertex the index of its normal. Normals that are written
+       the same are the same."""
+    unique = []
+    remap = []
+    indices = {}
+    for n in normals:
+        text = "%f; %f; %f;" % n
+        index = indices.get(text)
+        if index is None:
+            index = indices[text] = len(unique)
+            unique.append(text)
+        remap.append(index)
+    return unique, remap
+
+def GetNormalData(normals):
+    """Yields formatted normal data."""
+    return JoinChunks(normals)
     
 def GetMaterialData(data):
-    """Returns formatted material data."""
-    result = []
+    """Yields formatted material data."""
     #Save material definitions
     materials = []
     
@@ -175,18 +265,16 @@ def GetMaterialData(data):
         materials.append(material)
     
     #Save Face->Material indices.
-    result.append("%i;\n%i;\n" % (len(materials), len(data.faces)))
-    for i, face in enumerate(data.faces):
-        if i == len(data.faces) - 1:
-            result.append("%i;;\n" % face.materialIndex)
-        else:
-            result.append("%i,\n" % face.materialIndex)
+    yield "%i;\n%i;\n" % (len(materials), len(data.faces))
+    indices = ("%i" % face.materialIndex for face in data.faces)
+    for chunk in JoinChunks(indices, ",\n", ";;\n"):
+        yield chunk
             
-    return "".join(result + materials)
+    for material in materials:
+        yield material
     
 def GetVertexColorData(data):
-    """Returns formatted vertex color data."""
-    result = []
+    """Yields formatted vertex color data."""
     written = set()
     for face in data.faces:
         for i, vertex in enumerate(face.v):
@@ -196,74 +284,72 @@ def GetVertexColorData(data):
                 #share same vertices.
                 color = face.col[i]
                 r, g, b, a = color.r / 255.0, color.g / 255.0, color.b / 255.0, color.a / 255.0
-                result.append("%i; %f; %f; %f; %f;;\n" % (vindex, r, g, b, a))
+                yield "%i; %f; %f; %f; %f;;\n" % (vindex, r, g, b, a)
                 #Add vertex index.
                 written.add(vindex)
-            
-    return "".join(result)
     
 def GetTexCoordData(data):
-    """Returns formatted texture coordinate data."""
-    result = ["%s;\n" % len(data.verts)] #vertexcount == coord2count
-    for i, face in enumerate(data.faces):
-        #Loop through all faces.
-        for x in xrange(len(face.v)):
-            result.append("%f; %f;" % (data.faces[i].uv[x][0], data.faces[i].uv[x][1]))
-            if i == len(data.faces) - 1 and x == len(face.v) - 1:
-                #Last one.
-                result.append(";\n") 
-            else:
-                result.append(",\n")
-      
-    return "".join(result)
-    
-def GetWeightData(data, bone):
-    """Returns formatted skin data for SkinWeight template."""
-    try:
-        groupdata = data.getVertsFromGroup(bone.name, 1)
-    except:
+    """Yields formatted texture coordinate data."""
+    yield "%s;\n" % len(data.verts) #vertexcount == coord2count
+    #Loop through all corners of all faces.
+    coords = ("%f; %f;" % (uv[0], uv[1])
+        for face in data.faces for uv in face.uv)
+    for chunk in JoinChunks(coords):
+        yield chunk
+    
+class SkinTable:
+    """Vertex group membership and influence counts of a mesh.
+       Every group is queried only once, the header and all
+       SkinWeights blocks are then built from the table."""
+    def __init__(self, data):
+        #Group name -> [(vertex index, weight), ...]
+        self.groups = {}
+        #Vertex index -> number of groups the vertex belongs to.
+        self.influences = {}
+        for name in data.getVertGroupNames():
+            groupdata = data.getVertsFromGroup(name, 1)
+            self.groups[name] = groupdata
+            for index, weight in groupdata:
+                self.influences[index] = self.influences.get(index, 0) + 1
+
+    def GetGroup(self, name):
+        """Returns the (index, weight) pairs of a group, or None."""
+        return self.groups.get(name)
+
+    def GetMaxInfluence(self, bones):
+        """Returns the largest influence count of any vertex
+           that belongs to one of the given bones."""
+        maxinfluence = 0
+        influences = self.influences
+        for bone in bones:
+            for index, weight in self.groups.get(bone.name, ()):
+                if influences[index] > maxinfluence:
+                    maxinfluence = influences[index]
+        return maxinfluence
+
+def GetWeightData(skintable, bone):
+    """Yields formatted skin data for SkinWeight template."""
+    groupdata = skintable.GetGroup(bone.name)
+    if groupdata is None:
         #Placeholder.
-        return "0;\n0.0;\n" + "1.0,0.0,0.0,0.0, 0.0,1.0,0.0,0.0, 0.0,0.0,1.0,0.0, 0.0,0.0,0.0,1.0;;\n"
-    
-    indices = []
-    weights = []
-    for i, (index, weight) in enumerate(groupdata):
-        if i == len(groupdata) - 1:
-            indices.append("%i;\n" % index)
-            weights.append("%f;\n" % weight)
-        else:
-            indices.append("%i,\n" % index)  
-            weights.append("%f,\n" % weight)
+        yield "0;\n0.0;\n" + "1.0,0.0,0.0,0.0, 0.0,1.0,0.0,0.0, 0.0,0.0,1.0,0.0, 0.0,0.0,0.0,1.0;;\n"
+        return
+    
+    yield "%i;\n" % len(groupdata)
+    indices = ("%i" % index for index, weight in groupdata)
+    for chunk in JoinChunks(indices):
+        yield chunk
+    weights = ("%f" % weight for index, weight in groupdata)
+    for chunk in JoinChunks(weights):
+        yield chunk
     
     m = Mathutils.Matrix(bone.matrix["ARMATURESPACE"])
     m = m.invert()
-    weights.append((15 * "%f," + "%f;;\n") % (
-        m[0][0], m[0][1], m[0][2], m[0][3],
-        m[1][0], m[1][1], m[1][2], m[1][3],
-        m[2][0], m[2][1], m[2][2], m[2][3],
-        m[3][0], m[3][1], m[3][2], m[3][3],
-    ))
-    count = ["%i;\n" % (len(weights)-1)]
-    return "".join(count + indices + weights)
-    
-def GetSkinMeshHeader(data, armature, bones):
-    """Calculates and returns the XSkinMeshHeader template."""
-    maxinfluence = 0
-    for bone in bones:
-        name = bone.name
-        try:
-            indices = data.getVertsFromGroup(name)
-        except:
-            #No group for this bone.
-            continue
-        for index in indices:
-            #Go through all vertex indices and check
-            #if the target vertex has more influences
-            #than the old value.
-            influences = data.getVertexInfluences(index)
-            if len(influences) > maxinfluence:
-                maxinfluence = len(influences)
-
+    yield (15 * "%f," + "%f;;\n") % GetMatrixValues(m)
+    
+def GetSkinMeshHeader(skintable, bones):
+    """Returns the XSkinMeshHeader template."""
+    maxinfluence = skintable.GetMaxInfluence(bones)
     return "\nXSkinMeshHeader {\n%i;\n%i;\n%i;\n}\n" % (maxinfluence, 
         maxinfluence * 3, len(bones))
     
@@ -276,50 +362,57 @@ def WriteMesh(mesh, armature=None):
     #Mesh header.
     out.write("\nMesh %s {\n%i;\n" % (meshname, len(data.verts)))
 
+    #Transform all vertices and normals at once.
+    coords, normals = TransformVertices(data, mesh)
+
     #Vertexdata
-    out.write(GetVertexData(data, mesh))
+    out.writelines(GetVertexData(coords))
 
     #Facedata
-    facedata = GetFaceData(data)
-    out.write(facedata)
+    out.writelines(GetFaceData(data))
     
     if Materials:
         #Materialdata
         out.write("\nMeshMaterialList {\n")
-        out.write(GetMaterialData(data))
+        out.writelines(GetMaterialData(data))
         out.write("}\n")
     
     if Colors:# and data.hasVertexColours():
         #Color data.
         out.write("\nMeshVertexColors {\n%i;\n" % len(data.verts))
-        out.write(GetVertexColorData(data))
+        out.writelines(GetVertexColorData(data))
         out.write("}\n")
             
     if Normals:
-        #Normaldata
-        out.write("\nMeshNormals {\n%i;\n" % len(data.verts))
-        out.write(GetNormalData(data))
-        out.write(facedata)
+        #Normaldata, vertices that only differ in position
+        #share their normal.
+        normals, remap = DeduplicateNormals(normals)
+        out.write("\nMeshNormals {\n%i;\n" % len(normals))
+        out.writelines(GetNormalData(normals))
+        out.writelines(GetFaceData(data, remap))
         out.write("}\n")
     
     if TexCoords:# and data.hasFaceUV():
         #Texture coordinates
         out.write("\nMeshTextureCoords {\n")
-        out.write(GetTexCoordData(data))
+        out.writelines(GetTexCoordData(data))
         out.write("}\n")
         
     if ExportType == 2:
         #Animated, write skin/weight data.
         root = GetRootBone(armature)
         bones = [root] + root.getAllChildren()
+
+        #Gather all vertex group data in one sweep.
+        skintable = SkinTable(data)
         
         #XSkinMesh header.
-        out.write(GetSkinMeshHeader(data, armature, bones))
+        out.write(GetSkinMeshHeader(skintable, bones))
 
         #Skin weights.
         for bone in bones:
             out.write("\nSkinWeights {\n\"%s\";\n" % ValidateName(bone.name))
-            out.write(GetWeightData(data, bone))
+            out.writelines(GetWeightData(skintable, bone))
             out.write("}\n")
         
     #Mesh header end.
@@ -353,11 +446,13 @@ def WriteFrames(bone, mesh, armature):
     
 def WriteAnimations(armature, action):
     #Write animation keys.
-    result = []
     action.setActive(armature)
     data = armature.getData()
     ipos = action.getAllChannelIpos()
+    frames = action.getFrameNumbers()
 
+    #Find the bones that have animation in this action.
+    bones = []
     for bone in data.bones.values():
         try:
             channel = ipos[bone.name]   
@@ -365,36 +460,33 @@ def WriteAnimations(armature, action):
             #Skip, no animation.
             continue
 
-        if channel is not None:
-            #print "Exporting animation '%s'..." % channel.name
-            ipobone = Blender.Ipo.Get(channel.name)
-            frames = action.getFrameNumbers()
-            if frames and ipobone:
-                #Bone has animation.
-                result.append("\nAnimation {\n") 
-                result.append("  AnimationKey {\n    %i;\n    %i;\n" % (4, len(frames))) 
-         
-                for i, frame in enumerate(frames):
-                    Blender.Set('curframe', frame)
-
-                    info = "    %i;16;" + (15 * "%f,") + "%f;;"
-                    m = CombineAnimationMatrices(armature, bone) 
-
-                    result.append(info % (frame,
-                        m[0][0], m[0][1], m[0][2], m[0][3],
-                        m[1][0], m[1][1], m[1][2], m[1][3],
-                        m[2][0], m[2][1], m[2][2], m[2][3],
-                        m[3][0], m[3][1], m[3][2], m[3][3],        
-                    ))    
-                    if i == len(frames) - 1:
-                        result.append(";\n")
-                    else:
-                        result.append(",\n") 
-                     
-                result.append("  }\n  { %s }\n}\n" %  ValidateName(bone.name))
+        if channel is not None and Blender.Ipo.Get(channel.name):
+            bones.append(bone)
+
+    if not frames or not bones:
+        Blender.Set('curframe', 0)
+        return
 
+    #Sample frame-major so that the scene is evaluated only
+    #once per frame, keys[i] holds the matrices of bones[i].
+    keys = [[] for bone in bones]
+    for frame in frames:
+        Blender.Set('curframe', frame)
+        pose = armature.getPose()
+        inverses = {}
+        for i, bone in enumerate(bones):
+            m = CombineAnimationMatrices(armature, bone, pose, inverses)
+            keys[i].append(GetMatrixValues(m))
     Blender.Set('curframe', 0)     
-    out.write("".join(result))
+
+    info = "    %i;16;" + (15 * "%f,") + "%f;;"
+    for bone, values in zip(bones, keys):
+        #print "Exporting animation '%s'..." % bone.name
+        out.write("\nAnimation {\n") 
+        out.write("  AnimationKey {\n    %i;\n    %i;\n" % (4, len(frames))) 
+        out.writelines(JoinChunks((info % ((frame,) + m)
+            for frame, m in zip(frames, values))))
+        out.write("  }\n  { %s }\n}\n" %  ValidateName(bone.name))
     
 def WriteAnimatedMesh(mesh, armature):
     print "Exporting mesh '%s' with armature '%s'..." % (mesh.getName(), armature.getName())
@@ -445,20 +537,35 @@ def WriteAnimatedMesh(mesh, armature):
         WriteAnimations(armature, action)
         out.write("}\n")
      
-def CombineAnimationMatrices(armature, bone):
-    pose = armature.getPose()
+def CombineAnimationMatrices(armature, bone, pose=None, inverses=None):
+    """Returns the pose matrix of the bone relative to its parent.
+       When sampling many bones of the same frame, pass the pose and
+       a dictionary that caches the parent inverses of that frame."""
+    if pose is None:
+        pose = armature.getPose()
     posebone = pose.bones[bone.name]
     matrixbone = posebone.poseMatrix
-    if bone.hasParent():
-        parent = bone.parent
-        matrix = pose.bones[parent.name].poseMatrix
-    else:
-        matrix = Mathutils.Matrix([1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1])
+    if not bone.hasParent():
+        return matrixbone
 
-    result = Mathutils.Matrix(matrix)
-    result.invert()
+    parentname = bone.parent.name
+    result = None
+    if inverses is not None:
+        result = inverses.get(parentname)
+    if result is None:
+        result = Mathutils.Matrix(pose.bones[parentname].poseMatrix)
+        result.invert()
+        if inverses is not None:
+            inverses[parentname] = result
  
     return matrixbone * result
+
+def GetMatrixValues(m):
+    """Returns the 16 values of a 4x4 matrix as a flat tuple."""
+    return (m[0][0], m[0][1], m[0][2], m[0][3],
+            m[1][0], m[1][1], m[1][2], m[1][3],
+            m[2][0], m[2][1], m[2][2], m[2][3],
+            m[3][0], m[3][1], m[3][2], m[3][3])
       
 def GetRootBone(armature):
     #Returns the root bone of an armature object.
@@ -477,37 +584,42 @@ def StartExport(filename):
     global out
     out = XFile(filename)
     
-    scene = Blender.Scene.GetCurrent()
-    
-    if ExportType == 0:
-        #Export all.
-        for obj in scene.getChildren():
-            if obj.getType() == "Mesh":
-                WriteMesh(obj)
-    elif ExportType == 1:
-        #Export selected.
-        for obj in scene.getChildren():
-            if obj.sel:
-                WriteMesh(obj)
-    elif ExportType == 2:
-        #Export animated.
-        mesh = None
-        armature = None
-        count = 0
-        for obj in scene.getChildren():
-            if obj.sel and obj.getType() == "Armature":
-                armature = obj
-                count += 1
-            elif obj.sel and obj.getType() == "Mesh":
-                mesh = obj
-                count += 1
-
-        if count != 2:
-            PrintError("Invalid amount of objects selected")
+    try:
+        scene = Blender.Scene.GetCurrent()
+    
+        if ExportType == 0:
+            #Export all.
+            for obj in scene.getChildren():
+                if obj.getType() == "Mesh":
+                    WriteMesh(obj)
+        elif ExportType == 1:
+            #Export selected.
+            for obj in scene.getChildren():
+                if obj.sel:
+                    WriteMesh(obj)
+        elif ExportType == 2:
+            #Export animated.
+            mesh = None
+            armature = None
+            count = 0
+            for obj in scene.getChildren():
+                if obj.sel and obj.getType() == "Armature":
+                    armature = obj
+                    count += 1
+                elif obj.sel and obj.getType() == "Mesh":
+                    mesh = obj
+                    count += 1
+
+            if count != 2:
+                PrintError("Invalid amount of objects selected")
                 
-        WriteAnimatedMesh(mesh, armature)
-    else:
-        assert 0
+            WriteAnimatedMesh(mesh, armature)
+        else:
+            assert 0
+    except:
+        #Never leave a partial file behind.
+        out.abort()
+        raise
       
     out.close()
     print "Finished!\n" 
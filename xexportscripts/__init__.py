@@ -35,6 +35,8 @@ bl_info = {
 import bpy
 from bpy.props import BoolProperty
 from bpy.props import EnumProperty
+from bpy.props import FloatProperty
+from bpy.props import IntProperty
 from bpy.props import StringProperty
 
 
@@ -78,6 +80,39 @@ class ExportDirectX(bpy.types.Operator):
         description="Export material properties and reference image textures",
         default=True)
 
+    SortFacesByMaterial = BoolProperty(
+        name="        Sort Faces by Material",
+        description="Order faces and vertices by material and record the "\
+            "range of each material, so each can be drawn with one call",
+        default=False)
+
+    ConvertTextures = BoolProperty(
+        name="        Convert Textures to DDS",
+        description="Write material textures as DXT compressed .dds files "\
+            "with mipmaps next to the exported file.  Unchanged textures "\
+            "are not converted again",
+        default=False)
+    TextureFormat = EnumProperty(
+        name="            DDS Format",
+        description="Compression of the converted textures",
+        items=(('AUTO', "Automatic", "DXT1, or DXT5 for textures with "\
+                "transparency"),
+            ('DXT1', "DXT1", "Opaque textures, 4 bits per pixel"),
+            ('DXT5', "DXT5", "Textures with alpha, 8 bits per pixel")),
+        default='AUTO')
+    MaxTextureSize = IntProperty(
+        name="            Max Texture Size",
+        description="Textures are scaled to powers of two no larger than "\
+            "this",
+        default=1024, min=1, max=8192)
+    AtlasMode = EnumProperty(
+        name="        Texture Atlas",
+        description="Pack the textures of each mesh, or of all meshes, into "\
+            "one atlas and merge materials that only differ in their texture",
+        items=(('NONE', "None", "Keep one texture per material"),
+            ('MESH', "Per Mesh", "One atlas per mesh"),
+            ('SCENE', "Per Scene", "One atlas for all exported meshes")),
+        default='NONE')
     ExportVertexColors = BoolProperty(
         name="    Export Vertex Colors",
         description="Export mesh vertex colors, if any",
@@ -87,12 +122,70 @@ class ExportDirectX(bpy.types.Operator):
         name="    Export Skin Weights",
         description="Bind mesh vertices to armature bones",
         default=False)
+
+    MaxBonesPerMesh = IntProperty(
+        name="        Max Bones per Mesh",
+        description="Split skinned meshes into parts that each use at most "\
+            "this many bones, with their own bone palette.  0 keeps meshes "\
+            "whole",
+        default=0, min=0, max=255)
+
+    ExportShapeKeys = BoolProperty(
+        name="    Export Shape Keys",
+        description="Export shape keys as morph targets holding only the "\
+            "vertices they move, and their weights as animation",
+        default=False)
+
+    ShapeKeyThreshold = FloatProperty(
+        name="        Offset Threshold",
+        description="Vertices a shape key moves less than this are left "\
+            "out of its morph target",
+        default=0.0001, min=0.0, precision=6)
+
+    BakeVertexAnimation = BoolProperty(
+        name="    Bake Vertex Animation Textures",
+        description="Sample meshes deformed by an armature at every frame "\
+            "of every action into position and normal textures, and export "\
+            "them unskinned with texture coordinates into those textures",
+        default=False)
+
+    VertexAnimationFormat = EnumProperty(
+        name="        Texture Format",
+        description="Precision of the vertex animation textures",
+        items=(('FLOAT', "32 Bit Float", "Exact positions and normals"),
+            ('HALF', "16 Bit Float", "Half the size, about three decimal "\
+                "digits")),
+        default='FLOAT')
     
     ApplyModifiers = BoolProperty(
         name="    Apply Modifiers",
         description="Apply the effects of object modifiers before export",
         default=False)
     
+    MergeStatic = BoolProperty(
+        name="    Merge Static Meshes",
+        description="Combine the meshes of objects that do not move into "\
+            "one mesh per material, with their transforms applied",
+        default=False)
+
+    MergeKeep = StringProperty(
+        name="        Keep Separate",
+        description="Comma separated names of objects that stay separate "\
+            "frames when merging.  * and ? match any characters",
+        default="")
+
+    ExportInstances = BoolProperty(
+        name="Export Instances",
+        description="Export the meshes placed by particle systems and dupli "\
+            "groups once each, with a table of instance transforms",
+        default=False)
+
+    InstanceColors = BoolProperty(
+        name="    Instance Colors",
+        description="Add the object color of each instanced mesh to its "\
+            "instance table",
+        default=False)
+
     ExportArmatureBones = BoolProperty(
         name="Export Armature Bones",
         description="Export armatures bones",
@@ -129,6 +222,122 @@ class ExportDirectX(bpy.types.Operator):
             "armature object",
         default=False)
 
+    BakeProcesses = IntProperty(
+        name="            Bake Processes",
+        description="Sample unused actions in this many background Blender "\
+            "processes.  Requires the .blend file to be saved",
+        default=1, min=1, max=64)
+
+    OutputFormat = EnumProperty(
+        name="Format",
+        description="File format to write",
+        items=(('X', "DirectX (.x)", "DirectX text format"),
+            ('XNB', "XNA Model (.xnb)", "Compiled XNA Game Studio 4.0 "\
+                "Model that loads without a content pipeline build")),
+        default='X')
+    SplitMode = EnumProperty(
+        name="Split Files",
+        description="Write one file per root object or per group of root "\
+            "objects, plus a manifest of what went where",
+        items=(('NONE', "Single File", "Write everything into one file"),
+            ('OBJECT', "Per Root Object", "One file per root object"),
+            ('GROUP', "Per Group", "One file per group of root objects")),
+        default='NONE')
+
+    SharedMaterials = BoolProperty(
+        name="    Shared Materials File",
+        description="Write the materials once into a separate file and "\
+            "refer to them by name from the split files",
+        default=False)
+
+    SharedAnimations = BoolProperty(
+        name="    Shared Animations File",
+        description="Write all animation sets into a separate file instead "\
+            "of with the frames they animate",
+        default=False)
+
+    CompactOutput = BoolProperty(
+        name="Compact Output",
+        description="Write the file without indentation or comments and "\
+            "trim trailing zeros from numbers",
+        default=False)
+
+    PositionPrecision = IntProperty(
+        name="    Position Decimals",
+        description="Decimal places written for vertex positions",
+        default=6, min=0, max=9)
+
+    NormalPrecision = IntProperty(
+        name="    Normal Decimals",
+        description="Decimal places written for normals",
+        default=6, min=0, max=9)
+
+    UVPrecision = IntProperty(
+        name="    UV Decimals",
+        description="Decimal places written for UV coordinates",
+        default=6, min=0, max=9)
+
+    WeightPrecision = IntProperty(
+        name="    Weight Decimals",
+        description="Decimal places written for skin weights",
+        default=6, min=0, max=9)
+
+    KeyPrecision = IntProperty(
+        name="    Animation Key Decimals",
+        description="Decimal places written for animation keys",
+        default=6, min=0, max=9)
+
+    ChunkedMeshes = BoolProperty(
+        name="Low Memory Mesh Export",
+        description="Expand vertex, normal, UV and color data in small "\
+            "windows while writing instead of all at once.  Use for very "\
+            "large meshes.  Sorting faces, merging, bone partitioning, "\
+            "atlases and XNA output still load whole meshes",
+        default=False)
+
+    ExportSnapshot = BoolProperty(
+        name="Save Scene Snapshot",
+        description="Also save the gathered scene next to the .x file so it "\
+            "can be written again without Blender (see x_snapshot.py)",
+        default=False)
+
+    ExportBounds = BoolProperty(
+        name="Save Bounding Volumes",
+        description="Also save boxes and spheres around every mesh, frame, "\
+            "bone and animation set next to the exported file",
+        default=False)
+    ExportCollision = BoolProperty(
+        name="Save Collision Hulls",
+        description="Also save simplified convex hulls of mesh objects for "\
+            "physics and hit tests next to the exported file",
+        default=False)
+    CollisionObjects = StringProperty(
+        name="    Objects",
+        description="Comma separated names of the objects that get hulls.  "\
+            "* and ? match any characters.  Empty for all mesh objects",
+        default="")
+    CollisionHulls = IntProperty(
+        name="    Max Hulls per Object",
+        description="Split objects that are not convex into up to this many "\
+            "convex hulls",
+        default=1, min=1, max=64)
+    CollisionVertices = IntProperty(
+        name="    Max Vertices per Hull",
+        description="Most vertices a hull may have.  Smaller features are "\
+            "left out first",
+        default=32, min=4, max=1024)
+    ExportInBackground = BoolProperty(
+        name="Export in Background",
+        description="Write the file on a separate thread so Blender stays "\
+            "responsive.  Press Esc to cancel",
+        default=False)
+
+    WatchScene = BoolProperty(
+        name="Watch Scene",
+        description="Keep exporting changed objects in the background while "\
+            "the scene is edited, until stopped from the export menu",
+        default=False)
+
     Verbose = BoolProperty(
         name="Verbose",
         description="Run the exporter in debug mode. Check the console for "\
@@ -136,13 +345,78 @@ class ExportDirectX(bpy.types.Operator):
         default=False)
 
     def execute(self, context):
-        self.filepath = bpy.path.ensure_ext(self.filepath, ".x")
+        Extension = ".x"
+        if self.OutputFormat == 'XNB':
+            Extension = ".xnb"
+        self.filepath = bpy.path.ensure_ext(self.filepath, Extension)
+
+        if self.WatchScene:
+            # The watcher exports right away and again after each change
+            from . import x_watch
+            x_watch.Start(self.as_keywords(), context.scene)
+            return {'FINISHED'}
 
         from . import export_x
-        Exporter = export_x.DirectXExporter(self, context)
-        Exporter.Export()
+        # Split exports are written concurrently, but not in the background
+        if not self.ExportInBackground or self.SplitMode != 'NONE':
+            export_x.DirectXExporter(export_x.ExportConfig(
+                self.as_keywords()), context).Export()
+            return {'FINISHED'}
+
+        # Gathers the scene now, then formats and writes it on a worker
+        # thread while modal() reports progress.  The worker only reads a
+        # copy of the properties.
+        Exporter = export_x.DirectXExporter(export_x.ExportConfig(
+            self.as_keywords()), context)
+        self.Job = export_x.BackgroundExport(Exporter)
+        self.Job.Start()
+
+        WindowManager = context.window_manager
+        self.Timer = WindowManager.event_timer_add(0.1, context.window)
+        WindowManager.progress_begin(0, 100)
+        WindowManager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.Job.Cancel()
+            return {'RUNNING_MODAL'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if self.Job.IsRunning():
+            context.window_manager.progress_update(
+                int(self.Job.GetProgress() * 100))
+            Status = "DirectX export: {:.0%}".format(self.Job.GetProgress())
+            RemainingTime = self.Job.GetRemainingTime()
+            if RemainingTime is not None:
+                Status += ", {:.0f}s left".format(RemainingTime)
+            if context.area is not None:
+                context.area.header_text_set(Status + " (Esc to cancel)")
+            return {'RUNNING_MODAL'}
+
+        self.__Finish(context)
+        if self.Job.Error is not None:
+            self.report({'ERROR'}, "DirectX export failed: {}".format(
+                self.Job.Error))
+            return {'CANCELLED'}
+        if self.Job.IsCancelled():
+            self.report({'WARNING'}, "DirectX export cancelled")
+            return {'CANCELLED'}
         return {'FINISHED'}
 
+    def cancel(self, context):
+        self.Job.Cancel()
+        self.Job.Wait()
+        self.__Finish(context)
+
+    def __Finish(self, context):
+        WindowManager = context.window_manager
+        WindowManager.event_timer_remove(self.Timer)
+        WindowManager.progress_end()
+        if context.area is not None:
+            context.area.header_text_set()
+
     def invoke(self, context, event):
         if not self.filepath:
             self.filepath = bpy.path.ensure_ext(bpy.data.filepath, ".x")
@@ -150,9 +424,26 @@ class ExportDirectX(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
 
+class StopWatchingDirectX(bpy.types.Operator):
+    """Stop re-exporting the scene on changes"""
+
+    bl_idname = "export_scene.x_stop_watching"
+    bl_label = "Stop Watching DirectX Export"
+
+    def execute(self, context):
+        from . import x_watch
+        x_watch.Stop()
+        return {'FINISHED'}
+
+
 def menu_func(self, context):
     self.layout.operator(ExportDirectX.bl_idname, text="DirectX (.x)")
 
+    from . import x_watch
+    if x_watch.IsWatching():
+        self.layout.operator(StopWatchingDirectX.bl_idname,
+            text="DirectX (.x) - Stop Watching")
+
 
 def register():
     bpy.utils.register_module(__name__)
@@ -161,6 +452,10 @@ def register():
 
 
 def unregister():
+    # Scene handlers would otherwise outlive the add-on
+    from . import x_watch
+    x_watch.Stop()
+
     bpy.utils.unregister_module(__name__)
 
     bpy.types.INFO_MT_file_export.remove(menu_func)
@@ -18,11 +18,32 @@
 
 # <pep8 compliant>
 
+import fnmatch
+import os
+import threading
+import time
 from math import radians
 
+import numpy
+
 import bpy
 from mathutils import *
 
+from . import x_atlas
+from . import x_bake
+from . import x_bounds
+from . import x_file
+from . import x_hull
+from . import x_merge
+from . import x_palette
+from . import x_scene
+from . import x_snapshot
+from . import x_split
+from . import x_texture
+from . import x_vat
+from . import x_writer
+from . import x_xnb
+
 
 class DirectXExporter:
     def __init__(self, Config, context):
@@ -31,7 +52,36 @@ class DirectXExporter:
 
         self.Log("Begin verbose logging ----------\n")
 
-        self.File = File(self.Config.filepath)
+        self.FilePath = self.Config.filepath
+
+        # XNA Models are binary and need no text options
+        self.Binary = self.Config.OutputFormat == 'XNB'
+        self.Extension = ".x"
+        self.FileMode = 'w'
+        if self.Binary:
+            self.Extension = ".xnb"
+            self.FileMode = 'wb'
+
+        # These rebuild the vertex data of every mesh, which expands the
+        # windowed arrays of ChunkedMeshes into full copies again
+        if self.Config.ChunkedMeshes:
+            Options = [Name for Name, Enabled in (
+                ("Sort Faces by Material", self.Config.SortFacesByMaterial),
+                ("Merge Static Meshes", self.Config.MergeStatic),
+                ("Max Bones per Mesh", self.Config.ExportSkinWeights and
+                    self.Config.MaxBonesPerMesh),
+                ("Texture Atlas", self.Config.AtlasMode != 'NONE'),
+                ("XNA Model output", self.Binary)) if Enabled]
+            if Options:
+                self.Log("Warning: Low Memory Mesh Export saves little "\
+                    "memory with {}, which load whole meshes".format(
+                    ", ".join(Options)), MessageVerbose=False)
+
+        if self.Binary and self.Config.ExportMaterials and \
+            not self.Config.ConvertTextures:
+            self.Log("Warning: XNA Models only reference textures converted "\
+                "to .dds, enable Convert Textures to DDS",
+                MessageVerbose=False)
 
         self.Log("Setting up coordinate system...")
         # SystemMatrix converts from right-handed, z-up to left-handed, y-up
@@ -39,6 +89,18 @@ class DirectXExporter:
             Matrix.Rotation(radians(-90), 4, 'X'))
         self.Log("Done")
 
+        # Converts material textures to .dds files next to the output file
+        self.TextureCache = None
+        if self.Config.ExportMaterials and self.Config.ConvertTextures:
+            self.TextureCache = x_texture.TextureCache(
+                os.path.dirname(os.path.abspath(self.FilePath)),
+                self.Config.MaxTextureSize, self.Config.TextureFormat)
+        # Maps the TextureFilename of gathered materials to their image
+        self.TextureImages = {}
+        self.__ConvertedTextures = {}
+        # Maps mesh names to their x_vat.VertexAnimation
+        self.VertexAnimations = {}
+
         self.Log("Generating object lists for export...")
         if self.Config.SelectedOnly:
             ExportList = list(self.context.selected_objects)
@@ -93,39 +155,252 @@ class DirectXExporter:
     # "Public" Interface
 
     def Export(self):
-        self.Log("Exporting to {}".format(self.File.FilePath),
+        self.Log("Exporting to {}".format(self.FilePath),
             MessageVerbose=False)
 
-        # Export everything
-        self.Log("Opening file...")
-        self.File.Open()
+        Scene = self.GatherScene()
+
+        self.ExportSidecars(Scene)
+
+        if self.Config.SplitMode != 'NONE':
+            self.ExportSplit(Scene)
+            return
+
+        self.Log("Writing file...")
+        x_file.Save(self.FilePath, lambda File: self.GetWriter(File).Write(
+            Scene), self.FileMode)
         self.Log("Done")
 
-        self.Log("Writing header...")
-        self.__WriteHeader()
+    # Writes the optional files that accompany the export
+    def ExportSidecars(self, Scene):
+        if self.Binary and self.Config.ExportMaterials:
+            self.ExportTextures(Scene)
+        if self.Config.ExportSnapshot:
+            self.ExportSnapshot(Scene)
+        if self.Config.ExportBounds:
+            self.ExportBounds(Scene)
+        if self.Config.BakeVertexAnimation:
+            self.ExportVertexAnimations(Scene)
+        if self.Config.ExportCollision:
+            self.ExportCollision(Scene)
+
+    # Saves the .dds textures of the gathered scene as XNA Texture2D assets
+    # beside the .xnb file, e.g. "wood.dds" -> "wood.xnb"
+    def ExportTextures(self, Scene):
+        Directory = os.path.dirname(os.path.abspath(self.FilePath))
+        self.Log("Saving XNA textures to {}...".format(Directory))
+        Paths = x_xnb.SaveTextures(Scene, Directory,
+            Reserved=[self.FilePath])
+        self.Log("Done, {} texture(s)".format(len(Paths)))
+        return Paths
+
+    # Saves the bounding volumes of the gathered scene beside the .x file,
+    # e.g. "model.x" -> "model.bounds.json"
+    def ExportBounds(self, Scene):
+        BoundsPath = os.path.splitext(self.FilePath)[0] + ".bounds.json"
+        self.Log("Saving bounds to {}...".format(BoundsPath))
+        x_bounds.Save(Scene, BoundsPath)
+        self.Log("Done")
+        return BoundsPath
+
+    # Saves the vertex animation textures of the meshes in the gathered
+    # scene and their index beside the .x file, e.g. "model.x" ->
+    # "model.vat.json" and "model_Body.positions.dds"
+    def ExportVertexAnimations(self, Scene):
+        Names = set(Mesh.Name for Mesh in Scene.IterMeshes())
+        Animations = [self.VertexAnimations[Name]
+            for Name in sorted(self.VertexAnimations) if Name in Names]
+        if not Animations:
+            return None
+
+        IndexPath = os.path.splitext(self.FilePath)[0] + ".vat.json"
+        self.Log("Saving vertex animation textures to {}...".format(
+            IndexPath))
+        x_vat.Save(Animations, IndexPath, self.Config.VertexAnimationFormat)
+        self.Log("Done")
+        return IndexPath
+
+    # Saves the collision hulls of the gathered scene beside the .x file,
+    # e.g. "model.x" -> "model.collision.json"
+    def ExportCollision(self, Scene):
+        CollisionPath = os.path.splitext(self.FilePath)[0] + ".collision.json"
+        self.Log("Saving collision hulls to {}...".format(CollisionPath))
+        x_hull.Save(Scene, CollisionPath)
         self.Log("Done")
+        return CollisionPath
 
-        self.Log("Opening Root frame...")
-        self.__OpenRootFrame()
+    # Saves the gathered scene beside the .x file, e.g. "model.x" ->
+    # "model.xsnap"
+    def ExportSnapshot(self, Scene=None):
+        if Scene is None:
+            Scene = self.GatherScene()
+
+        SnapshotPath = os.path.splitext(self.FilePath)[0] + ".xsnap"
+        self.Log("Saving snapshot to {}...".format(SnapshotPath))
+        x_snapshot.Save(Scene, SnapshotPath)
+        self.Log("Done")
+        return SnapshotPath
+
+    # Writes one file per root object or group of root objects next to
+    # FilePath, e.g. "level.x" -> "level_Crate.x", plus "level.materials.x"
+    # and "level.animations.x" if those are shared, and the manifest
+    # "level.manifest.json".  XNA Models hold no shared materials or
+    # animations, so those files are skipped for .xnb output.  If
+    # ChangedObjects is given, only the parts holding one of the root
+    # ExportObjects in it are written again.  SplitNames are the part names
+    # from GetSplitNames, which reads Blender data, so they have to be
+    # passed in when this runs off the main thread.
+    def ExportSplit(self, Scene, ChangedObjects=None, SplitNames=None):
+        Base = os.path.splitext(self.FilePath)[0]
+        if SplitNames is None:
+            SplitNames = self.GetSplitNames()
+
+        # GatherScene adds one frame to Root per root object, in order
+        Root = Scene.Frames[0]
+        Groups = []
+        GroupFrames = {}
+        ChangedNames = set(["animations", "materials"])
+        for Object, Name, Frame in zip(self.RootExportList, SplitNames,
+            Root.Children):
+            if Name not in GroupFrames:
+                GroupFrames[Name] = []
+                Groups.append((Name, GroupFrames[Name]))
+            GroupFrames[Name].append(Frame)
+            if ChangedObjects is None or Object in ChangedObjects:
+                ChangedNames.add(Name)
+
+        Files = []
+        if self.Config.SharedAnimations and Scene.AnimationSets and \
+            not self.Binary:
+            Files.append(x_split.SplitFile("animations",
+                Base + ".animations.x", x_split.TakeAnimations(Scene)))
+
+        Parts = x_split.SplitScene(Scene, Root, Groups)
+        for Name, Part in Parts:
+            Files.append(x_split.SplitFile(Name,
+                "{}_{}{}".format(Base, Name, self.Extension), Part,
+                self.Config.SharedMaterials and not self.Binary))
+
+        if self.Config.SharedMaterials and not self.Binary:
+            Files.append(x_split.SplitFile("materials",
+                Base + ".materials.x",
+                x_split.GatherMaterials(Part for Name, Part in Parts)))
+
+        self.Log("Writing {} files...".format(len(Files)))
+        x_split.WriteFiles(Files, lambda File, Split: self.GetWriter(File,
+            MaterialReferences=Split.MaterialReferences),
+            Base + ".manifest.json", Names=ChangedNames, Mode=self.FileMode)
         self.Log("Done")
 
-        self.Log("Writing objects...")
+    # Returns the name of the part of a split export holding each root
+    # object: its group's with SplitMode 'GROUP', otherwise its own
+    def GetSplitNames(self):
+        Names = []
         for Object in self.RootExportList:
-            Object.Write()
-        self.Log("Done writing objects")
+            Name = Object.SafeName
+            if self.Config.SplitMode == 'GROUP' and \
+                Object.BlenderObject.users_group:
+                Name = Util.SafeName(Object.BlenderObject.users_group[0].name)
+            Names.append(Name)
+        return Names
+
+    # Returns an x_writer.XWriter set up with the output options, or an
+    # x_xnb.XnbWriter
+    def GetWriter(self, File, Progress=None, MaterialReferences=False):
+        return self.GetWriterFactory(MaterialReferences)(File, Progress)
+
+    # Returns a function creating the writer for a file from File and
+    # Progress.  The options are read now, so the function may be called on
+    # any thread.
+    def GetWriterFactory(self, MaterialReferences=False):
+        if self.Binary:
+            return lambda File, Progress=None: x_xnb.XnbWriter(File, Progress)
+
+        Compact = self.Config.CompactOutput
+        Precision = {
+            "Positions" : self.Config.PositionPrecision,
+            "Normals" : self.Config.NormalPrecision,
+            "TextureCoords" : self.Config.UVPrecision,
+            "Weights" : self.Config.WeightPrecision,
+            "Keys" : self.Config.KeyPrecision}
+        return lambda File, Progress=None: x_writer.XWriter(File, Progress,
+            Compact, Precision, MaterialReferences)
+
+    # Number of rows the writer from GetWriter reports progress for
+    def CountRows(self, Scene):
+        if self.Binary:
+            return x_xnb.CountRows(Scene)
+        return x_writer.CountRows(Scene)
+
+    # Collects everything to export into an x_scene.Scene.  RootFrames, if
+    # given, are the frames of RootExportList gathered earlier, see
+    # GatherRootFrames.
+    def GatherScene(self, RootFrames=None):
+        Scene = x_scene.Scene()
 
-        self.Log("Closing Root frame...")
-        self.__CloseRootFrame()
+        self.Log("Opening Root frame...")
+        # The Root frame's matrix converts Blender's coordinate space into
+        # DirectX's.
+        Root = x_scene.Frame("Root", Util.ConvertMatrix(self.SystemMatrix))
+        Scene.Frames.append(Root)
         self.Log("Done")
+
+        if RootFrames is None:
+            RootFrames = self.GatherRootFrames(self.RootExportList)
+        Root.Children = list(RootFrames)
         
         if self.AnimationWriter is not None:
             self.Log("Writing animation set(s)...")
-            self.AnimationWriter.WriteAnimationSets()
+            self.AnimationWriter.WriteAnimationSets(Scene)
             self.Log("Done writing animation set(s)")
 
-        self.Log("Closing file...")
-        self.File.Close()
-        self.Log("Done")
+        # Split files hold root objects, so merge within each of them
+        if self.Config.MergeStatic:
+            self.Log("Merging static meshes...")
+            x_merge.MergeStatic(Scene, self.__GetKeptFrames(),
+                self.Config.SplitMode != 'NONE')
+            self.Log("Done")
+
+        # Last, as the stages above may change faces and materials
+        if self.Config.SortFacesByMaterial:
+            self.Log("Sorting faces by material...")
+            for Mesh in Scene.IterMeshes():
+                Mesh.SortFacesByMaterial()
+            self.Log("Done")
+
+        return Scene
+
+    # Returns the frame of each of the root ExportObjects in Objects
+    def GatherRootFrames(self, Objects):
+        self.Log("Writing objects...")
+        Root = x_scene.Frame("Root")
+        for Object in Objects:
+            Object.Write(Root)
+        self.Log("Done writing objects")
+
+        self.__ProcessTextures(Root.Children)
+        return Root.Children
+
+    # Returns the file name of Image converted to .dds through the texture
+    # cache, or None if the image cannot be loaded
+    def ConvertTexture(self, Image):
+        if Image.name in self.__ConvertedTextures:
+            return self.__ConvertedTextures[Image.name]
+
+        FileName = None
+        if Image.size[0] and Image.size[1]:
+            self.Log("Converting texture {}...".format(Image.name))
+            FileName = self.TextureCache.Convert(os.path.splitext(
+                bpy.path.basename(Image.filepath))[0] or
+                Util.SafeName(Image.name), bpy.path.abspath(Image.filepath),
+                lambda: Util.GetImagePixels(Image))
+            self.Log("Done")
+        else:
+            self.Log("Texture {} could not be loaded, not converting "
+                "it".format(Image.name), MessageVerbose=False)
+
+        self.__ConvertedTextures[Image.name] = FileName
+        return FileName
 
     def Log(self, String, MessageVerbose=True):
         if self.Config.Verbose is True or MessageVerbose == False:
@@ -133,50 +408,14 @@ class DirectXExporter:
 
     # "Private" Methods
 
-    def __WriteHeader(self):
-        self.File.Write("xof 0303txt 0032\n\n")
-
-        # Write the headers that are required by some engines as needed
-
-        if self.Config.IncludeFrameRate:
-            self.File.Write("template AnimTicksPerSecond {\n\
-  <9E415A43-7BA6-4a73-8743-B73D47E88476>\n\
-  DWORD AnimTicksPerSecond;\n\
-}\n\n")
-        if self.Config.ExportSkinWeights:
-            self.File.Write("template XSkinMeshHeader {\n\
-  <3cf169ce-ff7c-44ab-93c0-f78f62d172e2>\n\
-  WORD nMaxSkinWeightsPerVertex;\n\
-  WORD nMaxSkinWeightsPerFace;\n\
-  WORD nBones;\n\
-}\n\n\
-template SkinWeights {\n\
-  <6f0d123b-bad2-4167-a0d0-80224f25fabb>\n\
-  STRING transformNodeName;\n\
-  DWORD nWeights;\n\
-  array DWORD vertexIndices[nWeights];\n\
-  array float weights[nWeights];\n\
-  Matrix4x4 matrixOffset;\n\
-}\n\n")
-
-    # Start the Root frame and write its transform matrix
-    def __OpenRootFrame(self):
-        self.File.Write("Frame Root {\n")
-        self.File.Indent()
-
-        self.File.Write("FrameTransformMatrix {\n")
-        self.File.Indent()
-        
-        # Write the matrix that will convert Blender's coordinate space into
-        # DirectX's.
-        Util.WriteMatrix(self.File, self.SystemMatrix)
-        
-        self.File.Unindent()
-        self.File.Write("}\n")
-
-    def __CloseRootFrame(self):
-        self.File.Unindent()
-        self.File.Write("} // End of Root\n")
+    # Names of the frames of the objects matching MergeKeep, a comma
+    # separated list of object names that may contain wildcards
+    def __GetKeptFrames(self):
+        Patterns = [Pattern.strip() for Pattern in
+            self.Config.MergeKeep.split(",") if Pattern.strip()]
+        return set(Object.SafeName for Object in self.ExportList
+            if any(fnmatch.fnmatchcase(Object.BlenderObject.name, Pattern)
+            for Pattern in Patterns))
     
     def __GatherAnimationGenerators(self):
         Generators = []
@@ -191,6 +430,10 @@ template SkinWeights {\n\
                 else:
                     Generators.append(GenericAnimationGenerator(self.Config,
                         None, Object))
+
+            for Object in self.__GetShapeKeyObjects():
+                Generators.append(ShapeKeyAnimationGenerator(self.Config,
+                    None, Object))
         # Otherwise,
         else:
             # Keep track of which objects have no action.  These will be
@@ -217,6 +460,14 @@ template SkinWeights {\n\
                         Util.SafeName(
                             Object.BlenderObject.animation_data.action.name),
                         Object))
+
+            # Shape key actions belong to the key rather than the object,
+            # so build a set for every action animating its key blocks
+            for Object in self.__GetShapeKeyObjects():
+                Key = Util.GetShapeKeys(Object.BlenderObject)
+                for Action in Util.GetShapeKeyActions(Key):
+                    Generators.append(ShapeKeyAnimationGenerator(self.Config,
+                        Util.SafeName(Action.name), Object, Action))
             
             # If we should export unused actions as if the first armature was
             # using them,
@@ -235,6 +486,9 @@ template SkinWeights {\n\
                         if BlenderObject.animation_data is not None]
                     FreeActions = [Action for Action in bpy.data.actions
                         if Action not in UsedActions]
+                    if self.Config.ExportShapeKeys:
+                        FreeActions = [Action for Action in FreeActions
+                            if Action.id_root != 'KEY']
                     
                     # If the first armature has no action, remove it from the
                     # actionless objects so it doesn't end up in Default_Action
@@ -252,14 +506,23 @@ template SkinWeights {\n\
                         NoData = True
                         FirstArmature.BlenderObject.animation_data_create()
                     
-                    # Build a generator for each unused action
-                    for Action in FreeActions:
-                        FirstArmature.BlenderObject.animation_data.action = \
-                            Action
-                        
-                        Generators.append(ArmatureAnimationGenerator(
-                            self.Config, Util.SafeName(Action.name),
-                            FirstArmature))
+                    # Build a generator for each unused action, sampling
+                    # them in worker processes if requested
+                    BakedGenerators = None
+                    if self.Config.BakeProcesses > 1 and len(FreeActions) > 1:
+                        BakedGenerators = self.__BakeActions(FirstArmature,
+                            FreeActions)
+
+                    if BakedGenerators is not None:
+                        Generators += BakedGenerators
+                    else:
+                        for Action in FreeActions:
+                            FirstArmature.BlenderObject.animation_data \
+                                .action = Action
+
+                            Generators.append(ArmatureAnimationGenerator(
+                                self.Config, Util.SafeName(Action.name),
+                                FirstArmature))
                     
                     # Restore old animation data
                     FirstArmature.BlenderObject.animation_data.action = \
@@ -275,7 +538,177 @@ template SkinWeights {\n\
 
         return Generators        
 
-# This class wraps a Blender object and writes its data to the file
+    # Objects whose shape key weights are exported.  The weights of absolute
+    # shape keys are not blend weights, so those are left out.
+    def __GetShapeKeyObjects(self):
+        if not self.Config.ExportShapeKeys or not self.Config.ExportMeshes:
+            return []
+        return [Object for Object in self.ExportList
+            if Util.GetShapeKeys(Object.BlenderObject) is not None and
+            Util.GetShapeKeys(Object.BlenderObject).use_relative]
+
+    # Packs texture atlases and converts textures as configured, for the
+    # meshes below Frames
+    def __ProcessTextures(self, Frames):
+        Meshes = [Mesh for Root in Frames for Frame in Root.IterFrames()
+            for Mesh in Frame.IterMeshes()]
+
+        if self.Config.AtlasMode == 'MESH':
+            for Mesh in Meshes:
+                self.__PackAtlas([Mesh], "{}_atlas".format(Mesh.Name))
+        elif self.Config.AtlasMode == 'SCENE':
+            self.__PackAtlas(Meshes, "{}_atlas".format(os.path.splitext(
+                os.path.basename(self.FilePath))[0]))
+
+        if self.TextureCache is not None:
+            for Mesh in Meshes:
+                for Material in Mesh.Materials:
+                    Image = self.TextureImages.get(Material.TextureFilename)
+                    if Image is None:
+                        continue
+                    FileName = self.ConvertTexture(Image)
+                    if FileName is not None:
+                        Material.TextureFilename = FileName
+
+    def __PackAtlas(self, Meshes, Name):
+        def LoadPixels(TextureFilename):
+            Image = self.TextureImages.get(TextureFilename)
+            if Image is None or not (Image.size[0] and Image.size[1]):
+                return None
+            return Util.GetImagePixels(Image)
+
+        Atlas = x_atlas.BuildAtlas(Meshes, Util.SafeName(Name), LoadPixels)
+        if Atlas is None:
+            return
+        self.Log("Packed {} textures into atlas {}".format(
+            len(Atlas.Regions), Atlas.Name))
+
+        if self.TextureCache is not None:
+            FileName = self.TextureCache.Convert(Atlas.Name, None,
+                lambda: Atlas.Pixels)
+        else:
+            FileName = Atlas.Name + ".png"
+            Path = os.path.join(os.path.dirname(os.path.abspath(
+                self.FilePath)), FileName)
+            x_file.Save(Path, lambda File: x_texture.WritePNG(File,
+                Atlas.Pixels))
+
+        for Material in Atlas.Materials:
+            Material.TextureFilename = FileName
+
+    # Samples Actions on ArmatureObject in background Blender processes that
+    # open the saved .blend file.  Returns None when that is not possible so
+    # the caller can sample them here instead.
+    def __BakeActions(self, ArmatureObject, Actions):
+        if not bpy.data.filepath or bpy.data.is_dirty:
+            self.Log("The .blend file has unsaved changes, sampling actions "
+                "in this process", MessageVerbose=False)
+            return None
+
+        self.Log("Sampling {} actions in {} processes...".format(
+            len(Actions), self.Config.BakeProcesses))
+        try:
+            Sets = x_bake.BakeActions(bpy.app.binary_path, bpy.data.filepath,
+                bpy.context.scene.name, ArmatureObject.BlenderObject.name,
+                [Action.name for Action in Actions], vars(self.Config),
+                self.Config.BakeProcesses)
+        except (x_bake.BakeError, OSError) as Error:
+            self.Log("{}\nSampling actions in this process".format(Error),
+                MessageVerbose=False)
+            return None
+        self.Log("Done")
+
+        return [BakedAnimationGenerator(self.Config, Set) for Set in Sets]
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+# Stands in for the export operator with a plain copy of its properties,
+# e.g. from as_keywords().  Unlike the operator, it can be read from worker
+# threads and outlives the operator.
+class ExportConfig:
+    def __init__(self, Options):
+        self.__dict__.update(Options)
+
+
+# Runs an export without blocking Blender.  Everything that needs bpy is
+# gathered into an x_scene.Scene on the calling (main) thread; formatting and
+# file I/O happen on a worker thread that can be cancelled.  The file is
+# written to a temporary path and only moved over FilePath on success.
+# Scene is gathered from Exporter unless it is given.
+class BackgroundExport:
+    def __init__(self, Exporter, Scene=None):
+        self.Exporter = Exporter
+        self.FilePath = Exporter.FilePath
+
+        if Scene is None:
+            Scene = Exporter.GatherScene()
+        self.Scene = Scene
+        self.TotalRows = max(1, Exporter.CountRows(self.Scene))
+        self.WrittenRows = 0
+
+        self.StartTime = None
+        self.Error = None
+
+        # Read on this (main) thread, the worker must not touch bpy
+        self.__CreateWriter = Exporter.GetWriterFactory()
+        self.__FileMode = Exporter.FileMode
+
+        self.__CancelEvent = threading.Event()
+        self.__Thread = threading.Thread(target=self.__Run)
+        self.__Thread.daemon = True
+
+    # "Public" Interface
+
+    def Start(self):
+        self.StartTime = time.time()
+        self.__Thread.start()
+
+    def Cancel(self):
+        self.__CancelEvent.set()
+
+    def IsCancelled(self):
+        return self.__CancelEvent.is_set()
+
+    def IsRunning(self):
+        return self.__Thread.is_alive()
+
+    def Wait(self):
+        self.__Thread.join()
+
+    # Fraction of rows written, 0 to 1
+    def GetProgress(self):
+        return min(1.0, float(self.WrittenRows) / self.TotalRows)
+
+    # Estimated seconds left, or None until there is something to go by
+    def GetRemainingTime(self):
+        Progress = self.GetProgress()
+        if self.StartTime is None or Progress <= 0.0:
+            return None
+        Elapsed = time.time() - self.StartTime
+        return Elapsed * (1.0 - Progress) / Progress
+
+    # "Private" Methods
+
+    def __Run(self):
+        try:
+            self.Exporter.ExportSidecars(self.Scene)
+            x_file.Save(self.FilePath, lambda File: self.__CreateWriter(File,
+                self.__Advance).Write(self.Scene), self.__FileMode)
+        except ExportCancelled:
+            self.Exporter.Log("Export cancelled", MessageVerbose=False)
+        except Exception as Error:
+            self.Error = Error
+
+    def __Advance(self, Rows):
+        if self.__CancelEvent.is_set():
+            raise ExportCancelled()
+        self.WrittenRows += Rows
+
+
+# This class wraps a Blender object and writes its data to the scene
 class ExportObject: # Base class, do not use
     def __init__(self, Config, Exporter, BlenderObject):
         self.Config = Config
@@ -291,35 +724,70 @@ class ExportObject: # Base class, do not use
 
     # "Public" Interface
 
-    def Write(self):
+    # Adds this object's frame to ParentFrame
+    def Write(self, ParentFrame):
         self.Exporter.Log("Opening frame for {}".format(self))
-        self._OpenFrame()
+        Frame = self._OpenFrame(ParentFrame)
+
+        self._WriteInstances(Frame)
 
         self.Exporter.Log("Writing children of {}".format(self))
-        self._WriteChildren()
+        self._WriteChildren(Frame)
 
-        self._CloseFrame()
         self.Exporter.Log("Closed frame of {}".format(self))
 
     # "Protected" Interface
 
-    def _OpenFrame(self):
-        self.Exporter.File.Write("Frame {} {{\n".format(self.SafeName))
-        self.Exporter.File.Indent()
-
-        self.Exporter.File.Write("FrameTransformMatrix {\n")
-        self.Exporter.File.Indent()
-        Util.WriteMatrix(self.Exporter.File, self.BlenderObject.matrix_local)
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}\n")
+    def _OpenFrame(self, ParentFrame):
+        Frame = x_scene.Frame(self.SafeName,
+            Util.ConvertMatrix(self.BlenderObject.matrix_local))
+        ParentFrame.Children.append(Frame)
+        return Frame
 
-    def _CloseFrame(self):
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}} // End of {}\n".format(self.SafeName))
-
-    def _WriteChildren(self):
+    def _WriteChildren(self, Frame):
         for Child in Util.SortByNameField(self.Children):
-            Child.Write()
+            Child.Write(Frame)
+
+    # Adds an x_scene.InstanceTable to Frame for each mesh object the
+    # object's particle systems or dupli group place copies of, with the
+    # copies' transforms relative to the object
+    def _WriteInstances(self, Frame):
+        if not self.Config.ExportInstances or \
+            not self.BlenderObject.is_duplicator:
+            return
+
+        self.Exporter.Log("Gathering instances of {}...".format(self))
+        InverseWorld = self.BlenderObject.matrix_world.inverted()
+        Prototypes = []
+        Transforms = {}
+        self.BlenderObject.dupli_list_create(self.Exporter.context.scene)
+        try:
+            for Dupli in self.BlenderObject.dupli_list:
+                if Dupli.object.type != 'MESH':
+                    continue
+                if Dupli.object not in Transforms:
+                    Prototypes.append(Dupli.object)
+                    Transforms[Dupli.object] = []
+                Transforms[Dupli.object].append(
+                    (InverseWorld * Dupli.matrix).decompose())
+        finally:
+            self.BlenderObject.dupli_list_clear()
+
+        for Prototype in Prototypes:
+            Positions, Rotations, Scales = [[tuple(Value) for Value in Values]
+                for Values in zip(*Transforms[Prototype])]
+            Table = x_scene.InstanceTable("{}_{}".format(self.SafeName,
+                Util.SafeName(Prototype.name)), Positions, Rotations, Scales)
+            # DirectX expects the opposite rotation direction
+            Table.Rotations[:, 0] *= -1.0
+            if self.Config.InstanceColors:
+                Table.Colors = x_scene.FloatArray([tuple(Prototype.color)] *
+                    len(Positions), 4)
+
+            Table.Meshes = MeshExportObject(self.Config, self.Exporter,
+                Prototype).GatherMeshes()
+            Frame.Instances.append(Table)
+        self.Exporter.Log("Done, {} prototype(s)".format(len(Prototypes)))
 
 # Simple decorator implemenation for ExportObject.  Used by empty objects
 class EmptyExportObject(ExportObject):
@@ -328,7 +796,7 @@ class EmptyExportObject(ExportObject):
 
     def __repr__(self):
         return "[EmptyExportObject: {}]".format(self.name)
-    
+
 # Mesh object implementation of ExportObject
 class MeshExportObject(ExportObject):
     def __init__(self, Config, Exporter, BlenderObject):
@@ -339,55 +807,94 @@ class MeshExportObject(ExportObject):
 
     # "Public" Interface
 
-    def Write(self):
+    def Write(self, ParentFrame):
         self.Exporter.Log("Opening frame for {}".format(self))
-        self._OpenFrame()
+        Frame = self._OpenFrame(ParentFrame)
 
+        Meshes = []
+        if self.Config.ExportMeshes or self.__HasCollision():
+            Meshes = self.GatherMeshes()
         if self.Config.ExportMeshes:
-            self.Exporter.Log("Generating mesh for export...")
-            # Generate the export mesh
-            Mesh = None
-            if self.Config.ApplyModifiers:
-                # Certain modifiers shouldn't be applied in some cases
-                # Deactivate them until after mesh generation is complete
-                
-                DeactivatedModifierList = []
-                
-                # If we're exporting armature data, we shouldn't apply
-                # armature modifiers to the mesh
-                if self.Config.ExportSkinWeights:
-                    DeactivatedModifierList = [Modifier
-                        for Modifier in self.BlenderObject.modifiers
-                        if Modifier.type == 'ARMATURE' and \
-                        Modifier.show_viewport]
-                
-                for Modifier in DeactivatedModifierList:
-                    Modifier.show_viewport = False
-                        
-                Mesh = self.BlenderObject.to_mesh(self.Exporter.context.scene,
-                    True, 'PREVIEW')
-                
-                # Restore the deactivated modifiers
-                for Modifier in DeactivatedModifierList:
-                    Modifier.show_viewport = True   
-            else:
-                Mesh = self.BlenderObject.to_mesh(self.Exporter.context.scene,
-                    False, 'PREVIEW')
-            self.Exporter.Log("Done")
-                    
-            self.__WriteMesh(Mesh)
+            Frame.Meshes.extend(Meshes)
+        if self.__HasCollision():
+            self.Exporter.Log("Building collision hulls...")
+            Frame.Hulls = x_hull.ComputeHulls(
+                "{}_Collision".format(self.SafeName), Meshes,
+                self.Config.CollisionHulls, self.Config.CollisionVertices)
+            self.Exporter.Log("Done, {} hull(s)".format(len(Frame.Hulls)))
 
-            # Cleanup
-            bpy.data.meshes.remove(Mesh)
+        self._WriteInstances(Frame)
 
         self.Exporter.Log("Writing children of {}".format(self))
-        self._WriteChildren()
+        self._WriteChildren(Frame)
 
-        self._CloseFrame()
         self.Exporter.Log("Closed frame of {}".format(self))
 
+    # Returns the export meshes of the object, more than one if it is split
+    # into bone palettes
+    def GatherMeshes(self):
+        self.Exporter.Log("Generating mesh for export...")
+        # Shape keys are exported as offsets from the basis, so generate
+        # the mesh with only the basis applied
+        Key = None
+        if self.Config.ExportShapeKeys:
+            Key = Util.GetShapeKeys(self.BlenderObject)
+        if Key is not None:
+            OldShowOnlyShapeKey = self.BlenderObject.show_only_shape_key
+            OldActiveShapeKey = self.BlenderObject.active_shape_key_index
+            self.BlenderObject.show_only_shape_key = True
+            self.BlenderObject.active_shape_key_index = 0
+
+        # Generate the export mesh
+        Mesh = None
+        if self.Config.ApplyModifiers:
+            # Certain modifiers shouldn't be applied in some cases
+            # Deactivate them until after mesh generation is complete
+
+            DeactivatedModifierList = []
+
+            # If we're exporting armature data or baking the armature's
+            # animation, we shouldn't apply armature modifiers to the mesh
+            if self.Config.ExportSkinWeights or \
+                self.__GetBakedArmature() is not None:
+                DeactivatedModifierList = [Modifier
+                    for Modifier in self.BlenderObject.modifiers
+                    if Modifier.type == 'ARMATURE' and \
+                    Modifier.show_viewport]
+
+            for Modifier in DeactivatedModifierList:
+                Modifier.show_viewport = False
+
+            Mesh = self.BlenderObject.to_mesh(self.Exporter.context.scene,
+                True, 'PREVIEW')
+
+            # Restore the deactivated modifiers
+            for Modifier in DeactivatedModifierList:
+                Modifier.show_viewport = True
+        else:
+            Mesh = self.BlenderObject.to_mesh(self.Exporter.context.scene,
+                False, 'PREVIEW')
+
+        if Key is not None:
+            self.BlenderObject.show_only_shape_key = OldShowOnlyShapeKey
+            self.BlenderObject.active_shape_key_index = OldActiveShapeKey
+        self.Exporter.Log("Done")
+
+        ExportMesh = self.__WriteMesh(Mesh)
+        if self.Config.ExportSkinWeights and self.Config.MaxBonesPerMesh:
+            self.Exporter.Log("Partitioning mesh by bones...")
+            Parts = x_palette.PartitionMesh(ExportMesh,
+                self.Config.MaxBonesPerMesh)
+            self.Exporter.Log("Done, {} part(s)".format(len(Parts)))
+        else:
+            Parts = [ExportMesh]
+
+        # Cleanup
+        bpy.data.meshes.remove(Mesh)
+        return Parts
+
     # "Protected"
-    
+
     # This class provides a general system for indexing a mesh, depending on
     # exporter needs.  For instance, some options require us to duplicate each
     # vertex of each face, some can reuse vertex data.  For those we'd use
@@ -395,50 +902,64 @@ class MeshExportObject(ExportObject):
     class _MeshEnumerator:
         def __init__(self, Mesh):
             self.Mesh = Mesh
-            
-            # self.vertices and self.PolygonVertexIndexes relate to the
+
+            # Polygon sizes and, for every polygon corner in polygon order,
+            # its loop index and the index of its vertex.
+            self.PolygonSizes = Util.GetArray(Mesh.polygons, "loop_total",
+                numpy.int32)
+            self.PolygonOffsets = Util.GetOffsets(self.PolygonSizes)
+            LoopStarts = Util.GetArray(Mesh.polygons, "loop_start",
+                numpy.int64)
+            self.LoopIndexes = Util.ExpandRanges(LoopStarts,
+                self.PolygonSizes)
+            self.CornerVertexIndexes = Util.GetArray(Mesh.loops,
+                "vertex_index", numpy.int32)[self.LoopIndexes]
+
+            # self.VertexIndexes and self.PolygonVertexIndexes relate to the
             # original mesh in the following way:
-            
-            # Mesh.vertices[Mesh.polygons[x].vertices[y]] == 
-            # self.vertices[self.PolygonVertexIndexes[x][y]]
-            
-            self.vertices = None 
+
+            # Mesh.vertices[Mesh.polygons[x].vertices[y]] ==
+            # Mesh.vertices[self.VertexIndexes[
+            #     self.PolygonVertexIndexes[PolygonOffsets[x] + y]]]
+
+            self.VertexIndexes = None
             self.PolygonVertexIndexes = None
-    
+
     # Represents the mesh as it is inside Blender
     class _OneToOneMeshEnumerator(_MeshEnumerator):
         def __init__(self, Mesh):
             MeshExportObject._MeshEnumerator.__init__(self, Mesh)
-            
-            self.vertices = Mesh.vertices
-            
-            self.PolygonVertexIndexes = tuple(tuple(Polygon.vertices)
-                for Polygon in Mesh.polygons)
+
+            self.VertexIndexes = numpy.arange(len(Mesh.vertices),
+                dtype=numpy.int32)
+            self.PolygonVertexIndexes = self.CornerVertexIndexes
 
     # Duplicates each vertex for each face
     class _UnrolledFacesMeshEnumerator(_MeshEnumerator):
         def __init__(self, Mesh):
             MeshExportObject._MeshEnumerator.__init__(self, Mesh)
-            
-            self.vertices = tuple()
-            for Polygon in Mesh.polygons:
-                self.vertices += tuple(Mesh.vertices[VertexIndex]
-                    for VertexIndex in Polygon.vertices)
-            
-            self.PolygonVertexIndexes = []
-            Index = 0
-            for Polygon in Mesh.polygons:
-                self.PolygonVertexIndexes.append(tuple(range(Index, 
-                    Index + len(Polygon.vertices))))
-                Index += len(Polygon.vertices)
-            
+
+            self.VertexIndexes = self.CornerVertexIndexes
+            self.PolygonVertexIndexes = numpy.arange(
+                len(self.CornerVertexIndexes), dtype=numpy.int32)
+
     # "Private" Methods
 
+    # Whether collision hulls are built for the object, i.e. collision is
+    # exported and its name matches CollisionObjects, a comma separated list
+    # of object names that may contain wildcards, or that list is empty
+    def __HasCollision(self):
+        if not self.Config.ExportCollision:
+            return False
+        Patterns = [Pattern.strip() for Pattern in
+            self.Config.CollisionObjects.split(",") if Pattern.strip()]
+        return not Patterns or any(fnmatch.fnmatchcase(
+            self.BlenderObject.name, Pattern) for Pattern in Patterns)
+
     def __WriteMesh(self, Mesh):
         self.Exporter.Log("Writing mesh vertices...")
-        self.Exporter.File.Write("Mesh {{ // {} mesh\n".format(self.SafeName))
-        self.Exporter.File.Indent()
-        
+        ExportMesh = x_scene.Mesh(self.SafeName)
+
         # Create the mesh enumerator based on options
         MeshEnumerator = None
         if (self.Config.ExportUVCoordinates and Mesh.uv_textures) or \
@@ -447,77 +968,76 @@ class MeshExportObject(ExportObject):
             MeshEnumerator = MeshExportObject._UnrolledFacesMeshEnumerator(Mesh)
         else:
             MeshEnumerator = MeshExportObject._OneToOneMeshEnumerator(Mesh)
-        
-        # Write vertex positions
-        VertexCount = len(MeshEnumerator.vertices)
-        self.Exporter.File.Write("{};\n".format(VertexCount))
-        for Index, Vertex in enumerate(MeshEnumerator.vertices):
-            Position = Vertex.co
-            self.Exporter.File.Write("{:9f};{:9f};{:9f};".format(
-                        Position[0], Position[1], Position[2]))
-            
-            if Index == VertexCount - 1:
-                self.Exporter.File.Write(";\n", Indent=False)
-            else:
-                self.Exporter.File.Write(",\n", Indent=False)
-        
-        # Write face definitions
-        PolygonCount = len(MeshEnumerator.PolygonVertexIndexes)
-        self.Exporter.File.Write("{};\n".format(PolygonCount))
-        for Index, PolygonVertexIndexes in \
-            enumerate(MeshEnumerator.PolygonVertexIndexes):
-            
-            self.Exporter.File.Write("{};".format(len(PolygonVertexIndexes)))
-            
-            PolygonVertexIndexes = PolygonVertexIndexes[::-1]
-            
-            for VertexCountIndex, VertexIndex in \
-                enumerate(PolygonVertexIndexes):
 
-                if VertexCountIndex == len(PolygonVertexIndexes) - 1:
-                    self.Exporter.File.Write("{};".format(VertexIndex),
-                        Indent=False)
-                else:
-                    self.Exporter.File.Write("{},".format(VertexIndex),
-                        Indent=False)
-            
-            if Index == PolygonCount - 1:
-                self.Exporter.File.Write(";\n", Indent=False)
-            else:
-                self.Exporter.File.Write(",\n", Indent=False)
+        # Vertex positions
+        ExportMesh.Positions = self.__Take(Util.GetArray(Mesh.vertices, "co",
+            numpy.float32, 3), MeshEnumerator.VertexIndexes)
+
+        # Face definitions, with the winding order reversed
+        ExportMesh.FaceSizes = MeshEnumerator.PolygonSizes
+        ExportMesh.FaceIndices = Util.ReverseWinding(
+            MeshEnumerator.PolygonVertexIndexes, MeshEnumerator.PolygonSizes)
         self.Exporter.Log("Done")
-        
+
         # Write the other mesh components
-            
+
         if self.Config.ExportNormals:
             self.Exporter.Log("Writing mesh normals...")
-            self.__WriteMeshNormals(Mesh)
+            self.__WriteMeshNormals(Mesh, ExportMesh)
             self.Exporter.Log("Done")
-            
+
         if self.Config.ExportUVCoordinates:
             self.Exporter.Log("Writing mesh UV coordinates...")
-            self.__WriteMeshUVCoordinates(Mesh)
+            self.__WriteMeshUVCoordinates(Mesh, ExportMesh,
+                MeshEnumerator=MeshEnumerator)
             self.Exporter.Log("Done")
 
         if self.Config.ExportMaterials:
             self.Exporter.Log("Writing mesh materials...")
-            self.__WriteMeshMaterials(Mesh)
+            self.__WriteMeshMaterials(Mesh, ExportMesh)
             self.Exporter.Log("Done")
-        
+
         if self.Config.ExportVertexColors:
             self.Exporter.Log("Writing mesh vertex colors...")
-            self.__WriteMeshVertexColors(Mesh, MeshEnumerator=MeshEnumerator)
+            self.__WriteMeshVertexColors(Mesh, ExportMesh,
+                MeshEnumerator=MeshEnumerator)
             self.Exporter.Log("Done")
-        
-        if self.Config.ExportSkinWeights:
+
+        # Baked meshes are drawn unskinned
+        BakedArmature = self.__GetBakedArmature()
+        if self.Config.ExportSkinWeights and BakedArmature is None:
             self.Exporter.Log("Writing mesh skin weights...")
-            self.__WriteMeshSkinWeights(Mesh, MeshEnumerator=MeshEnumerator)
+            self.__WriteMeshSkinWeights(Mesh, ExportMesh,
+                MeshEnumerator=MeshEnumerator)
+            self.Exporter.Log("Done")
+
+        # Absolute shape keys are driven by evaluation time, not weights,
+        # so they have no morph targets
+        Key = Util.GetShapeKeys(self.BlenderObject)
+        if self.Config.ExportShapeKeys and Key is not None and \
+            Key.use_relative:
+            self.Exporter.Log("Writing mesh shape keys...")
+            self.__WriteMeshShapeKeys(Mesh, ExportMesh,
+                MeshEnumerator=MeshEnumerator)
+            self.Exporter.Log("Done")
+
+        if BakedArmature is not None:
+            self.Exporter.Log("Baking mesh vertex animation...")
+            self.__BakeVertexAnimation(Mesh, ExportMesh, BakedArmature,
+                MeshEnumerator=MeshEnumerator)
             self.Exporter.Log("Done")
 
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}} // End of {} mesh\n".format(self.SafeName))
+        return ExportMesh
 
-    def __WriteMeshNormals(self, Mesh, MeshEnumerator=None):
+    # Rows of Source picked by Indexes.  With ChunkedMeshes set, the rows are
+    # only gathered while they are written, a window at a time, instead of
+    # keeping a full per-vertex or per-corner copy of every attribute.
+    def __Take(self, Source, Indexes):
+        if self.Config.ChunkedMeshes:
+            return x_scene.ChunkedArray.Take(Source, Indexes)
+        return Source[Indexes]
+
+    def __WriteMeshNormals(self, Mesh, ExportMesh, MeshEnumerator=None):
         # Since mesh normals only need their face counts and vertices per face
         # to match up with the other mesh data, we can optimize export with
         # this enumerator.  Exports each vertex's normal when a face is shaded
@@ -525,110 +1045,82 @@ class MeshExportObject(ExportObject):
         # flat.
         class _NormalsMeshEnumerator(MeshExportObject._MeshEnumerator):
             def __init__(self, Mesh):
-                MeshExportObject._MeshEnumerator(Mesh)
-                
-                self.vertices = []
-                self.PolygonVertexIndexes = []
-                
-                Index = 0
-                for Polygon in Mesh.polygons:
-                    if not Polygon.use_smooth:
-                        self.vertices.append(Polygon)
-                        self.PolygonVertexIndexes.append(
-                            tuple(len(Polygon.vertices) * [Index]))
-                        Index += 1
-                    else:
-                        for VertexIndex in Polygon.vertices:
-                            self.vertices.append(Mesh.vertices[VertexIndex])
-                        self.PolygonVertexIndexes.append(
-                            tuple(range(Index, Index + len(Polygon.vertices))))
-                        Index += len(Polygon.vertices)            
-        
+                MeshExportObject._MeshEnumerator.__init__(self, Mesh)
+
+                Sizes = self.PolygonSizes
+                Smooth = Util.GetArray(Mesh.polygons, "use_smooth", bool)
+
+                # Flat polygons get one normal, smooth ones one per corner
+                NormalCounts = numpy.where(Smooth, Sizes, 1)
+                NormalOffsets = Util.GetOffsets(NormalCounts)
+                CornerIsSmooth = numpy.repeat(Smooth, Sizes)
+                CornerNormalIndexes = numpy.where(CornerIsSmooth,
+                    Util.ExpandRanges(NormalOffsets, Sizes),
+                    numpy.repeat(NormalOffsets, Sizes))
+
+                # Each normal is picked from the polygon normals followed by
+                # the vertex normals
+                PolygonNormals = Util.GetArray(Mesh.polygons, "normal",
+                    numpy.float32, 3)
+                self.NormalSources = numpy.concatenate((PolygonNormals,
+                    Util.GetArray(Mesh.vertices, "normal", numpy.float32, 3)))
+                self.NormalSourceIndexes = numpy.empty(
+                    int(NormalCounts.sum()), dtype=numpy.int32)
+                self.NormalSourceIndexes[NormalOffsets[~Smooth]] = \
+                    numpy.flatnonzero(~Smooth)
+                self.NormalSourceIndexes[
+                    CornerNormalIndexes[CornerIsSmooth]] = \
+                    len(PolygonNormals) + \
+                    self.CornerVertexIndexes[CornerIsSmooth]
+
+                self.PolygonVertexIndexes = CornerNormalIndexes
+
         if MeshEnumerator is None:
             MeshEnumerator = _NormalsMeshEnumerator(Mesh)
-        
-        self.Exporter.File.Write("MeshNormals {{ // {} normals\n".format(
-            self.SafeName))
-        self.Exporter.File.Indent()
-        
-        NormalCount = len(MeshEnumerator.vertices)
-        self.Exporter.File.Write("{};\n".format(NormalCount))
-        
-        # Write mesh normals.
-        for Index, Vertex in enumerate(MeshEnumerator.vertices):
-            Normal = Vertex.normal
-            if self.Config.FlipNormals:
-                Normal = -1.0 * Vertex.normal
-            
-            self.Exporter.File.Write("{:9f};{:9f};{:9f};".format(Normal[0],
-                Normal[1], Normal[2]))
-            
-            if Index == NormalCount - 1:
-                self.Exporter.File.Write(";\n", Indent=False)
-            else:
-                self.Exporter.File.Write(",\n", Indent=False)
-        
-        # Write face definitions.
-        FaceCount = len(MeshEnumerator.PolygonVertexIndexes)
-        self.Exporter.File.Write("{};\n".format(FaceCount))
-        for Index, Polygon in enumerate(MeshEnumerator.PolygonVertexIndexes):
-            self.Exporter.File.Write("{};".format(len(Polygon)))
-            
-            # Reverse the winding order
-            for VertexCountIndex, VertexIndex in enumerate(Polygon[::-1]):
-                if VertexCountIndex == len(Polygon) - 1:
-                    self.Exporter.File.Write("{};".format(VertexIndex),
-                        Indent=False)
-                else:
-                    self.Exporter.File.Write("{},".format(VertexIndex),
-                        Indent=False)
-            
-            if Index == FaceCount - 1:
-                self.Exporter.File.Write(";\n", Indent=False)
-            else:
-                self.Exporter.File.Write(",\n", Indent=False)
-
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}} // End of {} normals\n".format(
-            self.SafeName))
-     
-    def __WriteMeshUVCoordinates(self, Mesh):
+            NormalSources = MeshEnumerator.NormalSources
+            NormalSourceIndexes = MeshEnumerator.NormalSourceIndexes
+        else:
+            NormalSources = Util.GetArray(Mesh.vertices, "normal",
+                numpy.float32, 3)
+            NormalSourceIndexes = MeshEnumerator.VertexIndexes
+
+        if self.Config.FlipNormals:
+            NormalSources = -1.0 * NormalSources
+
+        # Write each distinct normal once.  Deduplicating the sources that
+        # are used, rather than the expanded normals, keeps this cheap for
+        # ChunkedMeshes too.
+        UsedSources, NormalIndexes = numpy.unique(NormalSourceIndexes,
+            return_inverse=True)
+        Normals, SourceToNormal = x_scene.DeduplicateRows(
+            NormalSources[UsedSources], x_scene.NORMAL_STEP)
+        NormalIndexes = SourceToNormal[NormalIndexes.reshape(-1)]
+
+        ExportMesh.Normals = Normals
+        ExportMesh.NormalFaceIndices = Util.ReverseWinding(
+            NormalIndexes[MeshEnumerator.PolygonVertexIndexes],
+            MeshEnumerator.PolygonSizes)
+
+    def __WriteMeshUVCoordinates(self, Mesh, ExportMesh, MeshEnumerator=None):
         if not Mesh.uv_textures:
             return
-        
-        self.Exporter.File.Write("MeshTextureCoords {{ // {} UV coordinates\n" \
-            .format(self.SafeName))
-        self.Exporter.File.Indent()
-        
-        UVCoordinates = Mesh.uv_layers.active.data
-        
-        VertexCount = 0
-        for Polygon in Mesh.polygons:
-            VertexCount += len(Polygon.vertices)
-        
-        # Gather and write UV coordinates
-        Index = 0
-        self.Exporter.File.Write("{};\n".format(VertexCount))
-        for Polygon in Mesh.polygons:
-            Vertices = []
-            for Vertex in [UVCoordinates[Vertex] for Vertex in
-                Polygon.loop_indices]:
-                Vertices.append(tuple(Vertex.uv))
-            for Vertex in Vertices:
-                self.Exporter.File.Write("{:9f};{:9f};".format(Vertex[0],
-                    1.0 - Vertex[1]))
-                Index += 1
-                if Index == VertexCount:
-                    self.Exporter.File.Write(";\n", Indent=False)
-                else:
-                    self.Exporter.File.Write(",\n", Indent=False)
-                    
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}} // End of {} UV coordinates\n".format(
-            self.SafeName))
 
-    def __WriteMeshMaterials(self, Mesh):
-        def WriteMaterial(Exporter, Material):
+        # UV coordinates are stored per polygon corner
+        if MeshEnumerator is None:
+            MeshEnumerator = \
+                MeshExportObject._UnrolledFacesMeshEnumerator(Mesh)
+
+        UVCoordinates = Util.GetArray(Mesh.uv_layers.active.data, "uv",
+            numpy.float32, 2)
+
+        # Flip V, DirectX has its texture origin at the top
+        UVCoordinates[:, 1] = 1.0 - UVCoordinates[:, 1]
+
+        ExportMesh.TextureCoords = self.__Take(UVCoordinates,
+            MeshEnumerator.LoopIndexes)
+
+    def __WriteMeshMaterials(self, Mesh, ExportMesh):
+        def WriteMaterial(Material):
             def GetMaterialTextureFileName(Material):
                 if Material:
                     # Create a list of Textures that have type 'IMAGE'
@@ -636,305 +1128,403 @@ class MeshExportObject(ExportObject):
                         for TextureSlot in Material.texture_slots.keys()
                         if Material.texture_slots[TextureSlot].texture.type ==
                         'IMAGE']
-                    # Refine to only image file names if applicable
-                    ImageFiles = [bpy.path.basename(Texture.image.filepath)
-                        for Texture in ImageTextures
+                    # Refine to only image files if applicable
+                    Images = [Texture.image for Texture in ImageTextures
                         if getattr(Texture.image, "source", "") == 'FILE']
-                    if ImageFiles:
-                        return ImageFiles[0]
+                    if Images:
+                        FileName = bpy.path.basename(Images[0].filepath)
+                        # Kept for texture conversion and atlases
+                        self.Exporter.TextureImages[FileName] = Images[0]
+                        return FileName
                 return None
-            
-            Exporter.File.Write("Material {} {{\n".format(
-                Util.SafeName(Material.name)))
-            Exporter.File.Indent()
-            
+
+            ExportMaterial = x_scene.Material(Util.SafeName(Material.name))
+
             Diffuse = list(Vector(Material.diffuse_color) *
                 Material.diffuse_intensity)
             Diffuse.append(Material.alpha)
+            ExportMaterial.Diffuse = x_scene.FloatArray(Diffuse)
             # Map Blender's range of 1 - 511 to 0 - 1000
-            Specularity = 1000 * (Material.specular_hardness - 1.0) / 510.0
-            Specular = list(Vector(Material.specular_color) *
-                Material.specular_intensity)
-            
-            Exporter.File.Write("{:9f};{:9f};{:9f};{:9f};;\n".format(Diffuse[0],
-                Diffuse[1], Diffuse[2], Diffuse[3]))
-            Exporter.File.Write(" {:9f};\n".format(Specularity))
-            Exporter.File.Write("{:9f};{:9f};{:9f};;\n".format(Specular[0],
-                Specular[1], Specular[2]))
-            Exporter.File.Write(" 0.000000; 0.000000; 0.000000;;\n")
-            
-            TextureFileName = GetMaterialTextureFileName(Material)
-            if TextureFileName:
-                Exporter.File.Write("TextureFilename {{\"{}\";}}\n".format(
-                    TextureFileName))
-            
-            Exporter.File.Unindent()
-            Exporter.File.Write("}\n");
-        
+            ExportMaterial.Power = 1000 * (Material.specular_hardness - 1.0) \
+                / 510.0
+            ExportMaterial.Specular = x_scene.FloatArray(
+                Vector(Material.specular_color) * Material.specular_intensity)
+
+            ExportMaterial.TextureFilename = GetMaterialTextureFileName(
+                Material)
+
+            return ExportMaterial
+
         Materials = Mesh.materials
         # Do not write materials if there are none
         if not Materials.keys():
             return
-        
-        self.Exporter.File.Write("MeshMaterialList {{ // {} material list\n".
-            format(self.SafeName))
-        self.Exporter.File.Indent()
-        
-        self.Exporter.File.Write("{};\n".format(len(Materials)))
-        self.Exporter.File.Write("{};\n".format(len(Mesh.polygons)))
-        # Write a material index for each face
-        for Index, Polygon in enumerate(Mesh.polygons):
-            self.Exporter.File.Write("{}".format(Polygon.material_index))
-            if Index == len(Mesh.polygons) - 1:
-                self.Exporter.File.Write(";;\n", Indent=False)
-            else:
-                self.Exporter.File.Write(",\n", Indent=False)
-        
-        for Material in Materials:
-            WriteMaterial(self.Exporter, Material)
-        
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}} // End of {} material list\n".format(
-            self.SafeName))
-    
-    def __WriteMeshVertexColors(self, Mesh, MeshEnumerator=None):
+
+        # A material index for each face
+        ExportMesh.MaterialIndices = Util.GetArray(Mesh.polygons,
+            "material_index", numpy.int32)
+
+        ExportMesh.Materials = [WriteMaterial(Material)
+            for Material in Materials]
+
+    def __WriteMeshVertexColors(self, Mesh, ExportMesh, MeshEnumerator=None):
         # If there are no vertex colors, don't write anything
         if len(Mesh.vertex_colors) == 0:
             return
-        
+
         # Blender stores vertex color information per vertex per face, so we
         # need to pass in an _UnrolledFacesMeshEnumerator.  Otherwise,
         if MeshEnumerator is None:
-            MeshEnumerator = _UnrolledFacesMeshEnumerator(Mesh)
-        
+            MeshEnumerator = \
+                MeshExportObject._UnrolledFacesMeshEnumerator(Mesh)
+
         # Gather the colors of each vertex
         VertexColorLayer = Mesh.vertex_colors.active
-        VertexColors = [VertexColorLayer.data[Index].color for Index in
-            range(0,len(MeshEnumerator.vertices))]
-        VertexColorCount = len(VertexColors)
-        
-        self.Exporter.File.Write("MeshVertexColors {{ // {} vertex colors\n" \
-            .format(self.SafeName))
-        self.Exporter.File.Indent()
-        self.Exporter.File.Write("{};\n".format(VertexColorCount))
-        
-        # Write the vertex colors for each vertex index.
-        for Index, Color in enumerate(VertexColors):
-            self.Exporter.File.Write("{};{:9f};{:9f};{:9f};{:9f};;".format(
-                Index, Color[0], Color[1], Color[2], 1.0))
-            
-            if Index == VertexColorCount - 1:
-                self.Exporter.File.Write(";\n", Indent=False)
-            else:
-                self.Exporter.File.Write(",\n", Indent=False)
-        
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}} // End of {} vertex colors\n".format(
-            self.SafeName))
-    
-    def __WriteMeshSkinWeights(self, Mesh, MeshEnumerator=None):
-        # This contains vertex indexes and weights for the vertices that belong
-        # to this bone's group.  Also calculates the bone skin matrix.
-        class _BoneVertexGroup:
-                def __init__(self, BlenderObject, ArmatureObject, BoneName):
-                    self.BoneName = BoneName
-                    self.SafeName = Util.SafeName(ArmatureObject.name) + "_" + \
-                        Util.SafeName(BoneName)
-                    
-                    self.Indexes = []
-                    self.Weights = []
-                    
-                    # BoneMatrix transforms mesh vertices into the
-                    # space of the bone.
-                    # Here are the final transformations in order:
-                    #  - Object Space to World Space
-                    #  - World Space to Armature Space
-                    #  - Armature Space to Bone Space
-                    # This way, when BoneMatrix is transformed by the bone's
-                    # Frame matrix, the vertices will be in their final world
-                    # position.
-                    
-                    self.BoneMatrix = ArmatureObject.data.bones[BoneName] \
-                        .matrix_local.inverted()
-                    self.BoneMatrix *= ArmatureObject.matrix_world.inverted()
-                    self.BoneMatrix *= BlenderObject.matrix_world
-                
-                def AddVertex(self, Index, Weight):
-                    self.Indexes.append(Index)
-                    self.Weights.append(Weight)
-        
+        Colors = Util.GetArray(VertexColorLayer.data, "color",
+            numpy.float32, 3)
+
+        VertexColors = numpy.ones((len(Colors), 4), dtype=numpy.float32)
+        VertexColors[:, :3] = Colors
+        ExportMesh.VertexColors = self.__Take(VertexColors,
+            MeshEnumerator.LoopIndexes)
+
+    def __WriteMeshSkinWeights(self, Mesh, ExportMesh, MeshEnumerator=None):
+        # BoneMatrix transforms mesh vertices into the space of the bone.
+        # Here are the final transformations in order:
+        #  - Object Space to World Space
+        #  - World Space to Armature Space
+        #  - Armature Space to Bone Space
+        # This way, when BoneMatrix is transformed by the bone's Frame matrix,
+        # the vertices will be in their final world position.
+        def GetBoneMatrix(ArmatureObject, BoneName):
+            BoneMatrix = ArmatureObject.data.bones[BoneName] \
+                .matrix_local.inverted()
+            BoneMatrix *= ArmatureObject.matrix_world.inverted()
+            BoneMatrix *= self.BlenderObject.matrix_world
+            return BoneMatrix
+
         # Skin weights work well with vertex reuse per face.  Use a
         # _OneToOneMeshEnumerator if possible.
         if MeshEnumerator is None:
             MeshEnumerator = MeshExportObject._OneToOneMeshEnumerator(Mesh)
-        
-        ArmatureModifierList = [Modifier 
+
+        ArmatureModifierList = [Modifier
             for Modifier in self.BlenderObject.modifiers
             if Modifier.type == 'ARMATURE' and Modifier.show_viewport]
-        
+
         if not ArmatureModifierList:
             return
-        
+
         # Although multiple armature objects are gathered, support for
         # multiple armatures per mesh is not complete
         ArmatureObjects = [Modifier.object for Modifier in ArmatureModifierList]
-        
+
         for ArmatureObject in ArmatureObjects:
-            # Determine the names of the bone vertex groups
-            PoseBoneNames = [Bone.name for Bone in ArmatureObject.pose.bones]
-            VertexGroupNames = [Group.name for Group
-                in self.BlenderObject.vertex_groups]
-            UsedBoneNames = set(PoseBoneNames).intersection(VertexGroupNames)
-            
-            # Create a _BoneVertexGroup for each group name
-            BoneVertexGroups = [_BoneVertexGroup(self.BlenderObject,
-                ArmatureObject, BoneName) for BoneName in UsedBoneNames]
-            
-            # Maps Blender's internal group indexing to our _BoneVertexGroups
-            GroupIndexToBoneVertexGroups = {Group.index : BoneVertexGroup
-                for Group in self.BlenderObject.vertex_groups
-                for BoneVertexGroup in BoneVertexGroups
-                if Group.name == BoneVertexGroup.BoneName}
-            
-            MaximumInfluences = 0
-            
-            for Index, Vertex in enumerate(MeshEnumerator.vertices):
-                VertexWeightTotal = 0.0
-                VertexInfluences = 0
-                
-                # Sum up the weights of groups that correspond
-                # to armature bones.
+            # Determine the names of the bone vertex groups, in vertex group
+            # order
+            PoseBoneNames = set(Bone.name for Bone in ArmatureObject.pose.bones)
+            BoneGroups = [Group for Group in self.BlenderObject.vertex_groups
+                if Group.name in PoseBoneNames]
+
+            # Maps Blender's internal group indexing to our bone slots
+            GroupIndexToSlot = {Group.index : Slot
+                for Slot, Group in enumerate(BoneGroups)}
+
+            # Gather every (vertex, bone slot, weight) membership of the
+            # original mesh.  Each vertex is only visited once, no matter how
+            # many times the enumerator duplicates it.
+            MemberVertexes = []
+            MemberSlots = []
+            MemberWeights = []
+            for Vertex in Mesh.vertices:
                 for VertexGroup in Vertex.groups:
-                    BoneVertexGroup = GroupIndexToBoneVertexGroups.get(
-                        VertexGroup.group)
-                    if BoneVertexGroup is not None:
-                        VertexWeightTotal += VertexGroup.weight
-                        VertexInfluences += 1
-                
-                if VertexInfluences > MaximumInfluences:
-                    MaximumInfluences = VertexInfluences
-                
-                # Add the vertex to the bone vertex groups it belongs to,
-                # normalizing each bone's weight.
-                for VertexGroup in Vertex.groups:
-                    BoneVertexGroup = GroupIndexToBoneVertexGroups.get(
-                        VertexGroup.group)
-                    if BoneVertexGroup is not None:
-                        Weight = VertexGroup.weight / VertexWeightTotal
-                        BoneVertexGroup.AddVertex(Index, Weight)
-            
-            self.Exporter.File.Write("XSkinMeshHeader {\n")
-            self.Exporter.File.Indent()
-            self.Exporter.File.Write("{};\n".format(MaximumInfluences))
-            self.Exporter.File.Write("{};\n".format(3 * MaximumInfluences))
-            self.Exporter.File.Write("{};\n".format(len(BoneVertexGroups)))
-            self.Exporter.File.Unindent()
-            self.Exporter.File.Write("}\n")
-            
-            for BoneVertexGroup in BoneVertexGroups:
-                self.Exporter.File.Write("SkinWeights {\n")
-                self.Exporter.File.Indent()
-                self.Exporter.File.Write("\"{}\";\n".format(
-                    BoneVertexGroup.SafeName))
-                
-                GroupVertexCount = len(BoneVertexGroup.Indexes)
-                self.Exporter.File.Write("{};\n".format(GroupVertexCount))
-                
-                # Write the indexes of the vertices this bone affects.
-                for Index, VertexIndex in enumerate(BoneVertexGroup.Indexes):
-                    self.Exporter.File.Write("{}".format(VertexIndex))
-                    
-                    if Index == GroupVertexCount - 1:
-                        self.Exporter.File.Write(";\n", Indent=False)
-                    else:
-                        self.Exporter.File.Write(",\n", Indent=False)
-                
-                # Write the weights of the affected vertices.
-                for Index, VertexWeight in enumerate(BoneVertexGroup.Weights):
-                    self.Exporter.File.Write("{:9f}".format(VertexWeight))
-                    
-                    if Index == GroupVertexCount - 1:
-                        self.Exporter.File.Write(";\n", Indent=False)
-                    else:
-                        self.Exporter.File.Write(",\n", Indent=False)
-                
-                # Write the bone's matrix.
-                Util.WriteMatrix(self.Exporter.File, BoneVertexGroup.BoneMatrix)
-            
-                self.Exporter.File.Unindent()
-                self.Exporter.File.Write("}} // End of {} skin weights\n" \
-                    .format(BoneVertexGroup.SafeName))
-            
-# Armature object implementation of ExportObject            
+                    Slot = GroupIndexToSlot.get(VertexGroup.group)
+                    if Slot is not None:
+                        MemberVertexes.append(Vertex.index)
+                        MemberSlots.append(Slot)
+                        MemberWeights.append(VertexGroup.weight)
+            MemberVertexes = numpy.array(MemberVertexes, dtype=numpy.int64)
+            MemberSlots = numpy.array(MemberSlots, dtype=numpy.int64)
+            MemberWeights = numpy.array(MemberWeights, dtype=numpy.float64)
+
+            # Normalize each vertex's bone weights
+            VertexCount = len(Mesh.vertices)
+            WeightTotals = numpy.bincount(MemberVertexes,
+                weights=MemberWeights, minlength=VertexCount)
+            Totals = WeightTotals[MemberVertexes]
+            MemberWeights = numpy.where(Totals > 0.0,
+                MemberWeights / numpy.where(Totals > 0.0, Totals, 1.0), 0.0)
+
+            Influences = numpy.bincount(MemberVertexes,
+                minlength=VertexCount)[MeshEnumerator.VertexIndexes]
+            MaximumInfluences = int(Influences.max()) if len(Influences) \
+                else 0
+
+            # Expand the memberships to the enumerated vertices
+            Order = numpy.argsort(MeshEnumerator.VertexIndexes,
+                kind='mergesort')
+            Copies = numpy.bincount(MeshEnumerator.VertexIndexes,
+                minlength=VertexCount)
+            CopyStarts = Util.GetOffsets(Copies)
+            Repeats = Copies[MemberVertexes]
+            Indexes = Order[Util.ExpandRanges(CopyStarts[MemberVertexes],
+                Repeats)]
+            Slots = numpy.repeat(MemberSlots, Repeats)
+            Weights = numpy.repeat(MemberWeights, Repeats)
+
+            # Sort by bone, then by vertex index
+            SortOrder = numpy.lexsort((Indexes, Slots))
+            Indexes = Indexes[SortOrder]
+            Weights = Weights[SortOrder]
+            SlotOffsets = Util.GetOffsets(numpy.bincount(Slots,
+                minlength=len(BoneGroups)))
+            SlotOffsets = numpy.append(SlotOffsets, len(Indexes))
+
+            ExportMesh.MaxSkinWeightsPerVertex = MaximumInfluences
+            ExportMesh.MaxSkinWeightsPerFace = 3 * MaximumInfluences
+
+            for Slot, Group in enumerate(BoneGroups):
+                Start, End = SlotOffsets[Slot], SlotOffsets[Slot + 1]
+                ExportMesh.SkinWeights.append(x_scene.SkinWeights(
+                    Util.SafeName(ArmatureObject.name) + "_" + \
+                        Util.SafeName(Group.name),
+                    Indexes[Start:End], Weights[Start:End],
+                    Util.ConvertMatrix(GetBoneMatrix(ArmatureObject,
+                        Group.name))))
+
+    # The armature deforming the mesh when its animation is baked into
+    # vertex animation textures, or None
+    def __GetBakedArmature(self):
+        if not self.Config.BakeVertexAnimation:
+            return None
+        for Modifier in self.BlenderObject.modifiers:
+            if Modifier.type == 'ARMATURE' and Modifier.object is not None:
+                return Modifier.object
+        return None
+
+    # Samples the mesh as Armature deforms it at every frame of each of the
+    # armature's actions, or of the scene without any, into an
+    # x_vat.VertexAnimation, and adds texture coordinates pointing at the
+    # samples to ExportMesh
+    def __BakeVertexAnimation(self, Mesh, ExportMesh, Armature,
+        MeshEnumerator=None):
+        Scene = self.Exporter.context.scene # Convenience alias
+        BlenderCurrentFrame = Scene.frame_current
+        VertexCount = len(Mesh.vertices)
+
+        try:
+            Animation = x_vat.VertexAnimation(ExportMesh.Name, VertexCount,
+                int(Scene.render.fps / Scene.render.fps_base))
+        except ValueError as Error:
+            self.Exporter.Log("Skipping vertex animation of {}: {}".format(
+                self, Error), MessageVerbose=False)
+            return
+
+        if MeshEnumerator is None:
+            MeshEnumerator = MeshExportObject._OneToOneMeshEnumerator(Mesh)
+
+        # Keep track of the armature's animation data so we can restore it
+        NoData = Armature.animation_data is None
+        if NoData:
+            Armature.animation_data_create()
+        OldAction = Armature.animation_data.action
+
+        Clips = [(Util.SafeName(Action.name), Action,
+            range(int(Action.frame_range[0]), int(Action.frame_range[1]) + 1))
+            for Action in Util.GetPoseActions()]
+        if not Clips:
+            Clips = [("Default_Action", OldAction,
+                range(Scene.frame_start, Scene.frame_end + 1))]
+
+        for Name, Action, Frames in Clips:
+            Armature.animation_data.action = Action
+
+            Positions = []
+            Normals = []
+            for Frame in Frames:
+                Scene.frame_set(Frame)
+                Deformed = self.BlenderObject.to_mesh(Scene, True, 'PREVIEW')
+                Matches = len(Deformed.vertices) == VertexCount
+                if Matches:
+                    Positions.append(Util.GetArray(Deformed.vertices, "co",
+                        numpy.float32, 3))
+                    Normals.append(Util.GetArray(Deformed.vertices, "normal",
+                        numpy.float32, 3))
+                bpy.data.meshes.remove(Deformed)
+                if not Matches:
+                    break
+
+            if len(Positions) != len(Frames):
+                self.Exporter.Log("Skipping vertex animation, modifiers "\
+                    "changed the vertices of {}".format(self))
+                Animation = None
+                break
+            if self.Config.FlipNormals:
+                Normals = -1.0 * numpy.array(Normals)
+            Animation.AddClip(Name, Positions, Normals)
+
+        # Restore old animation data
+        Armature.animation_data.action = OldAction
+        if NoData:
+            Armature.animation_data_clear()
+        Scene.frame_set(BlenderCurrentFrame)
+
+        if Animation is not None:
+            ExportMesh.ExtraTextureCoords.append(Animation.GetTextureCoords(
+                MeshEnumerator.VertexIndexes))
+            self.Exporter.VertexAnimations[ExportMesh.Name] = Animation
+
+    # Each shape key becomes a morph target of the enumerated vertices it
+    # moves further than ShapeKeyThreshold from the key it is relative to
+    def __WriteMeshShapeKeys(self, Mesh, ExportMesh, MeshEnumerator=None):
+        Key = Util.GetShapeKeys(self.BlenderObject)
+        VertexCount = len(Mesh.vertices)
+        if len(Key.key_blocks[0].data) != VertexCount:
+            self.Exporter.Log("Skipping shape keys, modifiers changed the "\
+                "vertices of {}".format(self))
+            return
+
+        if MeshEnumerator is None:
+            MeshEnumerator = MeshExportObject._OneToOneMeshEnumerator(Mesh)
+
+        # The enumerated vertices of each Blender vertex
+        Order = numpy.argsort(MeshEnumerator.VertexIndexes, kind='mergesort')
+        Copies = numpy.bincount(MeshEnumerator.VertexIndexes,
+            minlength=VertexCount)
+        CopyStarts = Util.GetOffsets(Copies)
+
+        # The basis comes first and is what the exported positions show
+        for Block in Key.key_blocks[1:]:
+            Offsets = Util.GetArray(Block.data, "co", numpy.float32, 3) - \
+                Util.GetArray(Block.relative_key.data, "co", numpy.float32, 3)
+            Moved = numpy.flatnonzero((Offsets ** 2).sum(axis=1) >
+                self.Config.ShapeKeyThreshold ** 2)
+
+            Repeats = Copies[Moved]
+            Indexes = Order[Util.ExpandRanges(CopyStarts[Moved], Repeats)]
+            Offsets = numpy.repeat(Offsets[Moved], Repeats, axis=0)
+            SortOrder = numpy.argsort(Indexes, kind='mergesort')
+            ExportMesh.MorphTargets.append(x_scene.MorphTarget(
+                Util.SafeName(Block.name), Indexes[SortOrder],
+                Offsets[SortOrder]))
+
+# Armature object implementation of ExportObject
 class ArmatureExportObject(ExportObject):
     def __init__(self, Config, Exporter, BlenderObject):
         ExportObject.__init__(self, Config, Exporter, BlenderObject)
 
     def __repr__(self):
         return "[ArmatureExportObject: {}]".format(self.name)
-    
+
     # "Public" Interface
 
-    def Write(self):
+    def Write(self, ParentFrame):
         self.Exporter.Log("Opening frame for {}".format(self))
-        self._OpenFrame()
-        
+        Frame = self._OpenFrame(ParentFrame)
+
         if self.Config.ExportArmatureBones:
             Armature = self.BlenderObject.data
             RootBones = [Bone for Bone in Armature.bones if Bone.parent is None]
             self.Exporter.Log("Writing frames for armature bones...")
-            self.__WriteBones(RootBones)
+            self.__BoneMatrices = self.__GetBoneMatrices()
+            self.__WriteBones(RootBones, Frame)
             self.Exporter.Log("Done")
 
         self.Exporter.Log("Writing children of {}".format(self))
-        self._WriteChildren()
+        self._WriteChildren(Frame)
 
-        self._CloseFrame()
         self.Exporter.Log("Closed frame of {}".format(self))
-    
+
     # "Private" Methods
-    
-    def __WriteBones(self, Bones):
-        # Simply export the frames for each bone.  Export in rest position or
-        # posed position depending on options.
+
+    # Maps bone names to their matrices relative to their parents, in rest
+    # position or posed position depending on options
+    def __GetBoneMatrices(self):
+        Bones = ArmatureBones(self.BlenderObject)
+        if self.Config.ExportRestBone:
+            Matrices = Bones.GetRestMatrices()
+        else:
+            Matrices = Bones.GetPoseMatrices()
+        return dict(zip(Bones.Names, Bones.GetLocalMatrices(Matrices)))
+
+    def __WriteBones(self, Bones, ParentFrame):
+        # Simply export the frames for each bone
         for Bone in Bones:
-            BoneMatrix = Matrix()
-            
-            if self.Config.ExportRestBone:
-                if Bone.parent:
-                    BoneMatrix = Bone.parent.matrix_local.inverted()
-                BoneMatrix *= Bone.matrix_local
-            else:
-                PoseBone = self.BlenderObject.pose.bones[Bone.name]
-                if Bone.parent:
-                    BoneMatrix = PoseBone.parent.matrix.inverted()
-                BoneMatrix *= PoseBone.matrix
-            
             BoneSafeName = self.SafeName + "_" + \
                 Util.SafeName(Bone.name)
-            self.__OpenBoneFrame(BoneSafeName, BoneMatrix)
-            
-            self.__WriteBoneChildren(Bone)
-            
-            self.__CloseBoneFrame(BoneSafeName)
-            
-    
-    def __OpenBoneFrame(self, BoneSafeName, BoneMatrix):
-        self.Exporter.File.Write("Frame {} {{\n".format(BoneSafeName))
-        self.Exporter.File.Indent()
-
-        self.Exporter.File.Write("FrameTransformMatrix {\n")
-        self.Exporter.File.Indent()
-        Util.WriteMatrix(self.Exporter.File, BoneMatrix)
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}\n")
-    
-    def __CloseBoneFrame(self, BoneSafeName):
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}} // End of {}\n".format(BoneSafeName))
-    
-    def __WriteBoneChildren(self, Bone):
-        self.__WriteBones(Util.SortByNameField(Bone.children))
+            BoneFrame = x_scene.Frame(BoneSafeName,
+                self.__BoneMatrices[Bone.name])
+            ParentFrame.Children.append(BoneFrame)
+
+            self.__WriteBoneChildren(Bone, BoneFrame)
+
+    def __WriteBoneChildren(self, Bone, BoneFrame):
+        self.__WriteBones(Util.SortByNameField(Bone.children), BoneFrame)
+
+
+# Batched bone math for an armature object.  Bone order, parent indexes and
+# rest rotations are looked up once; matrices of all bones are then read and
+# processed as (Bones, 4, 4) arrays in DirectX layout (see
+# Util.GetMatrices).
+class ArmatureBones:
+    def __init__(self, ArmatureObject):
+        self.ArmatureObject = ArmatureObject
+
+        # Everything follows the order of the pose bones
+        PoseBones = ArmatureObject.pose.bones
+        self.Names = [Bone.name for Bone in PoseBones]
+        NameToIndex = {Name : Index for Index, Name in enumerate(self.Names)}
+        self.ParentIndexes = numpy.array([NameToIndex[Bone.parent.name]
+            if Bone.parent else -1 for Bone in PoseBones], dtype=numpy.int64)
+
+        # Armature bones are not guaranteed to be in the same order
+        Bones = ArmatureObject.data.bones
+        BoneIndexes = {Bone.name : Index for Index, Bone in enumerate(Bones)}
+        self.BoneOrder = numpy.array([BoneIndexes[Name]
+            for Name in self.Names], dtype=numpy.int64)
+
+        # Rest rotations relative to the parent bones, w, x, y, z
+        self.RestRotations = numpy.array([tuple(Bones[Name].matrix
+            .to_quaternion()) for Name in self.Names], dtype=numpy.float64)
+        self.RestRotations = self.RestRotations.reshape(-1, 4)
+
+    # "Public" Interface
+
+    # Rest matrices in armature space
+    def GetRestMatrices(self):
+        return Util.GetMatrices(self.ArmatureObject.data.bones,
+            "matrix_local")[self.BoneOrder]
+
+    # Current pose matrices in armature space
+    def GetPoseMatrices(self):
+        return Util.GetMatrices(self.ArmatureObject.pose.bones, "matrix")
+
+    # Current pose rotations relative to the parent bones, w, x, y, z
+    def GetPoseRotations(self):
+        return Util.MultiplyQuaternions(self.RestRotations,
+            Util.GetArray(self.ArmatureObject.pose.bones,
+            "rotation_quaternion", numpy.float64, 4))
+
+    # Turns armature space matrices into matrices relative to each bone's
+    # parent.  Matrices may have extra leading axes, e.g. one per frame.
+    def GetLocalMatrices(self, Matrices):
+        HasParent = self.ParentIndexes >= 0
+        Parents = self.ParentIndexes[HasParent]
+
+        # Row vectors: Local = Bone * Parent^-1
+        Local = Matrices.copy()
+        Local[..., HasParent, :, :] = numpy.matmul(
+            Matrices[..., HasParent, :, :],
+            numpy.linalg.inv(Matrices[..., Parents, :, :]))
+        return Local
+
+    # Scales and translations of Matrices, like Matrix.to_scale() and
+    # Matrix.to_translation()
+    @staticmethod
+    def Decompose(Matrices):
+        Scales = numpy.sqrt((Matrices[..., :3, :3] ** 2).sum(axis=-1))
+        Translations = Matrices[..., 3, :3]
+        return Scales, Translations
 
 
 # Container for animation data
@@ -951,6 +1541,62 @@ class Animation:
     def GetKeyCount(self):
         return len(self.RotationKeys)
 
+    # Converts the keys into an x_scene.AnimationTrack
+    def GetTrack(self):
+        Track = x_scene.AnimationTrack(self.SafeName,
+            range(self.GetKeyCount()))
+
+        Track.RotationKeys = Animation.__GetKeyArray(self.RotationKeys, 4)
+        # DirectX expects the opposite rotation direction
+        Track.RotationKeys[:, 0] *= -1.0
+        Track.ScaleKeys = Animation.__GetKeyArray(self.ScaleKeys, 3)
+        Track.PositionKeys = Animation.__GetKeyArray(self.PositionKeys, 3)
+
+        return Track
+
+    # "Private" Methods
+
+    # Keys are either lists of mathutils objects or (Keys, Columns) arrays
+    @staticmethod
+    def __GetKeyArray(Keys, Columns):
+        if isinstance(Keys, numpy.ndarray):
+            return x_scene.FloatArray(Keys, Columns).copy()
+        return x_scene.FloatArray([tuple(Key) for Key in Keys], Columns)
+
+
+# Shape key weights of a mesh object, one row per key
+class MorphAnimation:
+    def __init__(self, SafeName, TargetNames):
+        self.SafeName = SafeName
+        self.TargetNames = TargetNames
+
+        self.Weights = []
+
+    # "Public" Interface
+
+    def GetKeyCount(self):
+        return len(self.Weights)
+
+    # Converts the keys into an x_scene.MorphTrack
+    def GetTrack(self):
+        return x_scene.MorphTrack(self.SafeName, self.TargetNames,
+            range(self.GetKeyCount()), self.Weights)
+
+
+# Animation whose keys were already sampled, e.g. by a worker process
+class BakedAnimation:
+    def __init__(self, Track):
+        self.SafeName = Track.FrameName
+        self.Track = Track
+
+    # "Public" Interface
+
+    def GetKeyCount(self):
+        return self.Track.GetKeyCount()
+
+    def GetTrack(self):
+        return self.Track
+
 
 # Creates a list of Animation objects based on the animation needs of the
 # ExportObject passed to it
@@ -1018,6 +1664,52 @@ class GroupAnimationGenerator(AnimationGenerator):
                 self.Animations += TemporaryGenerator.Animations
 
 
+# Creates one MorphAnimation with the shape key weights of the
+# MeshExportObject, playing Action on its shape keys if given
+class ShapeKeyAnimationGenerator(AnimationGenerator):
+    def __init__(self, Config, SafeName, ExportObject, Action=None):
+        AnimationGenerator.__init__(self, Config, SafeName, ExportObject)
+        self.Action = Action
+
+        self._GenerateKeys()
+
+    # "Protected" Interface
+
+    def _GenerateKeys(self):
+        Scene = bpy.context.scene # Convenience alias
+        BlenderCurrentFrame = Scene.frame_current
+
+        Key = Util.GetShapeKeys(self.ExportObject.BlenderObject)
+
+        # Keep track of the key's animation data so we can restore it
+        OldAction = None
+        NoData = Key.animation_data is None
+        if self.Action is not None:
+            if NoData:
+                Key.animation_data_create()
+            OldAction = Key.animation_data.action
+            Key.animation_data.action = self.Action
+
+        # The basis has no target, see MeshExportObject
+        Blocks = Key.key_blocks[1:]
+        CurrentAnimation = MorphAnimation(self.ExportObject.SafeName,
+            [Util.SafeName(Block.name) for Block in Blocks])
+
+        for Frame in range(Scene.frame_start, Scene.frame_end + 1):
+            Scene.frame_set(Frame)
+
+            CurrentAnimation.Weights.append([Block.value
+                for Block in Blocks])
+
+        self.Animations.append(CurrentAnimation)
+        Scene.frame_set(BlenderCurrentFrame)
+
+        if self.Action is not None:
+            Key.animation_data.action = OldAction
+            if NoData:
+                Key.animation_data_clear()
+
+
 # Creates an Animation object for the ArmatureExportObject it gets passed and
 # an Animation object for each bone in the armature (if options allow)
 class ArmatureAnimationGenerator(GenericAnimationGenerator):
@@ -1031,44 +1723,52 @@ class ArmatureAnimationGenerator(GenericAnimationGenerator):
     # "Protected" Interface
     
     def _GenerateBoneKeys(self):
-        from itertools import zip_longest as zip
-        
         Scene = bpy.context.scene # Convenience alias
         BlenderCurrentFrame = Scene.frame_current
         
         ArmatureObject = self.ExportObject.BlenderObject
         ArmatureSafeName = self.ExportObject.SafeName
+        Bones = ArmatureBones(ArmatureObject)
+        if not Bones.Names:
+            return
         
-        # Create Animation objects for each bone
-        BoneAnimations = [Animation(ArmatureSafeName + "_" + \
-            Util.SafeName(Bone.name)) for Bone in ArmatureObject.pose.bones]
-        
+        # Only read the pose of all bones per frame, then do the math for
+        # all frames at once
+        PoseMatrices = []
+        Rotations = []
         for Frame in range(Scene.frame_start, Scene.frame_end + 1):
             Scene.frame_set(Frame)
             
-            for Bone, BoneAnimation in \
-                zip(ArmatureObject.pose.bones, BoneAnimations):
-                
-                Rotation = ArmatureObject.data.bones[Bone.name] \
-                    .matrix.to_quaternion() * \
-                    Bone.rotation_quaternion
-                
-                PoseMatrix = Matrix()
-                if Bone.parent:
-                    PoseMatrix = Bone.parent.matrix.inverted()
-                PoseMatrix *= Bone.matrix
-                
-                Scale = PoseMatrix.to_scale()
-                Position = PoseMatrix.to_translation()
-                
-                BoneAnimation.RotationKeys.append(Rotation)
-                BoneAnimation.ScaleKeys.append(Scale)
-                BoneAnimation.PositionKeys.append(Position)
+            PoseMatrices.append(Bones.GetPoseMatrices())
+            Rotations.append(Bones.GetPoseRotations())
+        
+        # (Frames, Bones, ...) arrays
+        PoseMatrices = numpy.array(PoseMatrices).reshape(-1,
+            len(Bones.Names), 4, 4)
+        Rotations = numpy.array(Rotations).reshape(-1, len(Bones.Names), 4)
+        Scales, Positions = ArmatureBones.Decompose(
+            Bones.GetLocalMatrices(PoseMatrices))
+        
+        # Create Animation objects for each bone
+        for Index, Name in enumerate(Bones.Names):
+            BoneAnimation = Animation(ArmatureSafeName + "_" + \
+                Util.SafeName(Name))
+            BoneAnimation.RotationKeys = Rotations[:, Index]
+            BoneAnimation.ScaleKeys = Scales[:, Index]
+            BoneAnimation.PositionKeys = Positions[:, Index]
+            self.Animations.append(BoneAnimation)
         
-        self.Animations += BoneAnimations
         Scene.frame_set(BlenderCurrentFrame)
 
 
+# Provides the tracks of an x_scene.AnimationSet that was sampled elsewhere
+class BakedAnimationGenerator(AnimationGenerator):
+    def __init__(self, Config, Set):
+        AnimationGenerator.__init__(self, Config, Set.Name, None)
+
+        self.Animations = [BakedAnimation(Track) for Track in Set.Tracks]
+
+
 # Container for all AnimationGenerators that belong in a single AnimationSet
 class AnimationSet:
     def __init__(self, SafeName, AnimationGenerators):
@@ -1076,7 +1776,7 @@ class AnimationSet:
         self.AnimationGenerators = AnimationGenerators
 
 
-# Writes all animation data to file.  Implementations will control the
+# Writes all animation data to the scene.  Implementations will control the
 # separation of AnimationGenerators into distinct AnimationSets.
 class AnimationWriter:
     def __init__(self, Config, Exporter, AnimationGenerators):
@@ -1090,110 +1790,36 @@ class AnimationWriter:
     
     # Writes all AnimationSets.  Implementations probably won't have to override
     # this method.
-    def WriteAnimationSets(self):
+    def WriteAnimationSets(self, Scene):
         if self.Config.IncludeFrameRate:
             self.Exporter.Log("Writing frame rate...")
-            self.__WriteFrameRate()
+            Scene.FrameRate = self.__GetFrameRate()
             self.Exporter.Log("Done")
             
         for Set in self.AnimationSets:
             self.Exporter.Log("Writing animation set {}".format(Set.SafeName))
-            self.Exporter.File.Write("AnimationSet {} {{\n".format(
-                Set.SafeName))
-            self.Exporter.File.Indent()
+            ExportSet = x_scene.AnimationSet(Set.SafeName)
             
             # Write each animation of each generator
             for Generator in Set.AnimationGenerators:
                 for CurrentAnimation in Generator.Animations:
-                    self.Exporter.Log("Writing animation of {}".format(
-                        CurrentAnimation.SafeName))
-                    self.Exporter.File.Write("Animation {\n")
-                    self.Exporter.File.Indent()
-                    self.Exporter.File.Write("{{{}}}\n".format(
-                        CurrentAnimation.SafeName))
-                    
-                    KeyCount = CurrentAnimation.GetKeyCount()
-                    
-                    # Write rotation keys
-                    self.Exporter.File.Write("AnimationKey { // Rotation\n");
-                    self.Exporter.File.Indent()
-                    self.Exporter.File.Write("0;\n")
-                    self.Exporter.File.Write("{};\n".format(KeyCount))
-                    
-                    for Frame, Key in enumerate(CurrentAnimation.RotationKeys):
-                        self.Exporter.File.Write(
-                            "{};4;{:9f},{:9f},{:9f},{:9f};;".format(
-                            Frame, -Key[0], Key[1], Key[2], Key[3]))
-                        
-                        if Frame == KeyCount - 1:
-                            self.Exporter.File.Write(";\n", Indent=False)
-                        else:
-                            self.Exporter.File.Write(",\n", Indent=False)
-                    
-                    self.Exporter.File.Unindent()
-                    self.Exporter.File.Write("}\n")
-                    
-                    # Write scale keys
-                    self.Exporter.File.Write("AnimationKey { // Scale\n");
-                    self.Exporter.File.Indent()
-                    self.Exporter.File.Write("1;\n")
-                    self.Exporter.File.Write("{};\n".format(KeyCount))
-                    
-                    for Frame, Key in enumerate(CurrentAnimation.ScaleKeys):
-                        self.Exporter.File.Write(
-                            "{};3;{:9f},{:9f},{:9f};;".format(
-                            Frame, Key[0], Key[1], Key[2]))
-                        
-                        if Frame == KeyCount - 1:
-                            self.Exporter.File.Write(";\n", Indent=False)
-                        else:
-                            self.Exporter.File.Write(",\n", Indent=False)
-                    
-                    self.Exporter.File.Unindent()
-                    self.Exporter.File.Write("}\n")
-                    
-                    # Write position keys
-                    self.Exporter.File.Write("AnimationKey { // Position\n");
-                    self.Exporter.File.Indent()
-                    self.Exporter.File.Write("2;\n")
-                    self.Exporter.File.Write("{};\n".format(KeyCount))
-                    
-                    for Frame, Key in enumerate(CurrentAnimation.PositionKeys):
-                        self.Exporter.File.Write(
-                            "{};3;{:9f},{:9f},{:9f};;".format(
-                            Frame, Key[0], Key[1], Key[2]))
-                        
-                        if Frame == KeyCount - 1:
-                            self.Exporter.File.Write(";\n", Indent=False)
-                        else:
-                            self.Exporter.File.Write(",\n", Indent=False)
-                    
-                    self.Exporter.File.Unindent()
-                    self.Exporter.File.Write("}\n")
-                    
-                    self.Exporter.File.Unindent()
-                    self.Exporter.File.Write("}\n")
-                    self.Exporter.Log("Done")
+                    Track = CurrentAnimation.GetTrack()
+                    if isinstance(Track, x_scene.MorphTrack):
+                        ExportSet.MorphTracks.append(Track)
+                    else:
+                        ExportSet.Tracks.append(Track)
                     
-            self.Exporter.File.Unindent()
-            self.Exporter.File.Write("}} // End of AnimationSet {}\n".format(
-                Set.SafeName))
+            Scene.AnimationSets.append(ExportSet)
             self.Exporter.Log("Done writing animation set {}".format(
                 Set.SafeName))
     
     # "Private" Methods
     
-    def __WriteFrameRate(self):
+    def __GetFrameRate(self):
         Scene = bpy.context.scene # Convenience alias
         
         # Calculate the integer frame rate
-        FrameRate = int(Scene.render.fps / Scene.render.fps_base)
-        
-        self.Exporter.File.Write("AnimTicksPerSecond {\n");
-        self.Exporter.File.Indent()
-        self.Exporter.File.Write("{};\n".format(FrameRate))
-        self.Exporter.File.Unindent()
-        self.Exporter.File.Write("}\n")
+        return int(Scene.render.fps / Scene.render.fps_base)
 
 # Implementation of AnimationWriter that sticks all generators into a
 # single AnimationSet
@@ -1213,39 +1839,6 @@ class SplitSetAnimationWriter(AnimationWriter):
             for Generator in AnimationGenerators]
 
 
-# Interface to the file.  Supports automatic whitespace indenting.
-class File:
-    def __init__(self, FilePath):
-        self.FilePath = FilePath
-        self.File = None
-        self.__Whitespace = 0
-
-    def Open(self):
-        if not self.File:
-            self.File = open(self.FilePath, 'w')
-
-    def Close(self):
-        self.File.close()
-        self.File = None
-
-    def Write(self, String, Indent=True):
-        if Indent:
-            # Escape any formatting braces
-            String = String.replace("{", "{{")
-            String = String.replace("}", "}}")
-            self.File.write(("{}" + String).format("  " * self.__Whitespace))
-        else:
-            self.File.write(String)
-
-    def Indent(self, Levels=1):
-        self.__Whitespace += Levels
-
-    def Unindent(self, Levels=1):
-        self.__Whitespace -= Levels
-        if self.__Whitespace < 0:
-            self.__Whitespace = 0
-
-
 # Static utilities
 class Util:
     @staticmethod
@@ -1265,16 +1858,106 @@ class Util:
             NewName = "_" + NewName
         return NewName
 
+    # Converts a Blender (column vector) matrix into a DirectX (row vector)
+    # array
+    @staticmethod
+    def ConvertMatrix(Matrix):
+        return x_scene.FloatArray([tuple(Row) for Row in Matrix]).T.copy()
+
+    # Returns the pixels of a bpy Image as a (Height, Width, Channels) float
+    # array, top row first
+    @staticmethod
+    def GetImagePixels(Image):
+        Width, Height = Image.size
+        Pixels = numpy.array(Image.pixels[:], dtype=numpy.float32)
+        # Blender stores the bottom row first
+        return Pixels.reshape(Height, Width, Image.channels)[::-1]
+
+    # The shape keys of a mesh object, or None if it has no keys besides
+    # the basis
+    @staticmethod
+    def GetShapeKeys(BlenderObject):
+        if BlenderObject.type != 'MESH':
+            return None
+        Key = BlenderObject.data.shape_keys
+        if Key is None or len(Key.key_blocks) < 2:
+            return None
+        return Key
+
+    # Actions that animate the bones of an armature
+    @staticmethod
+    def GetPoseActions():
+        return [Action for Action in bpy.data.actions
+            if Action.id_root == 'OBJECT' and any(
+            Curve.data_path.startswith("pose.bones")
+            for Curve in Action.fcurves)]
+
+    # Actions that animate the key blocks of Key
+    @staticmethod
+    def GetShapeKeyActions(Key):
+        Paths = set("key_blocks[\"{}\"]".format(Block.name)
+            for Block in Key.key_blocks)
+        return [Action for Action in bpy.data.actions
+            if Action.id_root == 'KEY' and any(
+            Curve.data_path.rpartition(".")[0] in Paths
+            for Curve in Action.fcurves)]
+
+    # Reads the attribute of every item in a bpy collection into a flat
+    # array, or an array with Columns columns.
+    @staticmethod
+    def GetArray(Collection, Attribute, Type, Columns=1):
+        Array = numpy.empty(len(Collection) * Columns, dtype=Type)
+        Collection.foreach_get(Attribute, Array)
+        if Columns > 1:
+            Array = Array.reshape(-1, Columns)
+        return Array
+
+    # Reads a matrix property of every item into a (Items, 4, 4) float64
+    # array.  foreach_get flattens Blender's matrices column by column, so
+    # each block comes out transposed, which is the layout ConvertMatrix
+    # produces.
+    @staticmethod
+    def GetMatrices(Collection, Attribute):
+        return Util.GetArray(Collection, Attribute, numpy.float64,
+            16).reshape(-1, 4, 4)
+
+    # Hamilton products of (..., 4) w, x, y, z quaternion arrays, like
+    # Quaternion * Quaternion
+    @staticmethod
+    def MultiplyQuaternions(A, B):
+        AW, AX, AY, AZ = numpy.moveaxis(A, -1, 0)
+        BW, BX, BY, BZ = numpy.moveaxis(B, -1, 0)
+        return numpy.stack((
+            AW * BW - AX * BX - AY * BY - AZ * BZ,
+            AW * BX + AX * BW + AY * BZ - AZ * BY,
+            AW * BY - AX * BZ + AY * BW + AZ * BX,
+            AW * BZ + AX * BY - AY * BX + AZ * BW), axis=-1)
+
+    # Exclusive prefix sum, i.e. the start of each run of the given sizes
+    @staticmethod
+    def GetOffsets(Sizes):
+        Offsets = numpy.zeros(len(Sizes), dtype=numpy.int64)
+        if len(Sizes):
+            numpy.cumsum(Sizes[:-1], out=Offsets[1:])
+        return Offsets
+
+    # Concatenates range(Start, Start + Size) for each Start, Size pair
+    @staticmethod
+    def ExpandRanges(Starts, Sizes):
+        Sizes = numpy.asarray(Sizes, dtype=numpy.int64)
+        Total = int(Sizes.sum())
+        Offsets = Util.GetOffsets(Sizes)
+        return numpy.repeat(numpy.asarray(Starts, dtype=numpy.int64) -
+            Offsets, Sizes) + numpy.arange(Total, dtype=numpy.int64)
+
+    # Reverses the order of the indexes within each polygon
     @staticmethod
-    def WriteMatrix(File, Matrix):
-        File.Write("{:9f},{:9f},{:9f},{:9f},\n".format(Matrix[0][0],
-            Matrix[1][0], Matrix[2][0], Matrix[3][0]))
-        File.Write("{:9f},{:9f},{:9f},{:9f},\n".format(Matrix[0][1],
-            Matrix[1][1], Matrix[2][1], Matrix[3][1]))
-        File.Write("{:9f},{:9f},{:9f},{:9f},\n".format(Matrix[0][2],
-            Matrix[1][2], Matrix[2][2], Matrix[3][2]))
-        File.Write("{:9f},{:9f},{:9f},{:9f};;\n".format(Matrix[0][3],
-            Matrix[1][3], Matrix[2][3], Matrix[3][3]))
+    def ReverseWinding(Indexes, Sizes):
+        Sizes = numpy.asarray(Sizes, dtype=numpy.int64)
+        Offsets = Util.GetOffsets(Sizes)
+        Source = numpy.repeat(2 * Offsets + Sizes - 1, Sizes) - \
+            numpy.arange(int(Sizes.sum()), dtype=numpy.int64)
+        return numpy.asarray(Indexes, dtype=numpy.int32)[Source]
     
     # Used on lists of blender objects and lists of ExportObjects, both of
     # which have a name field
@@ -0,0 +1,241 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Packs the textures of several materials into one atlas so that meshes
+# need fewer materials, and so fewer draw calls and texture switches.
+#
+# The UVs of the faces using an atlased texture are moved into its region of
+# the atlas, and materials that only differed in their texture are merged.
+# A texture is only atlased for a material if all of the material's UVs lie
+# within 0 - 1, as tiling cannot be reproduced inside an atlas, and if none
+# of its vertices are shared with faces of another material.  Works on
+# x_scene meshes and does not depend on Blender.
+
+import numpy
+
+try:
+    from . import x_scene
+except (ImportError, ValueError, SystemError):
+    import x_scene
+
+# Pixels around each texture, filled with its edge pixels, so that filtering
+# and mipmaps do not bleed between neighbours
+DEFAULT_PADDING = 4
+# UVs this far outside of 0 - 1 still count as inside
+UV_TOLERANCE = 1e-4
+
+
+class Atlas:
+    def __init__(self, Name, Pixels):
+        self.Name = Name
+        # (Height, Width, 4) floats, top row first
+        self.Pixels = Pixels
+        # Maps texture file names to their (X, Y, Width, Height) in pixels
+        self.Regions = {}
+        # The merged materials that use the atlas.  Their TextureFilename is
+        # set once the atlas is written.
+        self.Materials = []
+
+    def __repr__(self):
+        return "[Atlas: %s]" % self.Name
+
+
+# "Public" Interface
+
+# Packs rectangles of the given (Width, Height) Sizes, each surrounded by
+# Padding pixels, into a power of two sized area, row by row.  Returns the
+# area's width and height and the (X, Y) of each rectangle.
+def PackRectangles(Sizes, Padding=DEFAULT_PADDING):
+    Padded = [(Width + 2 * Padding, Height + 2 * Padding)
+        for Width, Height in Sizes]
+    if not Padded:
+        return 1, 1, []
+    Area = sum(Width * Height for Width, Height in Padded)
+    Width = _PowerOfTwo(max(max(Width for Width, Height in Padded),
+        int(numpy.ceil(numpy.sqrt(Area)))))
+
+    # Wider areas may pack tighter, keep the smallest
+    Best = None
+    for Candidate in (Width, Width * 2):
+        Height, Positions = _PackShelves(Padded, Candidate)
+        Height = _PowerOfTwo(Height)
+        if Best is None or Candidate * Height < Best[0] * Best[1]:
+            Best = (Candidate, Height, Positions)
+
+    Width, Height, Positions = Best
+    return Width, Height, [(X + Padding, Y + Padding) for X, Y in Positions]
+
+
+# Builds an atlas called Name from the textures of Meshes, and remaps and
+# merges the meshes' materials to use it.  LoadPixels(TextureFilename)
+# returns a texture as a (Height, Width, 4) float array, top row first, or
+# None if it cannot be loaded.  Returns None, changing nothing, unless at
+# least two textures can share an atlas.
+def BuildAtlas(Meshes, Name, LoadPixels, Padding=DEFAULT_PADDING):
+    # (Mesh, material index) pairs that can use the atlas, and the textures
+    # they need
+    Uses = []
+    Textures = []
+    for Mesh in Meshes:
+        for Index in _GetAtlasMaterials(Mesh):
+            Uses.append((Mesh, Index))
+            TextureFilename = Mesh.Materials[Index].TextureFilename
+            if TextureFilename not in Textures:
+                Textures.append(TextureFilename)
+
+    Images = {}
+    for TextureFilename in Textures:
+        Pixels = LoadPixels(TextureFilename)
+        if Pixels is not None:
+            Images[TextureFilename] = numpy.asarray(Pixels,
+                dtype=numpy.float32)
+    if len(Images) < 2:
+        return None
+    Textures = [TextureFilename for TextureFilename in Textures
+        if TextureFilename in Images]
+    Uses = [(Mesh, Index) for Mesh, Index in Uses
+        if Mesh.Materials[Index].TextureFilename in Images]
+
+    Width, Height, Positions = PackRectangles([(Images[Texture].shape[1],
+        Images[Texture].shape[0]) for Texture in Textures], Padding)
+    Result = Atlas(Name, numpy.zeros((Height, Width, 4),
+        dtype=numpy.float32))
+    for Texture, (X, Y) in zip(Textures, Positions):
+        Image = Images[Texture]
+        Result.Pixels[Y - Padding:Y + Image.shape[0] + Padding,
+            X - Padding:X + Image.shape[1] + Padding] = numpy.pad(Image,
+            ((Padding, Padding), (Padding, Padding), (0, 0)), mode='edge')
+        Result.Regions[Texture] = (X, Y, Image.shape[1], Image.shape[0])
+
+    # Merged materials by their colors, shared by all meshes
+    Merged = {}
+    for Mesh in Meshes:
+        Indexes = [Index for UseMesh, Index in Uses if UseMesh is Mesh]
+        if Indexes:
+            _RemapMesh(Mesh, Indexes, Result, Merged)
+    return Result
+
+
+# "Private" Methods
+
+def _PowerOfTwo(Size):
+    Power = 1
+    while Power < Size:
+        Power *= 2
+    return Power
+
+
+# Places rectangles, tallest first, on shelves of the given width.  Returns
+# the total height and the position of each rectangle.
+def _PackShelves(Sizes, Width):
+    Order = sorted(range(len(Sizes)), key=lambda Index: -Sizes[Index][1])
+    Positions = [None] * len(Sizes)
+    X = Y = ShelfHeight = 0
+    for Index in Order:
+        RectangleWidth, RectangleHeight = Sizes[Index]
+        if X + RectangleWidth > Width:
+            X = 0
+            Y += ShelfHeight
+            ShelfHeight = 0
+        Positions[Index] = (X, Y)
+        X += RectangleWidth
+        ShelfHeight = max(ShelfHeight, RectangleHeight)
+    return Y + ShelfHeight, Positions
+
+
+# Indexes of the textured materials of Mesh whose faces can be atlased
+def _GetAtlasMaterials(Mesh):
+    if not Mesh.Materials or Mesh.TextureCoords is None or \
+        Mesh.MaterialIndices is None:
+        return []
+
+    CornerMaterials = numpy.repeat(numpy.asarray(Mesh.MaterialIndices),
+        Mesh.FaceSizes)
+    Vertexes = numpy.asarray(Mesh.FaceIndices)
+    TextureCoords = numpy.asarray(Mesh.TextureCoords)
+
+    # Materials whose vertices are also used by faces of another material
+    Pairs = numpy.unique(Vertexes.astype(numpy.int64) * len(Mesh.Materials) +
+        CornerMaterials)
+    PairVertexes = Pairs // len(Mesh.Materials)
+    Shared = numpy.zeros(len(Pairs), dtype=bool)
+    Shared[1:] = PairVertexes[1:] == PairVertexes[:-1]
+    Shared[:-1] |= Shared[1:]
+    SharedMaterials = set(Pairs[Shared] % len(Mesh.Materials))
+
+    Indexes = []
+    for Index, Material in enumerate(Mesh.Materials):
+        if not Material.TextureFilename or Index in SharedMaterials:
+            continue
+        Used = Vertexes[CornerMaterials == Index]
+        if not len(Used):
+            continue
+        UVs = TextureCoords[Used]
+        if UVs.min() >= -UV_TOLERANCE and UVs.max() <= 1 + UV_TOLERANCE:
+            Indexes.append(Index)
+    return Indexes
+
+
+# Moves the UVs of the faces using the materials at Indexes into the atlas
+# and replaces those materials with merged ones
+def _RemapMesh(Mesh, Indexes, Result, Merged):
+    Height, Width = Result.Pixels.shape[:2]
+    CornerMaterials = numpy.repeat(numpy.asarray(Mesh.MaterialIndices),
+        Mesh.FaceSizes)
+    Vertexes = numpy.asarray(Mesh.FaceIndices)
+    TextureCoords = numpy.array(Mesh.TextureCoords, dtype=numpy.float32)
+
+    Materials = list(Mesh.Materials)
+    for Index in Indexes:
+        Material = Mesh.Materials[Index]
+        X, Y, RegionWidth, RegionHeight = \
+            Result.Regions[Material.TextureFilename]
+        Used = numpy.unique(Vertexes[CornerMaterials == Index])
+        TextureCoords[Used] = numpy.clip(TextureCoords[Used], 0, 1) * \
+            (float(RegionWidth) / Width, float(RegionHeight) / Height) + \
+            (float(X) / Width, float(Y) / Height)
+
+        Key = (tuple(numpy.round(Material.Diffuse, 6)),
+            round(float(Material.Power), 6),
+            tuple(numpy.round(Material.Specular, 6)),
+            tuple(numpy.round(Material.Emissive, 6)))
+        if Key not in Merged:
+            Name = Result.Name
+            if Merged:
+                Name = "%s_%d" % (Result.Name, len(Merged))
+            Combined = x_scene.Material(Name)
+            Combined.Diffuse = Material.Diffuse
+            Combined.Power = Material.Power
+            Combined.Specular = Material.Specular
+            Combined.Emissive = Material.Emissive
+            Merged[Key] = Combined
+            Result.Materials.append(Combined)
+        Materials[Index] = Merged[Key]
+    Mesh.TextureCoords = TextureCoords
+
+    # Drop the duplicates the merge left behind
+    Unique = []
+    Remap = numpy.empty(len(Materials), dtype=numpy.int32)
+    for Index, Material in enumerate(Materials):
+        if Material not in Unique:
+            Unique.append(Material)
+        Remap[Index] = Unique.index(Material)
+    Mesh.Materials = Unique
+    Mesh.MaterialIndices = Remap[numpy.asarray(Mesh.MaterialIndices)]
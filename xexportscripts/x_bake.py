@@ -0,0 +1,149 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Samples actions in background Blender processes.  Each worker opens the
+# saved .blend file, plays a subset of the actions on an armature with the
+# exporter's own ArmatureAnimationGenerator and saves the resulting
+# AnimationSets as a scene snapshot (see x_snapshot.py) that the exporter
+# loads back.
+#
+# Only the standard library is imported at module level: in a worker this
+# file runs as a script and imports the add-on package itself.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+class BakeError(Exception):
+    pass
+
+
+# "Public" Interface
+
+# Samples the actions named ActionNames on the armature object ArmatureName
+# using Jobs worker processes.  Options is the exporter's options dict, as
+# passed to export_x.ExportConfig.  Returns one x_scene.AnimationSet per
+# action, in the order of ActionNames.
+def BakeActions(BlenderPath, BlendPath, SceneName, ArmatureName, ActionNames,
+    Options, Jobs):
+    from . import x_snapshot
+
+    Jobs = max(1, min(Jobs, len(ActionNames)))
+    Directory = tempfile.mkdtemp(prefix="xbake")
+    Workers = []
+    try:
+        for Job in range(Jobs):
+            # Deal the actions out in turn so long and short ones mix
+            Request = {
+                "Package" : __package__,
+                "PackageParent" : os.path.dirname(os.path.dirname(
+                    os.path.abspath(__file__))),
+                "Scene" : SceneName,
+                "Armature" : ArmatureName,
+                "Actions" : ActionNames[Job::Jobs],
+                "Options" : Options,
+                "Output" : os.path.join(Directory, "{}.xsnap".format(Job))}
+
+            LogFile = open(os.path.join(Directory, "{}.log".format(Job)),
+                'w')
+            try:
+                Process = subprocess.Popen([BlenderPath, "--background",
+                    BlendPath, "--python", os.path.abspath(__file__), "--",
+                    json.dumps(Request)], stdout=LogFile,
+                    stderr=subprocess.STDOUT)
+            except OSError as Error:
+                raise BakeError("Cannot start {}: {}".format(BlenderPath,
+                    Error))
+            finally:
+                LogFile.close()
+            Workers.append((Process, Request))
+
+        SetsByAction = {}
+        for Process, Request in Workers:
+            Process.wait()
+
+            # Blender's exit code does not reflect script errors, so a
+            # missing snapshot is the only reliable sign of failure
+            if not os.path.isdir(Request["Output"]):
+                with open(os.path.splitext(Request["Output"])[0] + ".log",
+                    'r') as LogFile:
+                    Log = LogFile.read()
+                raise BakeError("Bake worker failed:\n{}".format(
+                    Log[-2000:]))
+
+            Sets = x_snapshot.Load(Request["Output"],
+                MemoryMap=False).AnimationSets
+            SetsByAction.update(zip(Request["Actions"], Sets))
+
+        return [SetsByAction[Name] for Name in ActionNames]
+    finally:
+        # Workers still running after a failure would keep writing into
+        # Directory, and on Windows keep it from being removed
+        for Process, Request in Workers:
+            if Process.poll() is None:
+                Process.kill()
+            Process.wait()
+        shutil.rmtree(Directory, ignore_errors=True)
+
+
+# Worker entry point, runs inside a background Blender process
+def Main(Arguments):
+    import importlib
+
+    import bpy
+
+    Request = json.loads(Arguments[0])
+
+    sys.path.insert(0, Request["PackageParent"])
+    export_x = importlib.import_module(Request["Package"] + ".export_x")
+    x_scene = importlib.import_module(Request["Package"] + ".x_scene")
+    x_snapshot = importlib.import_module(Request["Package"] + ".x_snapshot")
+
+    # The generators sample bpy.context.scene
+    if bpy.context.scene.name != Request["Scene"]:
+        raise BakeError("Scene {} is not the active scene of {}".format(
+            Request["Scene"], bpy.data.filepath))
+
+    ArmatureObject = bpy.data.objects[Request["Armature"]]
+    if ArmatureObject.animation_data is None:
+        ArmatureObject.animation_data_create()
+
+    Config = export_x.ExportConfig(Request["Options"])
+    ExportObject = export_x.ArmatureExportObject(Config, None,
+        ArmatureObject)
+
+    Result = x_scene.Scene()
+    for ActionName in Request["Actions"]:
+        ArmatureObject.animation_data.action = bpy.data.actions[ActionName]
+        Generator = export_x.ArmatureAnimationGenerator(Config,
+            export_x.Util.SafeName(ActionName), ExportObject)
+        Result.AnimationSets.append(x_scene.AnimationSet(Generator.SafeName,
+            [Animation.GetTrack() for Animation in Generator.Animations]))
+
+    x_snapshot.Save(Result, Request["Output"])
+
+
+if __name__ == "__main__":
+    # Blender passes the arguments after "--" through to the script
+    Main(sys.argv[sys.argv.index("--") + 1:])
@@ -0,0 +1,306 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Precomputes bounding volumes so the game can cull and hit-test without
+# scanning vertices at load time.  The bounds are saved as a JSON sidecar
+# next to the exported file:
+#
+#   Meshes          box and sphere of each mesh, in the space of its frame
+#   Frames          box and sphere of everything below each frame, in the
+#                   space of that frame
+#   Bones           box and sphere of the vertices each bone influences, in
+#                   bone space, i.e. after the skin offset matrix
+#   AnimationSets   box and sphere of everything over all keys of the set,
+#                   in the space the top level frames are placed in
+#
+# Boxes are "Min" and "Max" corners, spheres a "Center" and "Radius".
+# Animated bounds move the bone and frame boxes rather than every vertex,
+# so they are conservative.  Morph targets count at full weight, one at a
+# time.  Instances count toward the frame that holds their table, through
+# the corners of their prototype's box.  Does not depend on Blender.
+
+import json
+
+import numpy
+
+try:
+    from . import x_file
+    from . import x_scene
+except (ImportError, ValueError, SystemError):
+    import x_file
+    import x_scene
+
+BOUNDS_VERSION = 1
+
+# Passes of the sphere fit before falling back to the farthest point
+SPHERE_ITERATIONS = 64
+
+
+# "Public" Interface
+
+# Returns the (Min, Max) corners of Points, or None if there are none
+def BoundingBox(Points):
+    Points = numpy.asarray(Points, dtype=numpy.float64).reshape(-1, 3)
+    if not len(Points):
+        return None
+    return Points.min(axis=0), Points.max(axis=0)
+
+
+# Returns a (Center, Radius) sphere around Points, or None if there are
+# none.  Grows Ritter's sphere towards the farthest point outside it until
+# every point is inside, then keeps it or the sphere around the bounding
+# box, whichever is smaller.
+def BoundingSphere(Points):
+    Points = numpy.asarray(Points, dtype=numpy.float64).reshape(-1, 3)
+    if not len(Points):
+        return None
+
+    def Distances(Center):
+        return numpy.sqrt(((Points - Center) ** 2).sum(axis=1))
+
+    First = Points[Distances(Points[0]).argmax()]
+    Second = Points[Distances(First).argmax()]
+    Center = (First + Second) / 2
+    Radius = numpy.sqrt(((Second - First) ** 2).sum()) / 2
+    for Iteration in range(SPHERE_ITERATIONS):
+        Distance = Distances(Center)
+        Farthest = Distance.argmax()
+        if Distance[Farthest] <= Radius:
+            break
+        # Move towards the farthest point just enough to include it
+        NewRadius = (Radius + Distance[Farthest]) / 2
+        Center = Center + (Points[Farthest] - Center) * (
+            (Distance[Farthest] - NewRadius) / Distance[Farthest])
+        Radius = NewRadius
+    Radius = Distances(Center).max()
+
+    Minimum, Maximum = BoundingBox(Points)
+    BoxCenter = (Minimum + Maximum) / 2
+    BoxRadius = Distances(BoxCenter).max()
+    if BoxRadius < Radius:
+        return BoxCenter, BoxRadius
+    return Center, Radius
+
+
+# Returns the bounds of Scene as a dictionary ready for JSON
+def ComputeBounds(Scene):
+    Bounds = {
+        "Version" : BOUNDS_VERSION,
+        "Meshes" : [],
+        "Frames" : [],
+        "Bones" : [],
+        "AnimationSets" : []}
+
+    # Bone space boxes per bone, and local boxes per frame, for animation
+    BoneBoxes = {}
+    MeshBoxes = {}
+
+    def AddMesh(Mesh, FrameName):
+        Positions = _GetPositions(Mesh)
+        Entry = _Describe(Positions)
+        if Entry is None:
+            return
+        Entry["Name"] = Mesh.Name
+        Entry["Frame"] = FrameName
+        Bounds["Meshes"].append(Entry)
+
+        if not Mesh.SkinWeights:
+            MeshBoxes.setdefault(FrameName, []).append(
+                BoundingBox(Positions))
+        for Skin in Mesh.SkinWeights:
+            Indices = numpy.asarray(Skin.Indices)[numpy.asarray(
+                Skin.Weights) > 0]
+            BonePositions = _Transform(Positions[_GetMorphedIndices(Mesh,
+                Indices)], Skin.OffsetMatrix)
+            Entry = _Describe(BonePositions)
+            if Entry is None:
+                continue
+            Entry["Name"] = Skin.FrameName
+            Entry["Mesh"] = Mesh.Name
+            Bounds["Bones"].append(Entry)
+            BoneBoxes.setdefault(Skin.FrameName, []).append(
+                BoundingBox(BonePositions))
+
+    # Returns the points below Frame in its own space
+    def AddFrame(Frame):
+        Points = []
+        for Mesh in Frame.Meshes:
+            AddMesh(Mesh, Frame.Name)
+            Points.append(_GetPositions(Mesh))
+        for Table in Frame.Instances:
+            Corners = _Concatenate([_Corners(Box, Matrix)
+                for Box in [BoundingBox(_GetPositions(Mesh))
+                for Mesh in Table.Meshes] if Box is not None
+                for Matrix in Table.GetMatrices()])
+            if len(Corners):
+                MeshBoxes.setdefault(Frame.Name, []).append(
+                    BoundingBox(Corners))
+            Points.append(Corners)
+        for Child in Frame.Children:
+            Points.append(_Transform(AddFrame(Child), Child.Matrix))
+        Points = _Concatenate(Points)
+
+        Entry = _Describe(Points)
+        if Entry is not None:
+            Entry["Name"] = Frame.Name
+            Bounds["Frames"].append(Entry)
+        return Points
+
+    for Mesh in Scene.Meshes:
+        AddMesh(Mesh, None)
+    for Frame in Scene.Frames:
+        AddFrame(Frame)
+
+    # Top level meshes do not move
+    Static = [_Corners(Box, x_scene.IdentityMatrix())
+        for Box in MeshBoxes.get(None, [])]
+    for Set in Scene.AnimationSets:
+        Points = _Concatenate(Static + [_Corners(Box, World) for Pose in
+            _IterPoses(Scene, Set) for Name, World in Pose.items()
+            for Box in MeshBoxes.get(Name, []) + BoneBoxes.get(Name, [])])
+        Entry = _Describe(Points, Tight=False)
+        if Entry is not None:
+            Entry["Name"] = Set.Name
+            Bounds["AnimationSets"].append(Entry)
+
+    return Bounds
+
+
+# Writes the bounds of Scene to Path, replacing it atomically
+def Save(Scene, Path):
+    Bounds = ComputeBounds(Scene)
+    return x_file.Save(Path, lambda File: json.dump(Bounds, File, indent=1,
+        sort_keys=True), 'w')
+
+
+# "Private" Methods
+
+# Box and sphere of Points as a dictionary, or None if there are none.
+# Without Tight the sphere is the one around the box.
+def _Describe(Points, Tight=True):
+    Box = BoundingBox(Points)
+    if Box is None:
+        return None
+    if Tight:
+        Center, Radius = BoundingSphere(Points)
+    else:
+        Center = (Box[0] + Box[1]) / 2
+        Radius = numpy.sqrt(((Box[1] - Box[0]) ** 2).sum()) / 2
+    return {
+        "Min" : Box[0].tolist(),
+        "Max" : Box[1].tolist(),
+        "Center" : numpy.asarray(Center).tolist(),
+        "Radius" : float(Radius)}
+
+
+# The positions of Mesh followed by those its morph targets move them to
+def _GetPositions(Mesh):
+    Positions = numpy.asarray(Mesh.Positions, dtype=numpy.float64)
+    return numpy.concatenate([Positions] + [Positions[Target.Indices] +
+        Target.Offsets for Target in Mesh.MorphTargets])
+
+
+# Indices of the rows of _GetPositions that belong to the vertices Indices
+def _GetMorphedIndices(Mesh, Indices):
+    Result = [Indices]
+    Offset = Mesh.GetVertexCount()
+    for Target in Mesh.MorphTargets:
+        Result.append(numpy.flatnonzero(numpy.isin(Target.Indices,
+            Indices)) + Offset)
+        Offset += len(Target.Indices)
+    return numpy.concatenate(Result)
+
+
+def _Concatenate(Arrays):
+    Arrays = [Array for Array in Arrays if len(Array)]
+    if not Arrays:
+        return numpy.zeros((0, 3))
+    return numpy.concatenate(Arrays)
+
+
+# Points times a row vector matrix
+def _Transform(Points, Matrix):
+    Matrix = numpy.asarray(Matrix, dtype=numpy.float64)
+    return numpy.dot(Points, Matrix[:3, :3]) + Matrix[3, :3]
+
+
+# The eight corners of Box moved by Matrix
+def _Corners(Box, Matrix):
+    Minimum, Maximum = Box
+    Corners = numpy.array([[(Minimum, Maximum)[(Corner >> Axis) & 1][Axis]
+        for Axis in range(3)] for Corner in range(8)])
+    return _Transform(Corners, Matrix)
+
+
+# Yields, for each key time of Set, the world matrix of every frame of
+# Scene by name.  Tracks hold the last key at or before each time.
+def _IterPoses(Scene, Set):
+    Tracks = dict((Track.FrameName, Track) for Track in Set.Tracks)
+    Times = numpy.unique(numpy.concatenate([Track.KeyTimes
+        for Track in Set.Tracks] or [[]])).astype(numpy.int64)
+
+    for Time in Times:
+        Pose = {}
+
+        def Visit(Frame, Parent):
+            Local = Frame.Matrix
+            if Frame.Name in Tracks:
+                Local = _GetTrackMatrix(Tracks[Frame.Name], Time, Local)
+            World = numpy.dot(Local, Parent)
+            Pose[Frame.Name] = World
+            for Child in Frame.Children:
+                Visit(Child, World)
+
+        for Frame in Scene.Frames:
+            Visit(Frame, x_scene.IdentityMatrix())
+        yield Pose
+
+
+# The row vector matrix of Track at Time.  Parts the track has no keys for
+# are taken from Default.
+def _GetTrackMatrix(Track, Time, Default):
+    Key = max(0, numpy.searchsorted(Track.KeyTimes, Time, side='right') - 1)
+    if Track.MatrixKeys is not None:
+        return numpy.asarray(Track.MatrixKeys[Key], dtype=numpy.float64)
+
+    Default = numpy.asarray(Default, dtype=numpy.float64)
+    Scale = numpy.sqrt((Default[:3, :3] ** 2).sum(axis=1))
+    Rotation = Default[:3, :3] / numpy.where(Scale, Scale, 1)[:, None]
+    Position = Default[3, :3]
+    if Track.ScaleKeys is not None:
+        Scale = Track.ScaleKeys[Key]
+    if Track.RotationKeys is not None:
+        # Keys are stored with w negated, which makes the column vector
+        # matrix of the quaternion the row vector matrix of the rotation
+        W, X, Y, Z = Track.RotationKeys[Key]
+        Rotation = numpy.array([
+            [1 - 2 * (Y * Y + Z * Z), 2 * (X * Y - Z * W),
+                2 * (X * Z + Y * W)],
+            [2 * (X * Y + Z * W), 1 - 2 * (X * X + Z * Z),
+                2 * (Y * Z - X * W)],
+            [2 * (X * Z - Y * W), 2 * (Y * Z + X * W),
+                1 - 2 * (X * X + Y * Y)]])
+    if Track.PositionKeys is not None:
+        Position = Track.PositionKeys[Key]
+
+    Matrix = numpy.identity(4)
+    Matrix[:3, :3] = numpy.asarray(Scale)[:, None] * Rotation
+    Matrix[3, :3] = Position
+    return Matrix
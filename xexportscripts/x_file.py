@@ -0,0 +1,73 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Replaces output files atomically, so that a game or tool reloading them
+# never sees a file missing or half written.  Everything is written to a
+# temporary path next to the target first, which then takes its place in a
+# single os.replace.  Does not depend on Blender.
+
+import os
+import shutil
+
+
+# "Public" Interface
+
+# Calls Write with a file opened with Mode at a temporary path, then moves
+# that file over Path.  Nothing is left behind if Write raises.
+def Save(Path, Write, Mode='wb'):
+    TemporaryPath = Path + ".tmp"
+    try:
+        with open(TemporaryPath, Mode) as File:
+            Write(File)
+        Replace(TemporaryPath, Path)
+    finally:
+        if os.path.exists(TemporaryPath):
+            os.remove(TemporaryPath)
+    return Path
+
+
+# Moves the file Source over Path in one step
+def Replace(Source, Path):
+    if hasattr(os, "replace"):
+        os.replace(Source, Path)
+        return
+    # Python 2 has no os.replace.  os.rename replaces atomically on POSIX
+    # and refuses on Windows, where the target has to go first.
+    try:
+        os.rename(Source, Path)
+    except OSError:
+        if not os.path.exists(Path):
+            raise
+        os.remove(Path)
+        os.rename(Source, Path)
+
+
+# Moves the directory Source over the directory Path.  Directories cannot
+# be swapped in one step, so the old one is renamed aside first and only
+# removed once the new one is in place.
+def ReplaceDirectory(Source, Path):
+    OldPath = Path + ".old"
+    if os.path.isdir(OldPath):
+        shutil.rmtree(OldPath)
+    if os.path.isdir(Path):
+        os.rename(Path, OldPath)
+    os.rename(Source, Path)
+    if os.path.isdir(OldPath):
+        shutil.rmtree(OldPath)
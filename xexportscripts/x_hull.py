@@ -0,0 +1,377 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Builds simplified convex collision hulls, so that physics and hit tests
+# touch tens of vertices instead of every vertex of the render meshes.
+#
+# A hull is grown from the four points spanning the most volume by adding
+# the point farthest outside it, until no point is outside or it has
+# MaxVertices vertices, so a budget cuts off the smallest features first.
+# As in quickhull, every face keeps the set of points outside it, so adding
+# a point only measures the points of the faces it replaces against the new
+# faces, instead of every point against every face.
+# A shape that is not convex can be split into up to MaxHulls pieces:
+# the piece whose hull loses the most volume is cut by a plane across one
+# of the axes, faces going to the side their center is on, as long as that
+# removes at least MIN_GAIN of the volume of the single hull.  Flat shapes
+# get no hull.
+#
+# The hulls are saved as a JSON sidecar next to the exported file, each
+# with the name of its frame and, in that frame's space:
+#
+#   Vertices        [x, y, z] of each vertex
+#   Triangles       vertex indexes, the cross product of the first two
+#                   edges pointing outward
+#   Planes          [a, b, c, d] of each triangle, with a x + b y + c z = d
+#                   on the plane and the unit normal (a, b, c) pointing out
+#
+# Does not depend on Blender.
+
+import heapq
+import json
+
+import numpy
+
+try:
+    from . import x_file
+    from . import x_scene
+except (ImportError, ValueError, SystemError):
+    import x_file
+    import x_scene
+
+HULL_VERSION = 1
+
+# Vertices of a hull unless told otherwise
+MAX_VERTICES = 32
+# Fraction of the volume of the single hull a split has to remove
+MIN_GAIN = 0.05
+# Cuts tried along each axis, at these fractions of the faces' centers
+SPLIT_QUANTILES = (0.25, 0.5, 0.75)
+# Distances below this fraction of the size of the points count as zero
+TOLERANCE = 1e-7
+
+
+# "Public" Interface
+
+# Returns the (Vertices, 3) positions and (Triangles, 3) indices of the
+# convex hull of Points with at most MaxVertices vertices, or None if the
+# points are flat
+def ConvexHull(Points, MaxVertices=MAX_VERTICES):
+    Points = numpy.asarray(Points, dtype=numpy.float64).reshape(-1, 3)
+    if len(Points) < 4 or MaxVertices < 4:
+        return None
+    Size = (Points.max(axis=0) - Points.min(axis=0)).max()
+    Epsilon = max(Size * TOLERANCE, 1e-30)
+
+    Simplex = _GetSimplex(Points, Epsilon)
+    if Simplex is None:
+        return None
+    A, B, C, D = Simplex
+    Triangles = [(A, B, C), (A, C, D), (A, D, B), (B, D, C)]
+    if _Volume(Points, Triangles) < 0:
+        Triangles = [(A, C, B), (A, D, C), (A, B, D), (B, C, D)]
+
+    Hull = _Hull(Points, Epsilon)
+    Hull.AddFaces(Triangles, numpy.setdiff1d(numpy.arange(len(Points)),
+        Simplex))
+    while Hull.GetVertexCount() < MaxVertices:
+        Start = Hull.PopFarthest()
+        if Start is None:
+            break
+        Hull.AddPoint(Start)
+
+    Indices = numpy.array(Hull.GetTriangles(), dtype=numpy.int64)
+    Vertices, Remap = numpy.unique(Indices, return_inverse=True)
+    return Points[Vertices], Remap.reshape(-1, 3)
+
+
+# Returns up to MaxHulls (Positions, Triangles) pairs covering the faces of
+# Meshes, all in the same space, each with at most MaxVertices vertices
+def Decompose(Meshes, MaxHulls=1, MaxVertices=MAX_VERTICES,
+    MinGain=MIN_GAIN):
+    # Every face as the positions of its corners
+    Points = numpy.concatenate([numpy.zeros((0, 3))] + [numpy.asarray(
+        Mesh.Positions, dtype=numpy.float64)[Mesh.FaceIndices]
+        for Mesh in Meshes])
+    Sizes = numpy.concatenate([numpy.zeros(0, dtype=numpy.int64)] + [
+        numpy.asarray(Mesh.FaceSizes, dtype=numpy.int64) for Mesh in Meshes])
+    Faces = numpy.repeat(numpy.arange(len(Sizes)), Sizes)
+    Centers = numpy.zeros((len(Sizes), 3))
+    numpy.add.at(Centers, Faces, Points)
+    Centers /= numpy.maximum(Sizes, 1)[:, None]
+
+    # Corners are shared by several faces, so hulls are built from the
+    # distinct positions only
+    Positions, Corners = numpy.unique(Points, axis=0, return_inverse=True)
+    Corners = Corners.reshape(-1)
+
+    def Build(FaceMask):
+        Hull = ConvexHull(Positions[numpy.unique(Corners[FaceMask[Faces]])],
+            MaxVertices)
+        Volume = 0.0
+        if Hull is not None:
+            Volume = _Volume(*Hull)
+        return FaceMask, Hull, Volume
+
+    # The pair of pieces that removes the most volume from Piece, with the
+    # volume removed, or None
+    def Split(Piece):
+        FaceMask, Hull, Volume = Piece
+        Best = None
+        for Axis in range(3):
+            Values = Centers[FaceMask, Axis]
+            for Cut in numpy.unique(numpy.percentile(Values,
+                [100 * Quantile for Quantile in SPLIT_QUANTILES])):
+                Below = FaceMask & (Centers[:, Axis] <= Cut)
+                Above = FaceMask & ~Below
+                if not Below.any() or not Above.any():
+                    continue
+                Pieces = Build(Below), Build(Above)
+                if Pieces[0][1] is None or Pieces[1][1] is None:
+                    continue
+                Gain = Volume - Pieces[0][2] - Pieces[1][2]
+                if Best is None or Gain > Best[0]:
+                    Best = (Gain, Pieces)
+        return Best
+
+    Pieces = [Build(numpy.ones(len(Sizes), dtype=bool))]
+    if Pieces[0][1] is None:
+        return []
+    Threshold = MinGain * Pieces[0][2]
+    Splits = [None]
+    while len(Pieces) < MaxHulls:
+        for Index, Piece in enumerate(Pieces):
+            if Splits[Index] is None:
+                Splits[Index] = Split(Piece) or (-1.0, None)
+        Index = max(range(len(Pieces)), key=lambda Index: Splits[Index][0])
+        Gain, Halves = Splits[Index]
+        if Halves is None or Gain < Threshold:
+            break
+        Pieces[Index:Index + 1] = Halves
+        Splits[Index:Index + 1] = [None, None]
+    return [Piece[1] for Piece in Pieces]
+
+
+# Returns the x_scene.CollisionHulls of Meshes, named after Name
+def ComputeHulls(Name, Meshes, MaxHulls=1, MaxVertices=MAX_VERTICES):
+    Hulls = Decompose(Meshes, MaxHulls, MaxVertices)
+    Result = []
+    for Index, (Positions, Triangles) in enumerate(Hulls):
+        HullName = Name
+        if len(Hulls) > 1:
+            HullName = "%s_%d" % (Name, Index)
+        Result.append(x_scene.CollisionHull(HullName, Positions, Triangles))
+    return Result
+
+
+# Writes the hulls of the frames of Scene to Path, replacing it atomically
+def Save(Scene, Path):
+    Index = {
+        "Version" : HULL_VERSION,
+        "Hulls" : [_Describe(Hull, Frame.Name)
+            for Frame in Scene.IterFrames() for Hull in Frame.Hulls]}
+    return x_file.Save(Path, lambda File: json.dump(Index, File, indent=1,
+        sort_keys=True), 'w')
+
+
+# "Private" Methods
+
+# Indexes of four points spanning a tetrahedron of the largest volume found
+# greedily, or None if all points lie in a plane
+def _GetSimplex(Points, Epsilon):
+    Extremes = numpy.concatenate((Points.argmin(axis=0),
+        Points.argmax(axis=0)))
+    Pairs = [(First, Second) for First in Extremes for Second in Extremes]
+    A, B = max(Pairs, key=lambda Pair: ((Points[Pair[0]] -
+        Points[Pair[1]]) ** 2).sum())
+
+    Direction = Points[B] - Points[A]
+    Length = numpy.sqrt((Direction ** 2).sum())
+    if Length <= Epsilon:
+        return None
+    Across = numpy.cross(Points - Points[A], Direction / Length)
+    C = int(numpy.argmax((Across ** 2).sum(axis=1)))
+    if numpy.sqrt((Across[C] ** 2).sum()) <= Epsilon:
+        return None
+
+    Normal = numpy.cross(Direction, Points[C] - Points[A])
+    Normal /= numpy.sqrt((Normal ** 2).sum())
+    Heights = numpy.abs(numpy.dot(Points - Points[A], Normal))
+    D = int(numpy.argmax(Heights))
+    if Heights[D] <= Epsilon:
+        return None
+    return int(A), int(B), C, D
+
+
+# A face of a hull being built, with the points outside it that are farther
+# outside it than outside any other face added with it
+class _Face:
+    def __init__(self, Id, Triangle, Normal, Offset):
+        self.Id = Id
+        self.Triangle = Triangle
+        self.Normal = Normal
+        self.Offset = Offset
+        self.Outside = numpy.zeros(0, dtype=numpy.int64)
+        self.Distances = numpy.zeros(0)
+
+
+# The faces of a hull being built, with what is needed to replace the faces
+# a point sees without looking at the others
+class _Hull:
+    def __init__(self, Points, Epsilon):
+        self.Points = Points
+        self.Epsilon = Epsilon
+
+        # Faces by the order they were added in
+        self.Faces = {}
+        # The face each directed edge belongs to
+        self.EdgeFaces = {}
+        # Number of faces at each vertex
+        self.VertexFaces = {}
+        # (-distance, id) of the faces with points outside them, for the
+        # farthest of those points.  Entries of removed faces are skipped.
+        self.Queue = []
+        self.NextId = 0
+
+    # "Public" Interface
+
+    def GetVertexCount(self):
+        return len(self.VertexFaces)
+
+    def GetTriangles(self):
+        return [self.Faces[Id].Triangle for Id in sorted(self.Faces)]
+
+    # Returns the face with the point farthest outside the hull, or None if
+    # all points are inside
+    def PopFarthest(self):
+        while self.Queue:
+            Distance, Id = heapq.heappop(self.Queue)
+            if Id in self.Faces:
+                return self.Faces[Id]
+        return None
+
+    # Adds the point farthest outside Start to the hull
+    def AddPoint(self, Start):
+        Point = int(Start.Outside[numpy.argmax(Start.Distances)])
+        Position = self.Points[Point]
+
+        # The faces the point sees are connected, so walk across their
+        # edges from Start, collecting the edges around them
+        Visible = [Start]
+        Seen = set([Start.Id])
+        Horizon = []
+        for Face in Visible:
+            for Edge in _GetEdges(Face.Triangle):
+                Neighbor = self.EdgeFaces[(Edge[1], Edge[0])]
+                if Neighbor.Id in Seen:
+                    continue
+                if numpy.dot(Position, Neighbor.Normal) - Neighbor.Offset > \
+                    self.Epsilon:
+                    Visible.append(Neighbor)
+                    Seen.add(Neighbor.Id)
+                else:
+                    Horizon.append(Edge)
+
+        # Replace the visible faces by a fan from the point to the edges
+        # around them, which take over the points outside them
+        Candidates = numpy.concatenate([Face.Outside for Face in Visible])
+        for Face in Visible:
+            self.__RemoveFace(Face)
+        self.AddFaces([(First, Second, Point) for First, Second in Horizon],
+            Candidates[Candidates != Point])
+
+    # Adds a face for each of Triangles and gives each of the point indexes
+    # Candidates to the new face it is farthest outside of, dropping those
+    # outside none
+    def AddFaces(self, Triangles, Candidates):
+        Normals, Offsets = _GetPlanes(self.Points, Triangles)
+        NewFaces = []
+        for Triangle, Normal, Offset in zip(Triangles, Normals, Offsets):
+            NewFaces.append(_Face(self.NextId, Triangle, Normal, Offset))
+            self.NextId += 1
+
+        if len(Candidates):
+            Distances = numpy.dot(self.Points[Candidates], Normals.T) - \
+                Offsets
+            Best = numpy.argmax(Distances, axis=1)
+            Farthest = Distances[numpy.arange(len(Candidates)), Best]
+            Outside = numpy.flatnonzero(Farthest > self.Epsilon)
+            Outside = Outside[numpy.argsort(Best[Outside], kind='mergesort')]
+            Bounds = numpy.searchsorted(Best[Outside],
+                numpy.arange(len(NewFaces) + 1))
+            for Index, Face in enumerate(NewFaces):
+                Mine = Outside[Bounds[Index]:Bounds[Index + 1]]
+                Face.Outside = Candidates[Mine]
+                Face.Distances = Farthest[Mine]
+
+        for Face in NewFaces:
+            self.Faces[Face.Id] = Face
+            for Edge in _GetEdges(Face.Triangle):
+                self.EdgeFaces[Edge] = Face
+            for Vertex in Face.Triangle:
+                self.VertexFaces[Vertex] = self.VertexFaces.get(Vertex, 0) + 1
+            if len(Face.Outside):
+                heapq.heappush(self.Queue, (-Face.Distances.max(), Face.Id))
+
+    # "Private" Methods
+
+    def __RemoveFace(self, Face):
+        del self.Faces[Face.Id]
+        for Edge in _GetEdges(Face.Triangle):
+            del self.EdgeFaces[Edge]
+        for Vertex in Face.Triangle:
+            self.VertexFaces[Vertex] -= 1
+            if not self.VertexFaces[Vertex]:
+                del self.VertexFaces[Vertex]
+
+
+# Directed edges of Triangle, following its winding
+def _GetEdges(Triangle):
+    return ((Triangle[0], Triangle[1]), (Triangle[1], Triangle[2]),
+        (Triangle[2], Triangle[0]))
+
+
+# Unit outward normals and offsets of the planes of Triangles
+def _GetPlanes(Points, Triangles):
+    Corners = Points[numpy.asarray(Triangles, dtype=numpy.int64)]
+    Normals = numpy.cross(Corners[:, 1] - Corners[:, 0],
+        Corners[:, 2] - Corners[:, 0])
+    Lengths = numpy.sqrt((Normals ** 2).sum(axis=1))[:, None]
+    Normals /= numpy.where(Lengths > 0, Lengths, 1)
+    return Normals, (Normals * Corners[:, 0]).sum(axis=1)
+
+
+# Volume enclosed by Triangles, negative if they face inward
+def _Volume(Points, Triangles):
+    Corners = numpy.asarray(Points, dtype=numpy.float64)[numpy.asarray(
+        Triangles, dtype=numpy.int64)]
+    return float(numpy.einsum('ij,ij->i', Corners[:, 0], numpy.cross(
+        Corners[:, 1], Corners[:, 2])).sum() / 6)
+
+
+def _Describe(Hull, FrameName):
+    Positions = numpy.asarray(Hull.Positions, dtype=numpy.float64)
+    Normals, Offsets = _GetPlanes(Positions, Hull.Triangles)
+    return {
+        "Name" : Hull.Name,
+        "Frame" : FrameName,
+        "Vertices" : Positions.tolist(),
+        "Triangles" : numpy.asarray(Hull.Triangles).tolist(),
+        "Planes" : numpy.column_stack((Normals, Offsets)).tolist()}
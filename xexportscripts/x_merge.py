@@ -0,0 +1,275 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Merges the meshes of static frames by material, so that scenes made of
+# many small objects need one draw call per material instead of one per
+# object.
+#
+# Meshes are merged into the frame passed in and into every animated frame,
+# i.e. with keys that change, and every frame in Keep below it.  Those frames
+# keep their own meshes and collect the meshes of the static frames below
+# them, moved into their space and combined per material, with no more than
+# MAX_VERTICES vertices per combined mesh so that 16 bit indices suffice.
+# Skinned meshes, meshes with morph targets and meshes with extra texture
+# coordinates, which may refer to textures of their own, are left alone, as
+# are instance tables.  Collision hulls move along with the merged meshes.
+# Static frames whose meshes were all merged are
+# removed unless they still have children or instances, and so are their
+# animation tracks.  Frames are copied,
+# never changed, so gathered frames can be reused.  Does not depend on
+# Blender.
+
+import numpy
+
+try:
+    from . import x_scene
+except (ImportError, ValueError, SystemError):
+    import x_scene
+
+# Vertices a combined mesh may have, as counted by _CountVertices
+MAX_VERTICES = 65535
+# Keys closer than this count as unchanged
+KEY_TOLERANCE = 1e-6
+
+
+# "Public" Interface
+
+# Merges the static meshes of Scene into the top level frames, or with
+# PerRootFrame into each of the top level frames' children.  Keep holds the
+# names of frames that must stay separate.
+def MergeStatic(Scene, Keep=(), PerRootFrame=False,
+    MaxVertices=MAX_VERTICES):
+    Animated = GetAnimatedFrames(Scene.AnimationSets)
+    Keep = set(Keep)
+
+    Removed = set()
+    for Index, Root in enumerate(Scene.Frames):
+        if PerRootFrame:
+            Merged = x_scene.Frame(Root.Name, Root.Matrix)
+            Merged.Meshes = list(Root.Meshes)
+            Merged.Instances = list(Root.Instances)
+            Merged.Hulls = list(Root.Hulls)
+            Merged.Children = [MergeFrame(Frame, Animated, Keep,
+                "%s_Static" % Frame.Name, MaxVertices, Removed)
+                for Frame in Root.Children]
+        else:
+            Merged = MergeFrame(Root, Animated, Keep, "Static", MaxVertices,
+                Removed)
+        Scene.Frames[Index] = Merged
+
+    for Set in Scene.AnimationSets:
+        Set.Tracks = [Track for Track in Set.Tracks
+            if Track.FrameName not in Removed]
+    return Scene
+
+
+# Returns a copy of Frame with the static meshes below it merged into meshes
+# of its own, named after Prefix and their material.  The meshes Frame
+# already has are kept as they are.  The names of the
+# frames left out are added to Removed.
+def MergeFrame(Frame, Animated, Keep, Prefix, MaxVertices=MAX_VERTICES,
+    Removed=None):
+    if Removed is None:
+        Removed = set()
+
+    # Pieces of static geometry, one per material of each mesh, grouped by
+    # material and the attributes they have
+    Groups = []
+    GroupPieces = {}
+    Hulls = []
+
+    def AddMesh(Mesh, Matrix):
+        Materials = Mesh.Materials or [None]
+        MaterialIndices = Mesh.MaterialIndices
+        if MaterialIndices is None:
+            MaterialIndices = numpy.zeros(Mesh.GetFaceCount())
+        MaterialIndices = numpy.asarray(MaterialIndices)
+        for Index, Material in enumerate(Materials):
+            FaceMask = MaterialIndices == Index
+            if not FaceMask.any():
+                continue
+            Piece = _TransformMesh(Mesh.ExtractFaces(Mesh.Name, FaceMask),
+                Matrix)
+            Key = (None if Material is None else Material.Name,
+                Piece.Normals is not None, Piece.TextureCoords is not None,
+                Piece.VertexColors is not None)
+            if Key not in GroupPieces:
+                GroupPieces[Key] = []
+                Groups.append((Key, Material, GroupPieces[Key]))
+            GroupPieces[Key].append(Piece)
+
+    # Returns the copy of Child, whose space is Matrix in Frame's space, or
+    # None if nothing of it is left.  Frames that move or are kept collect
+    # the static meshes below them themselves.
+    def Visit(Child, Matrix):
+        if Child.Name in Animated or Child.Name in Keep:
+            return MergeFrame(Child, Animated, Keep,
+                "%s_Static" % Child.Name, MaxVertices, Removed)
+
+        Matrix = numpy.dot(Child.Matrix, Matrix)
+        Copy = x_scene.Frame(Child.Name, Child.Matrix)
+        Copy.Instances = list(Child.Instances)
+        Hulls.extend(_TransformHull(Hull, Matrix) for Hull in Child.Hulls)
+        for Mesh in Child.Meshes:
+            if Mesh.SkinWeights or Mesh.MorphTargets or \
+                Mesh.ExtraTextureCoords:
+                Copy.Meshes.append(Mesh)
+            else:
+                AddMesh(Mesh, Matrix)
+        for Grandchild in Child.Children:
+            Result = Visit(Grandchild, Matrix)
+            if Result is not None:
+                Copy.Children.append(Result)
+
+        if Child.Meshes and not Copy.Meshes and not Copy.Children and \
+            not Copy.Instances:
+            Removed.add(Child.Name)
+            return None
+        return Copy
+
+    Merged = x_scene.Frame(Frame.Name, Frame.Matrix)
+    Merged.Meshes = list(Frame.Meshes)
+    Merged.Instances = list(Frame.Instances)
+    for Child in Frame.Children:
+        Result = Visit(Child, x_scene.IdentityMatrix())
+        if Result is not None:
+            Merged.Children.append(Result)
+    Merged.Hulls = list(Frame.Hulls) + Hulls
+
+    for Key, Material, Pieces in Groups:
+        Name = Prefix
+        if Material is not None:
+            Name = "%s_%s" % (Prefix, Material.Name)
+        Chunks = _ChunkPieces(Pieces, MaxVertices)
+        for Index, Chunk in enumerate(Chunks):
+            ChunkName = Name
+            if len(Chunks) > 1:
+                ChunkName = "%s_%d" % (Name, Index)
+            Merged.Meshes.append(_Concatenate(Chunk, ChunkName, Material))
+    return Merged
+
+
+# Names of the frames whose keys change in any of AnimationSets
+def GetAnimatedFrames(AnimationSets):
+    Animated = set()
+    for Set in AnimationSets:
+        for Track in Set.Tracks:
+            for Type, Keys in Track.GetKeys():
+                Keys = numpy.asarray(Keys)
+                if len(Keys) and numpy.abs(Keys - Keys[0]).max() > \
+                    KEY_TOLERANCE:
+                    Animated.add(Track.FrameName)
+    return Animated
+
+
+# "Private" Methods
+
+# Moves Mesh, changed in place, by the row vector Matrix
+def _TransformMesh(Mesh, Matrix):
+    Matrix = numpy.asarray(Matrix, dtype=numpy.float64)
+    Linear = Matrix[:3, :3]
+    Mesh.Positions = x_scene.FloatArray(numpy.dot(Mesh.Positions, Linear) +
+        Matrix[3, :3])
+    if Mesh.Normals is not None and len(Mesh.Normals):
+        Normals = numpy.dot(Mesh.Normals, numpy.linalg.pinv(Linear).T)
+        Lengths = numpy.sqrt((Normals ** 2).sum(axis=1))[:, None]
+        Mesh.Normals = x_scene.FloatArray(Normals / numpy.where(Lengths,
+            Lengths, 1))
+
+    # Mirroring turns the faces inside out
+    if numpy.linalg.det(Linear) < 0:
+        Sizes = numpy.asarray(Mesh.FaceSizes, dtype=numpy.int64)
+        Source = numpy.repeat(2 * Mesh.GetFaceOffsets() + Sizes - 1,
+            Sizes) - numpy.arange(int(Sizes.sum()))
+        Mesh.FaceIndices = Mesh.FaceIndices[Source]
+        if Mesh.NormalFaceIndices is not None:
+            Mesh.NormalFaceIndices = Mesh.NormalFaceIndices[Source]
+    return Mesh
+
+
+# Returns a copy of Hull moved by the row vector Matrix
+def _TransformHull(Hull, Matrix):
+    Matrix = numpy.asarray(Matrix, dtype=numpy.float64)
+    Triangles = Hull.Triangles
+    if numpy.linalg.det(Matrix[:3, :3]) < 0:
+        Triangles = Triangles[:, ::-1]
+    return x_scene.CollisionHull(Hull.Name, numpy.dot(Hull.Positions,
+        Matrix[:3, :3]) + Matrix[3, :3], Triangles)
+
+
+# Vertices Mesh needs once positions with several normals are split, as
+# XNA and most engines do
+def _CountVertices(Mesh):
+    if Mesh.Normals is None:
+        return Mesh.GetVertexCount()
+    return len(x_scene.DeduplicateRows(numpy.column_stack((Mesh.FaceIndices,
+        Mesh.NormalFaceIndices)), 1)[0])
+
+
+# Splits Pieces into runs of at most MaxVertices vertices.  A piece that is
+# larger on its own gets a run to itself.
+def _ChunkPieces(Pieces, MaxVertices):
+    Chunks = []
+    Count = 0
+    for Piece in Pieces:
+        Vertices = _CountVertices(Piece)
+        if not Chunks or Count + Vertices > MaxVertices:
+            Chunks.append([])
+            Count = 0
+        Chunks[-1].append(Piece)
+        Count += Vertices
+    return Chunks
+
+
+# Joins Meshes, which all have the same attributes, into one mesh using
+# Material, which may be None
+def _Concatenate(Meshes, Name, Material):
+    Mesh = x_scene.Mesh(Name)
+    VertexOffsets = numpy.cumsum([0] + [Part.GetVertexCount()
+        for Part in Meshes])
+    Mesh.Positions = x_scene.FloatArray(numpy.concatenate([Part.Positions
+        for Part in Meshes]))
+    Mesh.FaceSizes = x_scene.IndexArray(numpy.concatenate([Part.FaceSizes
+        for Part in Meshes]))
+    Mesh.FaceIndices = x_scene.IndexArray(numpy.concatenate([
+        Part.FaceIndices + Offset for Part, Offset in zip(Meshes,
+        VertexOffsets)]))
+
+    if Meshes[0].Normals is not None:
+        NormalOffsets = numpy.cumsum([0] + [len(Part.Normals)
+            for Part in Meshes])
+        Mesh.Normals = x_scene.FloatArray(numpy.concatenate([Part.Normals
+            for Part in Meshes]))
+        Mesh.NormalFaceIndices = x_scene.IndexArray(numpy.concatenate([
+            Part.NormalFaceIndices + Offset for Part, Offset in zip(Meshes,
+            NormalOffsets)]))
+        Mesh.DeduplicateNormals()
+    if Meshes[0].TextureCoords is not None:
+        Mesh.TextureCoords = x_scene.FloatArray(numpy.concatenate([
+            Part.TextureCoords for Part in Meshes]))
+    if Meshes[0].VertexColors is not None:
+        Mesh.VertexColors = x_scene.FloatArray(numpy.concatenate([
+            Part.VertexColors for Part in Meshes]))
+
+    if Material is not None:
+        Mesh.Materials = [Material]
+        Mesh.MaterialIndices = x_scene.IndexArray(numpy.zeros(
+            Mesh.GetFaceCount()))
+    return Mesh
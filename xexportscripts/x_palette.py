@@ -0,0 +1,181 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Splits skinned meshes into parts that each use at most a given number of
+# bones, so that every part can be drawn with a fixed size bone palette.
+#
+# Faces are grouped by the set of bones their vertices are weighted to.  A
+# part starts from the remaining group with the most bones and then takes the
+# group adding the fewest new bones, until no group fits anymore.  Groups
+# adding no new bones are taken along right away.  Every part gets its own
+# copy of the vertices it uses and SkinWeights for its bones only, in the
+# order of the original SkinWeights, which is the part's palette.
+#
+# A face whose vertices alone use more bones than the limit keeps its
+# strongest bones, and the weights of its vertices are scaled back up to
+# their original total.  Does not depend on Blender.
+
+import numpy
+
+try:
+    from . import x_scene
+except (ImportError, ValueError, SystemError):
+    import x_scene
+
+
+# "Public" Interface
+
+# Returns the parts of Mesh, each using at most MaxBones bones, in a list.
+# A mesh that already fits is returned as is.  Skinned results have their
+# BonePalette set.
+def PartitionMesh(Mesh, MaxBones):
+    if MaxBones < 1:
+        raise ValueError("A bone palette needs at least one bone")
+    if not Mesh.SkinWeights:
+        return [Mesh]
+    if len(Mesh.SkinWeights) <= MaxBones:
+        Mesh.BonePalette = True
+        return [Mesh]
+
+    FaceBones = _GetFaceBones(Mesh, MaxBones)
+
+    # Faces with the same bones always end up in the same part
+    Groups, FaceGroups = x_scene.DeduplicateRows(numpy.packbits(FaceBones,
+        axis=1), 1)
+    GroupBones = numpy.unpackbits(Groups, axis=1)[:,
+        :len(Mesh.SkinWeights)].astype(bool)
+    GroupSizes = GroupBones.sum(axis=1)
+    GroupFaces = numpy.bincount(FaceGroups, minlength=len(Groups))
+
+    Remaining = numpy.ones(len(Groups), dtype=bool)
+    GroupParts = numpy.zeros(len(Groups), dtype=numpy.int32)
+    Palettes = []
+    while Remaining.any():
+        Candidates = numpy.flatnonzero(Remaining)
+        Seed = Candidates[numpy.lexsort((-GroupFaces[Candidates],
+            -GroupSizes[Candidates]))[0]]
+        Palette = GroupBones[Seed].copy()
+
+        while True:
+            Candidates = numpy.flatnonzero(Remaining)
+            Added = (GroupBones[Candidates] & ~Palette).sum(axis=1)
+            Free = Candidates[Added == 0]
+            GroupParts[Free] = len(Palettes)
+            Remaining[Free] = False
+
+            Fitting = numpy.flatnonzero((Added > 0) &
+                (Added <= MaxBones - Palette.sum()))
+            if not len(Fitting):
+                break
+            # Fewest new bones, then most shared bones, then most faces
+            Shared = (GroupBones[Candidates[Fitting]] & Palette).sum(axis=1)
+            Best = Candidates[Fitting[numpy.lexsort((
+                -GroupFaces[Candidates[Fitting]], -Shared,
+                Added[Fitting]))[0]]]
+            Palette |= GroupBones[Best]
+        Palettes.append(numpy.flatnonzero(Palette))
+
+    FaceParts = GroupParts[FaceGroups]
+    Parts = []
+    for Index, Palette in enumerate(Palettes):
+        Name = Mesh.Name
+        if len(Palettes) > 1:
+            Name = "%s_%d" % (Mesh.Name, Index)
+        Parts.append(_ExtractPart(Mesh, Name, FaceParts == Index, Palette))
+    return Parts
+
+
+# "Private" Methods
+
+# Returns a (Faces, SkinWeights) bool array of the bones each face's
+# vertices are weighted to, trimmed to the MaxBones strongest ones
+def _GetFaceBones(Mesh, MaxBones):
+    FaceCount = Mesh.GetFaceCount()
+    VertexCount = Mesh.GetVertexCount()
+    BoneCount = len(Mesh.SkinWeights)
+
+    # (vertex, bone, weight) of every influence, sorted by vertex
+    Vertexes = numpy.concatenate([Skin.Indices
+        for Skin in Mesh.SkinWeights]).astype(numpy.int64)
+    Bones = numpy.concatenate([numpy.repeat(Bone, len(Skin.Indices))
+        for Bone, Skin in enumerate(Mesh.SkinWeights)])
+    Weights = numpy.concatenate([Skin.Weights for Skin in Mesh.SkinWeights])
+    Kept = Weights > 0
+    Order = numpy.argsort(Vertexes[Kept], kind='mergesort')
+    Vertexes = Vertexes[Kept][Order]
+    Bones = Bones[Kept][Order]
+    Weights = Weights[Kept][Order]
+
+    # Expand the influences of each face corner's vertex
+    Corners = numpy.asarray(Mesh.FaceIndices)
+    CornerFaces = numpy.repeat(numpy.arange(FaceCount), Mesh.FaceSizes)
+    Counts = numpy.bincount(Vertexes, minlength=VertexCount)
+    Starts = numpy.cumsum(Counts) - Counts
+    Repeats = Counts[Corners]
+    Influences = numpy.repeat(Starts[Corners] - numpy.cumsum(Repeats) +
+        Repeats, Repeats) + numpy.arange(Repeats.sum())
+    Faces = numpy.repeat(CornerFaces, Repeats)
+    Bones = Bones[Influences]
+
+    FaceBones = numpy.zeros((FaceCount, BoneCount), dtype=bool)
+    FaceBones[Faces, Bones] = True
+
+    Overflowing = numpy.flatnonzero(FaceBones.sum(axis=1) > MaxBones)
+    if len(Overflowing):
+        Rows = numpy.full(FaceCount, -1, dtype=numpy.int64)
+        Rows[Overflowing] = numpy.arange(len(Overflowing))
+        Selected = Rows[Faces] >= 0
+        FaceWeights = numpy.zeros((len(Overflowing), BoneCount))
+        numpy.add.at(FaceWeights, (Rows[Faces][Selected], Bones[Selected]),
+            Weights[Influences][Selected])
+        Weakest = numpy.argsort(-FaceWeights, axis=1,
+            kind='mergesort')[:, MaxBones:]
+        FaceBones[Overflowing[:, None], Weakest] = False
+    return FaceBones
+
+
+# Copies the faces of Mesh selected by FaceMask, the vertices they use and
+# the SkinWeights of the bones in Palette into a new mesh
+def _ExtractPart(Mesh, Name, FaceMask, Palette):
+    Part = Mesh.ExtractFaces(Name, FaceMask)
+    Part.BonePalette = True
+
+    # Scale weights that lost trimmed bones back up to their original total
+    Totals = numpy.zeros(Part.GetVertexCount())
+    PaletteTotals = numpy.zeros(Part.GetVertexCount())
+    for Bone, Skin in enumerate(Part.SkinWeights):
+        numpy.add.at(Totals, Skin.Indices, Skin.Weights)
+        if Bone in Palette:
+            numpy.add.at(PaletteTotals, Skin.Indices, Skin.Weights)
+    Scales = numpy.ones(Part.GetVertexCount())
+    Trimmed = (PaletteTotals > 0) & (PaletteTotals < Totals)
+    Scales[Trimmed] = Totals[Trimmed] / PaletteTotals[Trimmed]
+
+    Part.SkinWeights = [Part.SkinWeights[Bone] for Bone in Palette]
+    Influences = numpy.zeros(Part.GetVertexCount(), dtype=numpy.int64)
+    for Skin in Part.SkinWeights:
+        Skin.Weights = x_scene.FloatArray(Skin.Weights * Scales[Skin.Indices])
+        Influences[Skin.Indices] += 1
+
+    if len(Influences):
+        Part.MaxSkinWeightsPerVertex = int(Influences.max())
+    Part.MaxSkinWeightsPerFace = min(Mesh.MaxSkinWeightsPerFace,
+        len(Palette))
+    return Part
@@ -0,0 +1,569 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Backend-independent description of everything that ends up in a .x file.
+# export_x.py fills these containers from Blender and x_snapshot.Load reads
+# them back from a snapshot file.  The serializers in x_writer.py and
+# x_xnb.py consume them, so nothing in this module may depend on bpy or
+# Blender.
+#
+# All bulk data is stored in NumPy arrays that are already in DirectX
+# conventions: matrices use row vectors (translation in the last row), face
+# winding is clockwise and UVs have their origin in the top left corner.
+
+import numpy
+
+# Normals closer than this are written once.  Matches the precision of the
+# default text output.
+NORMAL_STEP = 1e-6
+
+
+def IdentityMatrix():
+    return numpy.identity(4, dtype=numpy.float32)
+
+
+def FloatArray(Data, Columns=None):
+    Array = numpy.asarray(Data, dtype=numpy.float32)
+    if Columns is not None:
+        Array = Array.reshape(-1, Columns)
+    return Array
+
+
+def IndexArray(Data):
+    return numpy.asarray(Data, dtype=numpy.int32).reshape(-1)
+
+
+# Rows that are equal after rounding to multiples of Step are merged.
+# Returns the unique rows, in order of first occurrence, and for each input
+# row the index of its unique row.
+def DeduplicateRows(Rows, Step):
+    Rows = numpy.asarray(Rows)
+    if not len(Rows):
+        return Rows, IndexArray(())
+
+    Quantized = numpy.round(Rows.reshape(len(Rows), -1) / Step).astype(
+        numpy.int64)
+    # View each row as one opaque value so they can be compared as a whole
+    Keys = numpy.ascontiguousarray(Quantized).view(numpy.dtype((numpy.void,
+        Quantized.dtype.itemsize * Quantized.shape[1]))).reshape(-1)
+    _, First, Inverse = numpy.unique(Keys, return_index=True,
+        return_inverse=True)
+
+    # numpy.unique sorts by key; renumber by first occurrence instead
+    Order = numpy.argsort(First, kind='mergesort')
+    Rank = numpy.empty(len(Order), dtype=numpy.int32)
+    Rank[Order] = numpy.arange(len(Order), dtype=numpy.int32)
+    return Rows[First[Order]], Rank[Inverse.reshape(-1)]
+
+
+# An array whose rows are computed on demand from a function of (Start,
+# Stop).  Front-ends use it for large derived arrays, e.g. per-corner vertex
+# data, so that only the rows currently being written exist in memory.
+# Supports len() and contiguous slicing, which is all the writers need.
+class ChunkedArray:
+    def __init__(self, Length, GetRows, Columns=None,
+        DataType=numpy.float32):
+        self.Length = Length
+        self.GetRows = GetRows
+        self.Columns = Columns
+        self.dtype = numpy.dtype(DataType)
+        if Columns is None:
+            self.shape = (Length,)
+        else:
+            self.shape = (Length, Columns)
+
+    def __repr__(self):
+        return "[ChunkedArray: %s]" % (self.shape,)
+
+    def __len__(self):
+        return self.Length
+
+    def __getitem__(self, Index):
+        if not isinstance(Index, slice):
+            raise TypeError("ChunkedArray only supports slicing")
+        Start, Stop, Step = Index.indices(self.Length)
+        if Step != 1:
+            raise ValueError("ChunkedArray slices must be contiguous")
+        Stop = max(Start, Stop)
+        return numpy.asarray(self.GetRows(Start, Stop), dtype=self.dtype)
+
+    # Materializes the whole array.  The rows are always gathered anew, so
+    # copy=False, which NumPy 2 passes to forbid copies, cannot be honored.
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError("ChunkedArray cannot be viewed without a copy")
+        Array = self[:]
+        if dtype is not None:
+            Array = Array.astype(dtype, copy=False)
+        return Array
+
+    # Rows of Source picked by Indexes, gathered one window at a time
+    @staticmethod
+    def Take(Source, Indexes):
+        Columns = None
+        if Source.ndim > 1:
+            Columns = Source.shape[1]
+        return ChunkedArray(len(Indexes),
+            lambda Start, Stop: Source[Indexes[Start:Stop]], Columns,
+            Source.dtype)
+
+
+# Root of the exported data
+class Scene:
+    def __init__(self):
+        # Top level materials, frames and meshes, in file order.  Top level
+        # materials can be shared by name, see XWriter's MaterialReferences.
+        self.Materials = []
+        self.Frames = []
+        self.Meshes = []
+
+        self.AnimationSets = []
+
+        # Written as AnimTicksPerSecond when not None
+        self.FrameRate = None
+
+    # "Public" Interface
+
+    def IterFrames(self):
+        for Root in self.Frames:
+            for CurrentFrame in Root.IterFrames():
+                yield CurrentFrame
+
+    def IterMeshes(self):
+        for CurrentMesh in self.Meshes:
+            yield CurrentMesh
+        for CurrentFrame in self.IterFrames():
+            for CurrentMesh in CurrentFrame.IterMeshes():
+                yield CurrentMesh
+
+    def HasSkinWeights(self):
+        for CurrentMesh in self.IterMeshes():
+            if CurrentMesh.SkinWeights:
+                return True
+        return False
+
+
+# A node of the transform hierarchy
+class Frame:
+    def __init__(self, Name, Matrix=None):
+        self.Name = Name
+        if Matrix is None:
+            self.Matrix = IdentityMatrix()
+        else:
+            self.Matrix = FloatArray(Matrix).reshape(4, 4)
+
+        self.Children = []
+        self.Meshes = []
+        # InstanceTables placing copies of other meshes in this frame
+        self.Instances = []
+        # CollisionHulls standing in for the meshes in physics queries
+        self.Hulls = []
+
+    def __repr__(self):
+        return "[Frame: %s]" % self.Name
+
+    # "Public" Interface
+
+    # Depth-first, parents before their children
+    def IterFrames(self):
+        yield self
+        for Child in self.Children:
+            for CurrentFrame in Child.IterFrames():
+                yield CurrentFrame
+
+    # The frame's own meshes, then the prototypes of its instances
+    def IterMeshes(self):
+        for CurrentMesh in self.Meshes:
+            yield CurrentMesh
+        for Table in self.Instances:
+            for CurrentMesh in Table.Meshes:
+                yield CurrentMesh
+
+
+# Geometry and its per-vertex and per-face attributes.  Faces are stored as
+# a flat index array plus the number of indices in each face.
+class Mesh:
+    def __init__(self, Name):
+        self.Name = Name
+
+        # (Vertices, 3) float32
+        self.Positions = FloatArray((), 3)
+        # (Faces,) int32 and (sum(FaceSizes),) int32
+        self.FaceSizes = IndexArray(())
+        self.FaceIndices = IndexArray(())
+
+        # Normals have their own index list with the same face sizes
+        self.Normals = None
+        self.NormalFaceIndices = None
+
+        # (Vertices, 2) and (Vertices, 4) float32
+        self.TextureCoords = None
+        self.VertexColors = None
+        # Further (Vertices, 2) float32 texture coordinate sets, the first
+        # of which is TEXCOORD1
+        self.ExtraTextureCoords = []
+
+        # (Faces,) int32 indexes into Materials
+        self.MaterialIndices = None
+        self.Materials = []
+
+        self.SkinWeights = []
+        self.MaxSkinWeightsPerVertex = 0
+        self.MaxSkinWeightsPerFace = 0
+        # Set when the mesh is drawn with a palette of only its own bones,
+        # indexed in SkinWeights order, see x_palette.py
+        self.BonePalette = False
+
+        # (Ranges, 5) int32 material index, first face, face count, first
+        # vertex and vertex count of each material, set by
+        # SortFacesByMaterial
+        self.AttributeRanges = None
+
+        # Shape keys as offsets of the vertices they move
+        self.MorphTargets = []
+
+    def __repr__(self):
+        return "[Mesh: %s]" % self.Name
+
+    # "Public" Interface
+
+    def GetVertexCount(self):
+        return len(self.Positions)
+
+    def GetFaceCount(self):
+        return len(self.FaceSizes)
+
+    # Shares normals that are equal to within Step
+    def DeduplicateNormals(self, Step=NORMAL_STEP):
+        if self.Normals is None:
+            return
+        self.Normals, Remap = DeduplicateRows(self.Normals, Step)
+        self.NormalFaceIndices = Remap[self.NormalFaceIndices]
+
+    # Index of each face's first entry in FaceIndices
+    def GetFaceOffsets(self):
+        Offsets = numpy.zeros(len(self.FaceSizes), dtype=numpy.int64)
+        if len(self.FaceSizes):
+            numpy.cumsum(self.FaceSizes[:-1], out=Offsets[1:])
+        return Offsets
+
+    # Orders the faces by material, keeping their order within each
+    # material, and the vertices by first use, so that every material's faces
+    # and vertices are contiguous.  Vertices shared by faces of different
+    # materials are copied.  Records the ranges in AttributeRanges.
+    def SortFacesByMaterial(self):
+        if not self.Materials or self.MaterialIndices is None or \
+            not self.GetFaceCount():
+            return
+
+        VertexCount = self.GetVertexCount()
+        MaterialIndices = numpy.asarray(self.MaterialIndices)
+        Order = numpy.argsort(MaterialIndices, kind='mergesort')
+        Sizes = numpy.asarray(self.FaceSizes)[Order]
+        Offsets = numpy.cumsum(Sizes) - Sizes
+        Corners = numpy.repeat(self.GetFaceOffsets()[Order] - Offsets,
+            Sizes) + numpy.arange(int(Sizes.sum()))
+        self.FaceSizes = IndexArray(Sizes)
+        self.MaterialIndices = IndexArray(MaterialIndices[Order])
+        if self.NormalFaceIndices is not None:
+            self.NormalFaceIndices = IndexArray(numpy.asarray(
+                self.NormalFaceIndices)[Corners])
+
+        # One vertex per original vertex and material, in order of first use
+        CornerMaterials = numpy.repeat(self.MaterialIndices, Sizes)
+        Unique, FaceIndices = DeduplicateRows(numpy.column_stack((
+            numpy.asarray(self.FaceIndices)[Corners], CornerMaterials)), 1)
+        Sources = Unique[:, 0]
+        self.FaceIndices = IndexArray(FaceIndices)
+        self.Positions = FloatArray(numpy.asarray(self.Positions)[Sources])
+        if self.TextureCoords is not None:
+            self.TextureCoords = FloatArray(numpy.asarray(
+                self.TextureCoords)[Sources])
+        if self.VertexColors is not None:
+            self.VertexColors = FloatArray(numpy.asarray(
+                self.VertexColors)[Sources])
+        self.ExtraTextureCoords = [FloatArray(numpy.asarray(Coords)[Sources])
+            for Coords in self.ExtraTextureCoords]
+
+        # Each influence goes to every copy of its vertex
+        SourceOrder = numpy.argsort(Sources, kind='mergesort')
+        Copies = numpy.bincount(Sources, minlength=VertexCount)
+        CopyStarts = numpy.cumsum(Copies) - Copies
+        for Skin in self.SkinWeights:
+            Repeats = Copies[Skin.Indices]
+            Expanded = numpy.repeat(CopyStarts[Skin.Indices] -
+                (numpy.cumsum(Repeats) - Repeats), Repeats) + \
+                numpy.arange(int(Repeats.sum()))
+            Indices = SourceOrder[Expanded]
+            Weights = numpy.repeat(Skin.Weights, Repeats)
+            Sorted = numpy.argsort(Indices, kind='mergesort')
+            Skin.Indices = IndexArray(Indices[Sorted])
+            Skin.Weights = FloatArray(Weights[Sorted])
+        for Target in self.MorphTargets:
+            Repeats = Copies[Target.Indices]
+            Expanded = numpy.repeat(CopyStarts[Target.Indices] -
+                (numpy.cumsum(Repeats) - Repeats), Repeats) + \
+                numpy.arange(int(Repeats.sum()))
+            Indices = SourceOrder[Expanded]
+            Offsets = numpy.repeat(Target.Offsets, Repeats, axis=0)
+            Sorted = numpy.argsort(Indices, kind='mergesort')
+            Target.Indices = IndexArray(Indices[Sorted])
+            Target.Offsets = FloatArray(Offsets[Sorted], 3)
+
+        Materials = numpy.unique(self.MaterialIndices)
+        FaceStarts = numpy.searchsorted(self.MaterialIndices, Materials)
+        FaceEnds = numpy.searchsorted(self.MaterialIndices, Materials,
+            side='right')
+        VertexStarts = numpy.full(len(Materials), len(Sources))
+        VertexEnds = numpy.zeros(len(Materials), dtype=numpy.int64)
+        Ranges = numpy.searchsorted(Materials, CornerMaterials)
+        numpy.minimum.at(VertexStarts, Ranges, self.FaceIndices)
+        numpy.maximum.at(VertexEnds, Ranges, self.FaceIndices + 1)
+        self.AttributeRanges = IndexArray(numpy.column_stack((Materials,
+            FaceStarts, FaceEnds - FaceStarts, VertexStarts,
+            VertexEnds - VertexStarts))).reshape(-1, 5)
+
+    # Returns a new mesh called Name with the faces selected by the (Faces,)
+    # bool FaceMask and only the vertices, normals and materials they use.
+    # SkinWeights and MorphTargets keep their order, even those left without
+    # vertices.
+    def ExtractFaces(self, Name, FaceMask):
+        Part = Mesh(Name)
+        FaceMask = numpy.asarray(FaceMask, dtype=bool)
+
+        Sizes = numpy.asarray(self.FaceSizes)
+        CornerMask = numpy.repeat(FaceMask, Sizes)
+        Used, Corners = numpy.unique(numpy.asarray(
+            self.FaceIndices)[CornerMask], return_inverse=True)
+        Part.FaceSizes = IndexArray(Sizes[FaceMask])
+        Part.FaceIndices = IndexArray(Corners)
+        Part.Positions = FloatArray(numpy.asarray(self.Positions)[Used])
+
+        if self.Normals is not None:
+            UsedNormals, NormalCorners = numpy.unique(numpy.asarray(
+                self.NormalFaceIndices)[CornerMask], return_inverse=True)
+            Part.Normals = FloatArray(numpy.asarray(self.Normals)[
+                UsedNormals])
+            Part.NormalFaceIndices = IndexArray(NormalCorners)
+        if self.TextureCoords is not None:
+            Part.TextureCoords = FloatArray(numpy.asarray(
+                self.TextureCoords)[Used])
+        if self.VertexColors is not None:
+            Part.VertexColors = FloatArray(numpy.asarray(
+                self.VertexColors)[Used])
+        Part.ExtraTextureCoords = [FloatArray(numpy.asarray(Coords)[Used])
+            for Coords in self.ExtraTextureCoords]
+
+        Part.Materials = list(self.Materials)
+        if self.MaterialIndices is not None:
+            UsedMaterials, MaterialIndices = numpy.unique(numpy.asarray(
+                self.MaterialIndices)[FaceMask], return_inverse=True)
+            Part.Materials = [self.Materials[Index] for Index in UsedMaterials
+                if Index < len(self.Materials)]
+            Part.MaterialIndices = IndexArray(MaterialIndices)
+
+        Remap = numpy.full(self.GetVertexCount(), -1, dtype=numpy.int64)
+        Remap[Used] = numpy.arange(len(Used))
+        for Skin in self.SkinWeights:
+            Indices = Remap[Skin.Indices]
+            Kept = Indices >= 0
+            Part.SkinWeights.append(SkinWeights(Skin.FrameName,
+                Indices[Kept], Skin.Weights[Kept], Skin.OffsetMatrix))
+        Part.MaxSkinWeightsPerVertex = self.MaxSkinWeightsPerVertex
+        Part.MaxSkinWeightsPerFace = self.MaxSkinWeightsPerFace
+        Part.BonePalette = self.BonePalette
+
+        for Target in self.MorphTargets:
+            Indices = Remap[Target.Indices]
+            Kept = Indices >= 0
+            Part.MorphTargets.append(MorphTarget(Target.Name, Indices[Kept],
+                Target.Offsets[Kept]))
+        return Part
+
+
+class Material:
+    def __init__(self, Name):
+        self.Name = Name
+
+        # RGBA, power, RGB, RGB
+        self.Diffuse = FloatArray((1.0, 1.0, 1.0, 1.0))
+        self.Power = 0.0
+        self.Specular = FloatArray((0.0, 0.0, 0.0))
+        self.Emissive = FloatArray((0.0, 0.0, 0.0))
+
+        self.TextureFilename = None
+
+    def __repr__(self):
+        return "[Material: %s]" % self.Name
+
+
+# The vertices a single bone (Frame) influences
+class SkinWeights:
+    def __init__(self, FrameName, Indices=(), Weights=(), OffsetMatrix=None):
+        self.FrameName = FrameName
+        self.Indices = IndexArray(Indices)
+        self.Weights = FloatArray(Weights)
+        if OffsetMatrix is None:
+            self.OffsetMatrix = IdentityMatrix()
+        else:
+            self.OffsetMatrix = FloatArray(OffsetMatrix).reshape(4, 4)
+
+
+# The vertices a shape key moves and how far it moves them at full weight
+class MorphTarget:
+    def __init__(self, Name, Indices=(), Offsets=()):
+        self.Name = Name
+        self.Indices = IndexArray(Indices)
+        # (len(Indices), 3) float32
+        self.Offsets = FloatArray(Offsets, 3)
+
+    def __repr__(self):
+        return "[MorphTarget: %s]" % self.Name
+
+
+# Copies of Meshes, one per row of the transform arrays, for hardware
+# instancing.  Transforms are relative to the frame holding the table.
+class InstanceTable:
+    def __init__(self, Name, Positions=(), Rotations=(), Scales=(),
+        Colors=None):
+        self.Name = Name
+        self.Meshes = []
+
+        # (Instances, 3) float32
+        self.Positions = FloatArray(Positions, 3)
+        # (Instances, 4) quaternions stored w, x, y, z with w negated, like
+        # rotation keys
+        self.Rotations = FloatArray(Rotations, 4)
+        self.Scales = FloatArray(Scales, 3)
+        # (Instances, 4) RGBA float32, or None
+        self.Colors = None
+        if Colors is not None:
+            self.Colors = FloatArray(Colors, 4)
+
+    def __repr__(self):
+        return "[InstanceTable: %s]" % self.Name
+
+    # "Public" Interface
+
+    def GetInstanceCount(self):
+        return len(self.Positions)
+
+    # (Instances, 4, 4) row vector matrices of the instances
+    def GetMatrices(self):
+        W, X, Y, Z = numpy.asarray(self.Rotations, dtype=numpy.float64).T
+        # With w negated, the column vector matrix of the quaternion is the
+        # row vector matrix of the rotation
+        Matrices = numpy.zeros((self.GetInstanceCount(), 4, 4))
+        Matrices[:, 0, 0] = 1 - 2 * (Y * Y + Z * Z)
+        Matrices[:, 0, 1] = 2 * (X * Y - Z * W)
+        Matrices[:, 0, 2] = 2 * (X * Z + Y * W)
+        Matrices[:, 1, 0] = 2 * (X * Y + Z * W)
+        Matrices[:, 1, 1] = 1 - 2 * (X * X + Z * Z)
+        Matrices[:, 1, 2] = 2 * (Y * Z - X * W)
+        Matrices[:, 2, 0] = 2 * (X * Z - Y * W)
+        Matrices[:, 2, 1] = 2 * (Y * Z + X * W)
+        Matrices[:, 2, 2] = 1 - 2 * (X * X + Y * Y)
+        Matrices[:, :3, :3] *= numpy.asarray(self.Scales)[:, :, None]
+        Matrices[:, 3, :3] = self.Positions
+        Matrices[:, 3, 3] = 1
+        return Matrices
+
+
+# A convex, closed triangle mesh for collision queries, in the space of the
+# frame holding it
+class CollisionHull:
+    def __init__(self, Name, Positions=(), Triangles=()):
+        self.Name = Name
+        # (Vertices, 3) float32
+        self.Positions = FloatArray(Positions, 3)
+        # (Triangles, 3) int32, counterclockwise seen from outside
+        self.Triangles = IndexArray(Triangles).reshape(-1, 3)
+
+    def __repr__(self):
+        return "[CollisionHull: %s]" % self.Name
+
+
+class AnimationSet:
+    def __init__(self, Name, Tracks=None):
+        self.Name = Name
+        self.Tracks = Tracks if Tracks is not None else []
+        self.MorphTracks = []
+
+
+# Keys of one animated Frame.  Any of the key arrays may be None.
+class AnimationTrack:
+    # AnimationKey types
+    ROTATION = 0
+    SCALE = 1
+    POSITION = 2
+    MATRIX = 4
+
+    def __init__(self, FrameName, KeyTimes):
+        self.FrameName = FrameName
+        self.KeyTimes = IndexArray(KeyTimes)
+
+        # (Keys, 4) quaternions stored w, x, y, z
+        self.RotationKeys = None
+        # (Keys, 3)
+        self.ScaleKeys = None
+        self.PositionKeys = None
+        # (Keys, 4, 4)
+        self.MatrixKeys = None
+
+    def __repr__(self):
+        return "[AnimationTrack: %s]" % self.FrameName
+
+    # "Public" Interface
+
+    def GetKeyCount(self):
+        return len(self.KeyTimes)
+
+    # (type, (Keys, n) array) for every key array that is present, in the
+    # order they are written
+    def GetKeys(self):
+        Keys = []
+        if self.RotationKeys is not None:
+            Keys.append((AnimationTrack.ROTATION, self.RotationKeys))
+        if self.ScaleKeys is not None:
+            Keys.append((AnimationTrack.SCALE, self.ScaleKeys))
+        if self.PositionKeys is not None:
+            Keys.append((AnimationTrack.POSITION, self.PositionKeys))
+        if self.MatrixKeys is not None:
+            Keys.append((AnimationTrack.MATRIX,
+                self.MatrixKeys.reshape(-1, 16)))
+        return Keys
+
+
+# Weights of the morph targets of the meshes of one Frame, by target name
+class MorphTrack:
+    def __init__(self, FrameName, TargetNames, KeyTimes, Weights):
+        self.FrameName = FrameName
+        self.TargetNames = list(TargetNames)
+        self.KeyTimes = IndexArray(KeyTimes)
+        # (Keys, len(TargetNames)) float32
+        self.Weights = FloatArray(Weights, len(self.TargetNames))
+
+    def __repr__(self):
+        return "[MorphTrack: %s]" % self.FrameName
+
+    # "Public" Interface
+
+    def GetKeyCount(self):
+        return len(self.KeyTimes)
@@ -0,0 +1,351 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Scene snapshots store an x_scene.Scene on disk so that .x files, or XNA
+# Models, can be regenerated without Blender, e.g. on build machines.  A
+# snapshot is a directory holding index.json, which describes the scene, and
+# one .npy file per array, which can be memory mapped when loading.
+#
+# Re-serialize snapshots outside of Blender with
+#
+#   python x_snapshot.py [-j JOBS] [--compact] [-p KIND=DECIMALS ...]
+#       SNAPSHOT OUTPUT [SNAPSHOT OUTPUT ...]
+#
+# An OUTPUT ending in .xnb is written as an XNA Model, together with the
+# Texture2D assets of the .dds textures next to the snapshot (see x_xnb.py).
+
+import json
+import os
+import shutil
+
+import numpy
+
+try:
+    from . import x_file
+    from . import x_scene
+    from . import x_writer
+    from . import x_xnb
+except (ImportError, ValueError, SystemError):
+    # Run as a script outside of Blender
+    import x_file
+    import x_scene
+    import x_writer
+    import x_xnb
+
+SNAPSHOT_VERSION = 1
+
+
+# "Public" Interface
+
+def Save(Scene, Path):
+    # Write into a temporary directory first so an interrupted save never
+    # replaces a good snapshot
+    TemporaryPath = Path + ".tmp"
+    if os.path.isdir(TemporaryPath):
+        shutil.rmtree(TemporaryPath)
+    os.makedirs(TemporaryPath)
+
+    Store = _ArrayStore(TemporaryPath)
+    Index = {
+        "Version" : SNAPSHOT_VERSION,
+        "FrameRate" : Scene.FrameRate,
+        "Materials" : [_SaveMaterial(Material)
+            for Material in Scene.Materials],
+        "Frames" : [_SaveFrame(Store, Frame) for Frame in Scene.Frames],
+        "Meshes" : [_SaveMesh(Store, Mesh) for Mesh in Scene.Meshes],
+        "AnimationSets" : [_SaveAnimationSet(Store, Set)
+            for Set in Scene.AnimationSets]}
+
+    with open(os.path.join(TemporaryPath, "index.json"), 'w') as File:
+        json.dump(Index, File, indent=1, sort_keys=True)
+
+    x_file.ReplaceDirectory(TemporaryPath, Path)
+
+
+def Load(Path, MemoryMap=True):
+    with open(os.path.join(Path, "index.json"), 'r') as File:
+        Index = json.load(File)
+    if Index["Version"] != SNAPSHOT_VERSION:
+        raise ValueError("Unsupported snapshot version %s in %s" %
+            (Index["Version"], Path))
+
+    Store = _ArrayStore(Path, MemoryMap)
+    Scene = x_scene.Scene()
+    Scene.FrameRate = Index["FrameRate"]
+    Scene.Materials = [_LoadMaterial(Material)
+        for Material in Index.get("Materials", ())]
+    Scene.Frames = [_LoadFrame(Store, Frame) for Frame in Index["Frames"]]
+    Scene.Meshes = [_LoadMesh(Store, Mesh) for Mesh in Index["Meshes"]]
+    Scene.AnimationSets = [_LoadAnimationSet(Store, Set)
+        for Set in Index["AnimationSets"]]
+    return Scene
+
+
+# Serializes a snapshot into a .x file, or an XNA Model with its textures
+# if OutputPath ends in .xnb.  The file is replaced atomically.  Compact
+# and Precision are passed on to x_writer.XWriter.
+def WriteX(SnapshotPath, OutputPath, Compact=False, Precision=None):
+    Scene = Load(SnapshotPath)
+    if os.path.splitext(OutputPath)[1].lower() == ".xnb":
+        x_xnb.SaveTextures(Scene, os.path.dirname(os.path.abspath(
+            OutputPath)), os.path.dirname(os.path.abspath(SnapshotPath)),
+            Reserved=[OutputPath])
+        return x_file.Save(OutputPath, lambda File: x_xnb.XnbWriter(
+            File).Write(Scene))
+    return x_file.Save(OutputPath, lambda File: x_writer.XWriter(File,
+        Compact=Compact, Precision=Precision).Write(Scene), 'w')
+
+
+def Main(Arguments=None):
+    import argparse
+
+    Parser = argparse.ArgumentParser(description="Write .x files or XNA "
+        ".xnb Models from scene snapshots saved by the DirectX exporter.")
+    Parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="number of snapshots to serialize in parallel")
+    Parser.add_argument("--compact", action="store_true",
+        help="write without indentation and comments, trimming zeros")
+    Parser.add_argument("-p", "--precision", action="append", default=[],
+        metavar="KIND=DECIMALS", help="decimal places for one kind of "
+        "value: %s" % ", ".join(sorted(x_writer.DEFAULT_PRECISION)))
+    Parser.add_argument("Paths", nargs='+', metavar="SNAPSHOT OUTPUT",
+        help="snapshot directory followed by its .x or .xnb output path")
+    Options = Parser.parse_args(Arguments)
+
+    if len(Options.Paths) % 2:
+        Parser.error("each snapshot needs an output path")
+
+    Precision = {}
+    for Setting in Options.precision:
+        Kind, _, Decimals = Setting.partition("=")
+        if Kind not in x_writer.DEFAULT_PRECISION or not Decimals.isdigit():
+            Parser.error("invalid precision %r" % Setting)
+        Precision[Kind] = int(Decimals)
+
+    Jobs = [(Snapshot, Output, Options.compact, Precision) for
+        Snapshot, Output in zip(Options.Paths[0::2], Options.Paths[1::2])]
+
+    if Options.jobs > 1 and len(Jobs) > 1:
+        import multiprocessing
+        Pool = multiprocessing.Pool(min(Options.jobs, len(Jobs)))
+        try:
+            for OutputPath in Pool.map(_WriteXJob, Jobs):
+                print("Wrote %s" % OutputPath)
+        finally:
+            Pool.close()
+            Pool.join()
+    else:
+        for Job in Jobs:
+            print("Wrote %s" % _WriteXJob(Job))
+
+
+# "Private" Methods
+
+def _WriteXJob(Job):
+    return WriteX(*Job)
+
+
+# Saves arrays as numbered .npy files and loads them back
+class _ArrayStore:
+    def __init__(self, Path, MemoryMap=False):
+        self.Path = Path
+        self.MemoryMap = MemoryMap
+        self.Count = 0
+
+    def Save(self, Array):
+        if Array is None:
+            return None
+        Name = "%d.npy" % self.Count
+        self.Count += 1
+        Path = os.path.join(self.Path, Name)
+        if isinstance(Array, x_scene.ChunkedArray):
+            # Copy window by window so the array is never whole in memory
+            Output = numpy.lib.format.open_memmap(Path, mode='w+',
+                dtype=Array.dtype, shape=Array.shape)
+            for Start in range(0, len(Array), x_writer.CHUNK_ROWS):
+                Stop = Start + x_writer.CHUNK_ROWS
+                Output[Start:Stop] = Array[Start:Stop]
+            Output.flush()
+            del Output
+        else:
+            numpy.save(Path, numpy.asarray(Array))
+        return Name
+
+    def Load(self, Name):
+        if Name is None:
+            return None
+        MemoryMapMode = None
+        if self.MemoryMap:
+            MemoryMapMode = 'r'
+        return numpy.load(os.path.join(self.Path, Name),
+            mmap_mode=MemoryMapMode)
+
+
+def _SaveFrame(Store, Frame):
+    return {
+        "Name" : Frame.Name,
+        "Matrix" : Frame.Matrix.reshape(-1).tolist(),
+        "Children" : [_SaveFrame(Store, Child) for Child in Frame.Children],
+        "Meshes" : [_SaveMesh(Store, Mesh) for Mesh in Frame.Meshes],
+        "Instances" : [{
+            "Name" : Table.Name,
+            "Meshes" : [_SaveMesh(Store, Mesh) for Mesh in Table.Meshes],
+            "Positions" : Store.Save(Table.Positions),
+            "Rotations" : Store.Save(Table.Rotations),
+            "Scales" : Store.Save(Table.Scales),
+            "Colors" : Store.Save(Table.Colors)}
+            for Table in Frame.Instances],
+        "Hulls" : [{
+            "Name" : Hull.Name,
+            "Positions" : Store.Save(Hull.Positions),
+            "Triangles" : Store.Save(Hull.Triangles)}
+            for Hull in Frame.Hulls]}
+
+
+def _LoadFrame(Store, Index):
+    Frame = x_scene.Frame(Index["Name"], Index["Matrix"])
+    Frame.Children = [_LoadFrame(Store, Child)
+        for Child in Index["Children"]]
+    Frame.Meshes = [_LoadMesh(Store, Mesh) for Mesh in Index["Meshes"]]
+    for TableIndex in Index.get("Instances", ()):
+        Table = x_scene.InstanceTable(TableIndex["Name"],
+            Store.Load(TableIndex["Positions"]),
+            Store.Load(TableIndex["Rotations"]),
+            Store.Load(TableIndex["Scales"]),
+            Store.Load(TableIndex["Colors"]))
+        Table.Meshes = [_LoadMesh(Store, Mesh)
+            for Mesh in TableIndex["Meshes"]]
+        Frame.Instances.append(Table)
+    Frame.Hulls = [x_scene.CollisionHull(Hull["Name"],
+        Store.Load(Hull["Positions"]), Store.Load(Hull["Triangles"]))
+        for Hull in Index.get("Hulls", ())]
+    return Frame
+
+
+_MESH_ARRAYS = ("Positions", "FaceSizes", "FaceIndices", "Normals",
+    "NormalFaceIndices", "TextureCoords", "VertexColors", "MaterialIndices",
+    "AttributeRanges")
+
+
+def _SaveMesh(Store, Mesh):
+    Index = {
+        "Name" : Mesh.Name,
+        "Materials" : [_SaveMaterial(Material)
+            for Material in Mesh.Materials],
+        "SkinWeights" : [{
+            "FrameName" : Skin.FrameName,
+            "Indices" : Store.Save(Skin.Indices),
+            "Weights" : Store.Save(Skin.Weights),
+            "OffsetMatrix" : Skin.OffsetMatrix.reshape(-1).tolist()}
+            for Skin in Mesh.SkinWeights],
+        "MaxSkinWeightsPerVertex" : Mesh.MaxSkinWeightsPerVertex,
+        "MaxSkinWeightsPerFace" : Mesh.MaxSkinWeightsPerFace,
+        "BonePalette" : Mesh.BonePalette,
+        "ExtraTextureCoords" : [Store.Save(Coords)
+            for Coords in Mesh.ExtraTextureCoords],
+        "MorphTargets" : [{
+            "Name" : Target.Name,
+            "Indices" : Store.Save(Target.Indices),
+            "Offsets" : Store.Save(Target.Offsets)}
+            for Target in Mesh.MorphTargets]}
+    for Name in _MESH_ARRAYS:
+        Index[Name] = Store.Save(getattr(Mesh, Name))
+    return Index
+
+
+def _LoadMesh(Store, Index):
+    Mesh = x_scene.Mesh(Index["Name"])
+    for Name in _MESH_ARRAYS:
+        setattr(Mesh, Name, Store.Load(Index.get(Name)))
+    Mesh.Materials = [_LoadMaterial(Material)
+        for Material in Index["Materials"]]
+    Mesh.SkinWeights = [x_scene.SkinWeights(Skin["FrameName"],
+        Store.Load(Skin["Indices"]), Store.Load(Skin["Weights"]),
+        Skin["OffsetMatrix"]) for Skin in Index["SkinWeights"]]
+    Mesh.MaxSkinWeightsPerVertex = Index["MaxSkinWeightsPerVertex"]
+    Mesh.MaxSkinWeightsPerFace = Index["MaxSkinWeightsPerFace"]
+    Mesh.BonePalette = Index.get("BonePalette", False)
+    Mesh.ExtraTextureCoords = [Store.Load(Coords)
+        for Coords in Index.get("ExtraTextureCoords", ())]
+    Mesh.MorphTargets = [x_scene.MorphTarget(Target["Name"],
+        Store.Load(Target["Indices"]), Store.Load(Target["Offsets"]))
+        for Target in Index.get("MorphTargets", ())]
+    return Mesh
+
+
+def _SaveMaterial(Material):
+    return {
+        "Name" : Material.Name,
+        "Diffuse" : numpy.asarray(Material.Diffuse).tolist(),
+        "Power" : float(Material.Power),
+        "Specular" : numpy.asarray(Material.Specular).tolist(),
+        "Emissive" : numpy.asarray(Material.Emissive).tolist(),
+        "TextureFilename" : Material.TextureFilename}
+
+
+def _LoadMaterial(Index):
+    Material = x_scene.Material(Index["Name"])
+    Material.Diffuse = x_scene.FloatArray(Index["Diffuse"])
+    Material.Power = Index["Power"]
+    Material.Specular = x_scene.FloatArray(Index["Specular"])
+    Material.Emissive = x_scene.FloatArray(Index["Emissive"])
+    Material.TextureFilename = Index["TextureFilename"]
+    return Material
+
+
+_TRACK_ARRAYS = ("RotationKeys", "ScaleKeys", "PositionKeys", "MatrixKeys")
+
+
+def _SaveAnimationSet(Store, Set):
+    Tracks = []
+    for Track in Set.Tracks:
+        TrackIndex = {
+            "FrameName" : Track.FrameName,
+            "KeyTimes" : Store.Save(Track.KeyTimes)}
+        for Name in _TRACK_ARRAYS:
+            TrackIndex[Name] = Store.Save(getattr(Track, Name))
+        Tracks.append(TrackIndex)
+    MorphTracks = [{
+        "FrameName" : Track.FrameName,
+        "TargetNames" : Track.TargetNames,
+        "KeyTimes" : Store.Save(Track.KeyTimes),
+        "Weights" : Store.Save(Track.Weights)}
+        for Track in Set.MorphTracks]
+    return {"Name" : Set.Name, "Tracks" : Tracks,
+        "MorphTracks" : MorphTracks}
+
+
+def _LoadAnimationSet(Store, Index):
+    Set = x_scene.AnimationSet(Index["Name"])
+    for TrackIndex in Index["Tracks"]:
+        Track = x_scene.AnimationTrack(TrackIndex["FrameName"],
+            Store.Load(TrackIndex["KeyTimes"]))
+        for Name in _TRACK_ARRAYS:
+            setattr(Track, Name, Store.Load(TrackIndex[Name]))
+        Set.Tracks.append(Track)
+    Set.MorphTracks = [x_scene.MorphTrack(Track["FrameName"],
+        Track["TargetNames"], Store.Load(Track["KeyTimes"]),
+        Store.Load(Track["Weights"]))
+        for Track in Index.get("MorphTracks", ())]
+    return Set
+
+
+if __name__ == "__main__":
+    Main()
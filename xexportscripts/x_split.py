@@ -0,0 +1,150 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Splits one gathered x_scene.Scene into several .x files, e.g. one per root
+# object, so a game can stream them in individually.  Materials and
+# animation sets can optionally go into files of their own that the parts
+# share.  A JSON manifest records what went where.
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import x_file
+    from . import x_scene
+except (ImportError, ValueError, SystemError):
+    import x_file
+    import x_scene
+
+MANIFEST_VERSION = 1
+
+
+# One output file
+class SplitFile:
+    def __init__(self, Name, FilePath, Scene, MaterialReferences=False):
+        self.Name = Name
+        self.FilePath = FilePath
+        self.Scene = Scene
+        # Whether mesh materials refer to a shared materials file
+        self.MaterialReferences = MaterialReferences
+
+    def __repr__(self):
+        return "[SplitFile: {}]".format(self.FilePath)
+
+
+# "Public" Interface
+
+# Splits Scene, whose only top level frame is RootFrame, into one scene per
+# group.  Groups is a list of (Name, Frames) pairs, where Frames are children
+# of RootFrame.  Each part keeps RootFrame's transform and the animation
+# tracks of its own frames.  Returns a list of (Name, Scene) pairs.
+def SplitScene(Scene, RootFrame, Groups):
+    Parts = []
+    for Name, Frames in Groups:
+        Part = x_scene.Scene()
+        Root = x_scene.Frame(RootFrame.Name, RootFrame.Matrix)
+        Root.Children = list(Frames)
+        Part.Frames.append(Root)
+
+        FrameNames = set(Frame.Name for Frame in Part.IterFrames())
+        for Set in Scene.AnimationSets:
+            Tracks = [Track for Track in Set.Tracks
+                if Track.FrameName in FrameNames]
+            MorphTracks = [Track for Track in Set.MorphTracks
+                if Track.FrameName in FrameNames]
+            if Tracks or MorphTracks:
+                PartSet = x_scene.AnimationSet(Set.Name, Tracks)
+                PartSet.MorphTracks = MorphTracks
+                Part.AnimationSets.append(PartSet)
+        if Part.AnimationSets:
+            Part.FrameRate = Scene.FrameRate
+
+        Parts.append((Name, Part))
+    return Parts
+
+
+# Returns a scene holding every distinct (by name) material used by Scenes
+def GatherMaterials(Scenes):
+    Materials = x_scene.Scene()
+    Names = set()
+    for Scene in Scenes:
+        for Mesh in Scene.IterMeshes():
+            for Material in Mesh.Materials:
+                if Material.Name not in Names:
+                    Names.add(Material.Name)
+                    Materials.Materials.append(Material)
+    return Materials
+
+
+# Moves the animation sets of Scene into a scene of their own
+def TakeAnimations(Scene):
+    Animations = x_scene.Scene()
+    Animations.AnimationSets = Scene.AnimationSets
+    Animations.FrameRate = Scene.FrameRate
+    Scene.AnimationSets = []
+    Scene.FrameRate = None
+    return Animations
+
+
+# Writes Files concurrently, each through a writer from
+# CreateWriter(File, SplitFile), then the manifest.  Each file is written to
+# a temporary path first and only replaces its target once complete.  If
+# Names is given, only the files with those names are written; the manifest
+# always lists all of Files.  Mode is the mode the files are opened with.
+def WriteFiles(Files, CreateWriter, ManifestPath, Jobs=None, Names=None,
+    Mode='w'):
+    Written = [Split for Split in Files if Names is None or
+        Split.Name in Names]
+    if Jobs is None:
+        Jobs = multiprocessing.cpu_count()
+    Jobs = max(1, min(Jobs, len(Written)))
+
+    def WriteFile(Split):
+        x_file.Save(Split.FilePath, lambda File:
+            CreateWriter(File, Split).Write(Split.Scene), Mode)
+
+    with ThreadPoolExecutor(Jobs) as Executor:
+        # list() re-raises the first error of any writer
+        list(Executor.map(WriteFile, Written))
+
+    Manifest = {
+        "Version" : MANIFEST_VERSION,
+        "Files" : [_DescribeFile(Split, ManifestPath) for Split in Files]}
+    x_file.Save(ManifestPath, lambda File:
+        json.dump(Manifest, File, indent=1, sort_keys=True), 'w')
+
+
+# "Private" Methods
+
+def _DescribeFile(Split, ManifestPath):
+    Scene = Split.Scene
+    return {
+        "Name" : Split.Name,
+        # Relative to the manifest so the output folder can be moved
+        "File" : os.path.relpath(Split.FilePath,
+            os.path.dirname(os.path.abspath(ManifestPath))),
+        "Frames" : [Frame.Name for Frame in Scene.IterFrames()],
+        "Materials" : sorted(set(Material.Name
+            for Mesh in Scene.IterMeshes() for Material in Mesh.Materials) |
+            set(Material.Name for Material in Scene.Materials)),
+        "MaterialReferences" : Split.MaterialReferences,
+        "AnimationSets" : [Set.Name for Set in Scene.AnimationSets]}
@@ -0,0 +1,374 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Converts material textures into DXT compressed .dds files with a full mip
+# chain, so the game does not have to decode, resize and mipmap them at
+# load time.  Images are scaled to powers of two no larger than a maximum
+# size.  Does not depend on Blender: images come in as arrays of RGBA
+# pixels.
+#
+# TextureCache remembers a hash of each converted source file, together with
+# the conversion settings, in a small JSON index next to the .dds files, so
+# unchanged textures are never converted again.
+
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+import numpy
+
+try:
+    from . import x_file
+except (ImportError, ValueError, SystemError):
+    import x_file
+
+CACHE_INDEX_NAME = "textures.cache.json"
+# Part of every cache key, bump when the output of a conversion changes
+CACHE_VERSION = 1
+
+FORMATS = ("AUTO", "DXT1", "DXT5")
+
+# DDS_HEADER flags
+DDSD_CAPS = 0x1
+DDSD_HEIGHT = 0x2
+DDSD_WIDTH = 0x4
+DDSD_PIXELFORMAT = 0x1000
+DDSD_MIPMAPCOUNT = 0x20000
+DDSD_LINEARSIZE = 0x80000
+DDPF_FOURCC = 0x4
+DDSCAPS_COMPLEX = 0x8
+DDSCAPS_TEXTURE = 0x1000
+DDSCAPS_MIPMAP = 0x400000
+
+
+# "Public" Interface
+
+class TextureCache:
+    def __init__(self, Directory, MaxSize=1024, Format="AUTO"):
+        if Format not in FORMATS:
+            raise ValueError("Unknown texture format %r" % Format)
+        self.Directory = Directory
+        self.MaxSize = MaxSize
+        self.Format = Format
+
+        self.IndexPath = os.path.join(Directory, CACHE_INDEX_NAME)
+        # Maps .dds file names to the key of their source
+        self.Index = {}
+        if os.path.isfile(self.IndexPath):
+            with open(self.IndexPath, 'r') as File:
+                self.Index = json.load(File)
+
+        # File names handed out by this cache, by key, so that two sources
+        # with the same name do not overwrite each other
+        self.__Claimed = {}
+
+    # Returns the name of the .dds file, in Directory, for the image at
+    # SourcePath, converting it only if it is not cached yet.  Name is the
+    # preferred file name without extension.  LoadPixels() returns the image
+    # as a (Height, Width, 3 or 4) array of floats from 0 to 1, top row
+    # first.  Images without a source file are keyed by their pixels.
+    def Convert(self, Name, SourcePath, LoadPixels):
+        Pixels = None
+        Hash = hashlib.sha1()
+        if SourcePath and os.path.isfile(SourcePath):
+            with open(SourcePath, 'rb') as File:
+                for Block in iter(lambda: File.read(1 << 20), b""):
+                    Hash.update(Block)
+        else:
+            Pixels = numpy.ascontiguousarray(LoadPixels(),
+                dtype=numpy.float32)
+            Hash.update(struct.pack("<II", *Pixels.shape[:2]))
+            Hash.update(Pixels.tobytes())
+        Key = "%s:%s:%d:%d" % (Hash.hexdigest(), self.Format, self.MaxSize,
+            CACHE_VERSION)
+
+        FileName = self.__ClaimFileName(Name, Key)
+        Path = os.path.join(self.Directory, FileName)
+        if self.Index.get(FileName) == Key and os.path.isfile(Path):
+            return FileName
+
+        if Pixels is None:
+            Pixels = LoadPixels()
+        Pixels = ResizeToPowerOfTwo(Pixels, self.MaxSize)
+        Format = self.Format
+        if Format == "AUTO":
+            Format = "DXT1"
+            if Pixels.shape[2] == 4 and (Pixels[:, :, 3] < 1.0).any():
+                Format = "DXT5"
+
+        x_file.Save(Path, lambda File: WriteDDS(File,
+            GenerateMipChain(Pixels), Format))
+
+        self.Index[FileName] = Key
+        self.__SaveIndex()
+        return FileName
+
+    # "Private" Methods
+
+    def __ClaimFileName(self, Name, Key):
+        if Key in self.__Claimed:
+            return self.__Claimed[Key]
+        Taken = set(self.__Claimed.values())
+        FileName = "%s.dds" % Name
+        Number = 1
+        while FileName in Taken:
+            Number += 1
+            FileName = "%s_%d.dds" % (Name, Number)
+        self.__Claimed[Key] = FileName
+        return FileName
+
+    def __SaveIndex(self):
+        x_file.Save(self.IndexPath, lambda File: json.dump(self.Index, File,
+            indent=1, sort_keys=True), 'w')
+
+
+# Scales Pixels, a (Height, Width, Channels) array, to the nearest power of
+# two in each direction, at most MaxSize.  Returns RGBA.
+def ResizeToPowerOfTwo(Pixels, MaxSize):
+    Pixels = numpy.asarray(Pixels, dtype=numpy.float32)
+    if Pixels.shape[2] == 3:
+        Alpha = numpy.ones(Pixels.shape[:2] + (1,), dtype=numpy.float32)
+        Pixels = numpy.concatenate((Pixels, Alpha), axis=2)
+
+    Height, Width = Pixels.shape[:2]
+    TargetHeight = _PowerOfTwo(Height, MaxSize)
+    TargetWidth = _PowerOfTwo(Width, MaxSize)
+    if TargetHeight != Height:
+        Pixels = numpy.tensordot(_ResampleWeights(Height, TargetHeight),
+            Pixels, axes=(1, 0))
+    if TargetWidth != Width:
+        Pixels = numpy.tensordot(_ResampleWeights(Width, TargetWidth),
+            Pixels, axes=(1, 1)).transpose(1, 0, 2)
+    return numpy.ascontiguousarray(Pixels, dtype=numpy.float32)
+
+
+# Returns Pixels followed by each half sized version down to 1 x 1
+def GenerateMipChain(Pixels):
+    Mips = [Pixels]
+    while Pixels.shape[0] > 1 or Pixels.shape[1] > 1:
+        if Pixels.shape[0] > 1:
+            Pixels = (Pixels[0::2] + Pixels[1::2]) / 2
+        if Pixels.shape[1] > 1:
+            Pixels = (Pixels[:, 0::2] + Pixels[:, 1::2]) / 2
+        Mips.append(Pixels)
+    return Mips
+
+
+# Writes Mips, RGBA float images from largest to smallest, as a DXT1 or DXT5
+# compressed .dds file
+def WriteDDS(File, Mips, Format):
+    Height, Width = Mips[0].shape[:2]
+    Data = [EncodeBlocks(Mip, Format) for Mip in Mips]
+
+    File.write(b"DDS ")
+    File.write(struct.pack("<7I", 124, DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH |
+        DDSD_PIXELFORMAT | DDSD_MIPMAPCOUNT | DDSD_LINEARSIZE, Height, Width,
+        len(Data[0]), 0, len(Mips)))
+    File.write(struct.pack("<11I", *([0] * 11)))
+    # DDS_PIXELFORMAT
+    File.write(struct.pack("<II4s5I", 32, DDPF_FOURCC, Format.encode("ascii"),
+        0, 0, 0, 0, 0))
+    File.write(struct.pack("<5I", DDSCAPS_TEXTURE | DDSCAPS_COMPLEX |
+        DDSCAPS_MIPMAP, 0, 0, 0, 0))
+    for Level in Data:
+        File.write(Level)
+
+
+# Reads a DXT1 or DXT5 .dds file as written by WriteDDS.  Returns its
+# format, width, height and the bytes of each mip level, largest first.
+def ReadDDS(File):
+    Header = File.read(128)
+    if len(Header) != 128 or Header[:4] != b"DDS ":
+        raise ValueError("Not a .dds file")
+    Flags, Height, Width = struct.unpack("<III", Header[8:20])
+    MipCount = 1
+    if Flags & DDSD_MIPMAPCOUNT:
+        MipCount = max(1, struct.unpack("<I", Header[28:32])[0])
+    Format = Header[84:88].decode("ascii", "replace")
+    if Format not in ("DXT1", "DXT5"):
+        raise ValueError("Unsupported .dds format %r" % Format)
+
+    BlockSize = 8 if Format == "DXT1" else 16
+    Levels = []
+    for Level in range(MipCount):
+        LevelWidth = max(1, Width >> Level)
+        LevelHeight = max(1, Height >> Level)
+        Size = ((LevelWidth + 3) // 4) * ((LevelHeight + 3) // 4) * BlockSize
+        Data = File.read(Size)
+        if len(Data) != Size:
+            raise ValueError("Truncated .dds file")
+        Levels.append(Data)
+    return Format, Width, Height, Levels
+
+
+# Writes an RGBA float image, top row first, as an 8 bit .png file
+def WritePNG(File, Pixels):
+    Pixels = numpy.clip(numpy.round(numpy.asarray(Pixels) * 255), 0,
+        255).astype(numpy.uint8)
+    Height, Width = Pixels.shape[:2]
+    # Every row starts with filter type 0
+    Rows = numpy.zeros((Height, Width * 4 + 1), dtype=numpy.uint8)
+    Rows[:, 1:] = Pixels.reshape(Height, Width * 4)
+
+    File.write(b"\x89PNG\r\n\x1a\n")
+    for Type, Data in ((b"IHDR", struct.pack(">IIBBBBB", Width, Height, 8, 6,
+        0, 0, 0)), (b"IDAT", zlib.compress(Rows.tobytes(), 6)),
+        (b"IEND", b"")):
+        File.write(struct.pack(">I", len(Data)) + Type + Data)
+        File.write(struct.pack(">I", zlib.crc32(Type + Data) & 0xFFFFFFFF))
+
+
+# Compresses an RGBA float image into DXT1 or DXT5 blocks
+def EncodeBlocks(Pixels, Format):
+    Blocks = _GetBlocks(numpy.clip(numpy.round(numpy.asarray(Pixels) * 255),
+        0, 255))
+    Colors = _EncodeColorBlocks(Blocks[:, :, :3])
+    if Format == "DXT1":
+        return Colors.tobytes()
+    Alphas = _EncodeAlphaBlocks(Blocks[:, :, 3])
+    return numpy.concatenate((Alphas, Colors), axis=1).tobytes()
+
+
+# "Private" Methods
+
+def _PowerOfTwo(Size, MaxSize):
+    Power = 1
+    while Power * 2 <= MaxSize and Power * 3 < Size * 2:
+        Power *= 2
+    return Power
+
+
+# (Target, Source) weights that average the source pixels each target pixel
+# covers when shrinking, and interpolate linearly when growing
+def _ResampleWeights(Source, Target):
+    Scale = float(Source) / Target
+    Weights = numpy.zeros((Target, Source), dtype=numpy.float32)
+    if Scale >= 1.0:
+        Edges = numpy.arange(Target + 1) * Scale
+        Pixels = numpy.arange(Source)
+        Overlap = numpy.minimum(Pixels + 1, Edges[1:, None]) - \
+            numpy.maximum(Pixels, Edges[:-1, None])
+        Weights[:] = numpy.clip(Overlap, 0, None) / Scale
+    else:
+        Centers = numpy.clip((numpy.arange(Target) + 0.5) * Scale - 0.5, 0,
+            Source - 1)
+        Low = numpy.floor(Centers).astype(numpy.int64)
+        High = numpy.minimum(Low + 1, Source - 1)
+        Fraction = Centers - Low
+        Rows = numpy.arange(Target)
+        numpy.add.at(Weights, (Rows, Low), 1 - Fraction)
+        numpy.add.at(Weights, (Rows, High), Fraction)
+    return Weights
+
+
+# Splits an image into (Blocks, 16, Channels) 4 x 4 blocks, row by row.
+# Edges are repeated to fill partial blocks.
+def _GetBlocks(Pixels):
+    Height, Width, Channels = Pixels.shape
+    Padded = numpy.pad(Pixels, ((0, -Height % 4), (0, -Width % 4), (0, 0)),
+        mode='edge')
+    Rows, Columns = Padded.shape[0] // 4, Padded.shape[1] // 4
+    return Padded.reshape(Rows, 4, Columns, 4, Channels).transpose(0, 2, 1, 3,
+        4).reshape(-1, 16, Channels)
+
+
+# Packs (Blocks, 3) colors from 0 to 255 into RGB 565
+def _Pack565(Colors):
+    Colors = numpy.round(Colors * (31 / 255.0, 63 / 255.0, 31 / 255.0)
+        ).astype(numpy.uint16)
+    return (Colors[:, 0] << 11) | (Colors[:, 1] << 5) | Colors[:, 2]
+
+
+def _Unpack565(Packed):
+    Packed = Packed.astype(numpy.uint32)
+    return numpy.column_stack(((Packed >> 11) & 31, (Packed >> 5) & 63,
+        Packed & 31)) * (255 / 31.0, 255 / 63.0, 255 / 31.0)
+
+
+# Encodes (Blocks, 16, 3) colors into (Blocks, 8) bytes of four color DXT1
+# blocks.  The endpoints are the extremes of each block's colors along their
+# principal axis, inset slightly so the interpolated colors land inside.
+def _EncodeColorBlocks(Blocks):
+    Mean = Blocks.mean(axis=1)
+    Centered = Blocks - Mean[:, None, :]
+    Covariance = numpy.einsum('bpi,bpj->bij', Centered, Centered)
+
+    # A few power iterations, starting from the largest extent
+    Axis = Blocks.max(axis=1) - Blocks.min(axis=1)
+    for Iteration in range(4):
+        Axis = numpy.einsum('bij,bj->bi', Covariance, Axis)
+        Length = numpy.sqrt((Axis ** 2).sum(axis=1, keepdims=True))
+        Axis /= numpy.maximum(Length, 1e-9)
+
+    Projection = numpy.einsum('bpi,bi->bp', Centered, Axis)
+    Low = Projection.min(axis=1)
+    High = Projection.max(axis=1)
+    Inset = (High - Low) / 16
+    Color0 = _Pack565(numpy.clip(Mean + (High - Inset)[:, None] * Axis, 0,
+        255))
+    Color1 = _Pack565(numpy.clip(Mean + (Low + Inset)[:, None] * Axis, 0,
+        255))
+
+    # Color0 > Color1 selects four color mode; equal endpoints use index 0
+    Swap = Color0 < Color1
+    Color0[Swap], Color1[Swap] = Color1[Swap], Color0[Swap].copy()
+
+    End0 = _Unpack565(Color0)
+    End1 = _Unpack565(Color1)
+    Palette = numpy.stack((End0, End1, (2 * End0 + End1) / 3,
+        (End0 + 2 * End1) / 3), axis=1)
+    Distances = ((Blocks[:, :, None, :] - Palette[:, None, :, :]) ** 2).sum(
+        axis=3)
+    Indexes = Distances.argmin(axis=2).astype(numpy.uint32)
+    Indexes[Color0 == Color1] = 0
+
+    Bits = (Indexes << (2 * numpy.arange(16, dtype=numpy.uint32))).sum(
+        axis=1, dtype=numpy.uint32)
+    Encoded = numpy.empty(len(Blocks), dtype=[('Color0', '<u2'),
+        ('Color1', '<u2'), ('Indexes', '<u4')])
+    Encoded['Color0'] = Color0
+    Encoded['Color1'] = Color1
+    Encoded['Indexes'] = Bits
+    return Encoded.view(numpy.uint8).reshape(len(Blocks), 8)
+
+
+# Encodes (Blocks, 16) alphas from 0 to 255 into (Blocks, 8) bytes of eight
+# alpha DXT5 blocks
+def _EncodeAlphaBlocks(Blocks):
+    Alpha0 = Blocks.max(axis=1)
+    Alpha1 = Blocks.min(axis=1)
+
+    # Codes 0 and 1 are the endpoints, 2 to 7 lie between them
+    Steps = numpy.array([0, 7, 1, 2, 3, 4, 5, 6], dtype=numpy.float64)
+    Palette = (Alpha0[:, None] * (7 - Steps) + Alpha1[:, None] * Steps) / 7
+    Indexes = numpy.abs(Blocks[:, :, None] - Palette[:, None, :]).argmin(
+        axis=2).astype(numpy.uint64)
+    Indexes[Alpha0 == Alpha1] = 0
+
+    Bits = (Indexes << (3 * numpy.arange(16, dtype=numpy.uint64))).sum(
+        axis=1, dtype=numpy.uint64)
+    Encoded = numpy.empty((len(Blocks), 8), dtype=numpy.uint8)
+    Encoded[:, 0] = Alpha0
+    Encoded[:, 1] = Alpha1
+    Encoded[:, 2:] = Bits.astype('<u8').view(numpy.uint8).reshape(-1, 8)[:,
+        :6]
+    return Encoded
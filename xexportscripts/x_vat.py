@@ -0,0 +1,228 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Bakes vertex animation textures, so that many instances of an animated
+# mesh can be drawn without skinning each of them: a vertex shader reads
+# the position and normal of its vertex for the current frame from two
+# floating point textures instead.
+#
+# Every frame holds one texel per vertex of the source mesh, filling rows
+# of Width texels from the left, so a frame takes RowsPerFrame rows.  The
+# frames of all clips follow each other from the top row down, starting a
+# new texture page whenever FramesPerPage frames fill one, so no texture is
+# taller than MAX_HEIGHT.  All pages have the same Height.  The texel of
+# vertex i in frame f is on page f // FramesPerPage, at column i % Width
+# and row (f % FramesPerPage) * RowsPerFrame + i // Width.  RGB is the
+# position, or the unit normal, in the space of the mesh, and A is 1.
+#
+# The mesh gets a second set of texture coordinates pointing at the center
+# of each vertex's texel in the first frame.  To play frame f, sample its
+# page and add (f % FramesPerPage) * RowsPerFrame / Height to their v.  A
+# JSON index next to the exported file holds the FrameRate of the clips and
+# describes each baked mesh:
+#
+#   Mesh            name of the mesh
+#   Positions       file names of the position texture pages
+#   Normals         file names of the normal texture pages
+#   Format          "FLOAT" (32 bit) or "HALF" (16 bit) RGBA floats
+#   VertexCount, Width, Height, RowsPerFrame, FramesPerPage
+#   Clips           Name, FirstFrame and FrameCount of each clip
+#
+# Textures are uncompressed .dds files without mipmaps.  Does not depend on
+# Blender.
+
+import json
+import math
+import os
+import struct
+
+import numpy
+
+try:
+    from . import x_file
+    from . import x_texture
+except (ImportError, ValueError, SystemError):
+    import x_file
+    import x_texture
+
+# Version 2 split the textures into pages
+VAT_VERSION = 2
+
+# Widest and tallest texture written, a limit every Direct3D 9 card supports
+MAX_WIDTH = 4096
+MAX_HEIGHT = 4096
+
+# DDS_HEADER flag for uncompressed data, which x_texture does not write
+DDSD_PITCH = 0x8
+
+# D3DFORMAT values, which stand in for a FourCC in the DDS_PIXELFORMAT
+FORMATS = {
+    "FLOAT" : (116, numpy.float32),
+    "HALF" : (113, numpy.float16)}
+
+
+# "Public" Interface
+
+# The animation of one mesh, a list of clips of sampled vertices.  Raises
+# ValueError if a frame of VertexCount vertices does not fit on a page.
+class VertexAnimation:
+    def __init__(self, Name, VertexCount, FrameRate=None, MaxWidth=MAX_WIDTH,
+        MaxHeight=MAX_HEIGHT):
+        self.Name = Name
+        self.VertexCount = VertexCount
+        # Frames per second the clips were sampled at
+        self.FrameRate = FrameRate
+        self.Width = max(1, min(VertexCount, MaxWidth))
+        self.RowsPerFrame = max(1, int(math.ceil(float(VertexCount) /
+            self.Width)))
+        if self.RowsPerFrame > MaxHeight:
+            raise ValueError("%d vertices do not fit in a %d x %d texture" %
+                (VertexCount, self.Width, MaxHeight))
+        self.MaxFramesPerPage = MaxHeight // self.RowsPerFrame
+
+        # (Name, (Frames, VertexCount, 3) positions, normals)
+        self.Clips = []
+
+    def __repr__(self):
+        return "[VertexAnimation: %s]" % self.Name
+
+    # "Public" Interface
+
+    def AddClip(self, Name, Positions, Normals):
+        Positions = numpy.asarray(Positions, dtype=numpy.float32).reshape(
+            -1, self.VertexCount, 3)
+        Normals = numpy.asarray(Normals, dtype=numpy.float32).reshape(
+            -1, self.VertexCount, 3)
+        self.Clips.append((Name, Positions, Normals))
+
+    def GetFrameCount(self):
+        return sum(len(Positions) for Name, Positions, Normals in self.Clips)
+
+    def GetFramesPerPage(self):
+        return max(1, min(self.GetFrameCount(), self.MaxFramesPerPage))
+
+    def GetPageCount(self):
+        return max(1, int(math.ceil(float(self.GetFrameCount()) /
+            self.GetFramesPerPage())))
+
+    # Rows of every page
+    def GetHeight(self):
+        return self.GetFramesPerPage() * self.RowsPerFrame
+
+    # (len(VertexIndexes), 2) texture coordinates of the texels of the
+    # source vertices VertexIndexes in the first frame
+    def GetTextureCoords(self, VertexIndexes):
+        VertexIndexes = numpy.asarray(VertexIndexes, dtype=numpy.int64)
+        Columns = VertexIndexes % self.Width
+        Rows = VertexIndexes // self.Width
+        return numpy.column_stack(((Columns + 0.5) / self.Width,
+            (Rows + 0.5) / self.GetHeight())).astype(numpy.float32)
+
+    # Writes the textures into Directory as "<BaseName>_<Name>.positions.dds"
+    # and ".normals.dds", or "<BaseName>_<Name>.positions.<page>.dds" and
+    # so on if there are several pages, and returns the entry of the index
+    def Save(self, Directory, BaseName, Format="FLOAT"):
+        Entry = {
+            "Mesh" : self.Name,
+            "Format" : Format,
+            "VertexCount" : self.VertexCount,
+            "Width" : self.Width,
+            "Height" : self.GetHeight(),
+            "RowsPerFrame" : self.RowsPerFrame,
+            "FramesPerPage" : self.GetFramesPerPage(),
+            "Clips" : []}
+
+        FirstFrame = 0
+        for Name, Positions, Normals in self.Clips:
+            Entry["Clips"].append({
+                "Name" : Name,
+                "FirstFrame" : FirstFrame,
+                "FrameCount" : len(Positions)})
+            FirstFrame += len(Positions)
+
+        for Kind, Index in (("Positions", 1), ("Normals", 2)):
+            Entry[Kind] = []
+            for Page, Pixels in enumerate(self.__GetPages([Clip[Index]
+                for Clip in self.Clips])):
+                FileName = "%s_%s.%s.dds" % (BaseName, self.Name,
+                    Kind.lower())
+                if self.GetPageCount() > 1:
+                    FileName = "%s_%s.%s.%d.dds" % (BaseName, self.Name,
+                        Kind.lower(), Page)
+                x_file.Save(os.path.join(Directory, FileName),
+                    lambda File: WriteFloatDDS(File, Pixels, Format))
+                Entry[Kind].append(FileName)
+        return Entry
+
+    # "Private" Methods
+
+    # Lays out the (Frames, VertexCount, 3) arrays of Clips as RGBA images,
+    # yielding one page at a time
+    def __GetPages(self, Clips):
+        FramesPerPage = self.GetFramesPerPage()
+        Frames = [Frame for Frames in Clips for Frame in Frames]
+        for First in range(0, max(1, len(Frames)), FramesPerPage):
+            Pixels = numpy.zeros((FramesPerPage, self.RowsPerFrame *
+                self.Width, 4), dtype=numpy.float32)
+            Pixels[:, :, 3] = 1.0
+            for Slot, Frame in enumerate(Frames[First:First +
+                FramesPerPage]):
+                Pixels[Slot, :self.VertexCount, :3] = Frame
+            yield Pixels.reshape(self.GetHeight(), self.Width, 4)
+
+
+# Writes an RGBA float image, top row first, as an uncompressed .dds file
+# of 32 or 16 bit floats
+def WriteFloatDDS(File, Pixels, Format="FLOAT"):
+    FourCC, Type = FORMATS[Format]
+    Height, Width = Pixels.shape[:2]
+    Data = numpy.ascontiguousarray(Pixels, dtype=numpy.dtype(
+        Type).newbyteorder('<')).tobytes()
+
+    File.write(b"DDS ")
+    File.write(struct.pack("<7I", 124, x_texture.DDSD_CAPS |
+        x_texture.DDSD_HEIGHT | x_texture.DDSD_WIDTH |
+        x_texture.DDSD_PIXELFORMAT | DDSD_PITCH, Height, Width,
+        len(Data) // max(1, Height), 0, 1))
+    File.write(struct.pack("<11I", *([0] * 11)))
+    # DDS_PIXELFORMAT
+    File.write(struct.pack("<8I", 32, x_texture.DDPF_FOURCC, FourCC, 0, 0,
+        0, 0, 0))
+    File.write(struct.pack("<5I", x_texture.DDSCAPS_TEXTURE, 0, 0, 0, 0))
+    File.write(Data)
+
+
+# Writes the textures of Animations next to Path and their index to Path,
+# e.g. "model.vat.json" and "model_Body.positions.dds".  The frame rate of
+# the index is that of the first animation.
+def Save(Animations, Path, Format="FLOAT"):
+    Directory = os.path.dirname(os.path.abspath(Path))
+    BaseName = os.path.basename(Path).split(".")[0]
+    FrameRate = None
+    if Animations:
+        FrameRate = Animations[0].FrameRate
+    Index = {
+        "Version" : VAT_VERSION,
+        "FrameRate" : FrameRate,
+        "Meshes" : [Animation.Save(Directory, BaseName, Format)
+            for Animation in Animations]}
+    x_file.Save(Path, lambda File: File.write(json.dumps(Index,
+        indent=1, sort_keys=True).encode("utf-8")))
+    return Path
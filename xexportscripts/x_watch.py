@@ -0,0 +1,241 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Watch mode keeps an export up to date while the scene is being edited.
+#
+# Blender 2.6x has no depsgraph handlers, so scene_update_post stands in for
+# them: after each scene update the objects flagged is_updated or
+# is_updated_data are noted.  Once no change has come in for DEBOUNCE_TIME
+# seconds, or as soon as the .blend file is saved, the root ExportObjects
+# holding those objects are gathered again while the frames of all the
+# others are reused from the previous export.  The output is then written on
+# a worker thread and replaces the target file(s) atomically.
+
+import threading
+import time
+
+import bpy
+
+from . import export_x
+
+# Seconds without changes before exporting
+DEBOUNCE_TIME = 0.5
+
+_Watcher = None
+
+
+# "Public" Interface
+
+# Starts watching Scene, exporting with the operator properties in Options
+def Start(Options, Scene):
+    global _Watcher
+    Stop()
+    _Watcher = SceneWatcher(export_x.ExportConfig(Options), Scene.name)
+    _Watcher.Start()
+
+
+def Stop():
+    global _Watcher
+    if _Watcher is not None:
+        _Watcher.Stop()
+        _Watcher = None
+
+
+def IsWatching():
+    return _Watcher is not None and _Watcher.IsWatching()
+
+
+class SceneWatcher:
+    def __init__(self, Config, SceneName):
+        self.Config = Config
+        self.SceneName = SceneName
+
+        # Frames of the last export by root object name
+        self.RootFrames = {}
+        # Names of the objects changed since the last export, None if
+        # everything needs to be exported
+        self.ChangedNames = None
+        self.LastChangeTime = 0.0
+
+        self.__Job = None
+        self.__Exporting = False
+        self.__SkipUpdate = False
+
+    # "Public" Interface
+
+    def Start(self):
+        bpy.app.handlers.scene_update_post.append(self.__OnSceneUpdate)
+        bpy.app.handlers.save_post.append(self.__OnSave)
+
+    def Stop(self):
+        if self.__OnSceneUpdate in bpy.app.handlers.scene_update_post:
+            bpy.app.handlers.scene_update_post.remove(self.__OnSceneUpdate)
+        if self.__OnSave in bpy.app.handlers.save_post:
+            bpy.app.handlers.save_post.remove(self.__OnSave)
+        if self.__Job is not None:
+            self.__Job.Wait()
+
+    # Handlers are dropped when another .blend file is loaded
+    def IsWatching(self):
+        return self.__OnSceneUpdate in bpy.app.handlers.scene_update_post
+
+    # "Private" Methods
+
+    def __OnSceneUpdate(self, Scene):
+        if self.__Exporting or Scene.name != self.SceneName:
+            return
+        if self.__SkipUpdate:
+            # Frame changes made while sampling animations are only reported
+            # with the next update
+            self.__SkipUpdate = False
+            return
+
+        if bpy.data.materials.is_updated:
+            self.__MarkChanged(None)
+        elif bpy.data.objects.is_updated:
+            self.__MarkChanged(set(Object.name for Object in Scene.objects
+                if Object.is_updated or Object.is_updated_data))
+
+        if time.time() - self.LastChangeTime >= DEBOUNCE_TIME:
+            self.__Export(Scene)
+
+    def __OnSave(self, Dummy):
+        Scene = bpy.data.scenes.get(self.SceneName)
+        if Scene is not None:
+            self.__Export(Scene)
+
+    def __MarkChanged(self, Names):
+        if Names is not None and not Names:
+            return
+        if Names is None or self.ChangedNames is None:
+            self.ChangedNames = None
+        else:
+            self.ChangedNames |= Names
+        self.LastChangeTime = time.time()
+
+    def __Export(self, Scene):
+        if self.ChangedNames is not None and not self.ChangedNames:
+            return
+        # Changes keep accumulating until the previous export is written
+        if self.__Job is not None and self.__Job.IsRunning():
+            return
+
+        self.__Exporting = True
+        try:
+            Exporter = export_x.DirectXExporter(self.Config,
+                _Context(Scene))
+
+            # A scene wide atlas has to be packed from all meshes
+            Everything = self.ChangedNames is None or \
+                self.Config.AtlasMode == 'SCENE'
+            Changed = [Object for Object in Exporter.RootExportList
+                if Everything or Object.BlenderObject.name not in
+                self.RootFrames or _GetObjectNames(Object) &
+                self.ChangedNames]
+            for Object, Frame in zip(Changed,
+                Exporter.GatherRootFrames(Changed)):
+                self.RootFrames[Object.BlenderObject.name] = Frame
+            ChangedObjects = set(Changed)
+            RootFrames = [self.RootFrames[Object.BlenderObject.name]
+                for Object in Exporter.RootExportList]
+
+            # Forget objects that are no longer exported
+            Names = set(Object.BlenderObject.name
+                for Object in Exporter.RootExportList)
+            for Name in list(self.RootFrames):
+                if Name not in Names:
+                    del self.RootFrames[Name]
+
+            if ChangedObjects or self.Config.ExportAnimation:
+                Exporter.Log("Exporting {} changed object(s)".format(
+                    len(ChangedObjects)), MessageVerbose=False)
+                self.__Job = _WriteJob(Exporter,
+                    Exporter.GatherScene(RootFrames), ChangedObjects)
+                self.__Job.Start()
+        finally:
+            self.ChangedNames = set()
+            self.__Exporting = False
+            self.__SkipUpdate = self.Config.ExportAnimation
+
+
+# "Private" Methods
+
+# Stands in for the operator context, which scene handlers do not get
+class _Context:
+    def __init__(self, Scene):
+        self.scene = Scene
+        self.selected_objects = [Object for Object in Scene.objects
+            if Object.select]
+
+
+# Names of the Blender objects exported by ExportObject and its children
+def _GetObjectNames(ExportObject):
+    Names = set([ExportObject.BlenderObject.name])
+    for Child in ExportObject.Children:
+        Names |= _GetObjectNames(Child)
+    return Names
+
+
+# Writes a single file through BackgroundExport, or the changed parts of a
+# split export, on a worker thread
+class _WriteJob:
+    def __init__(self, Exporter, Scene, ChangedObjects):
+        self.Exporter = Exporter
+        self.Scene = Scene
+        self.ChangedObjects = ChangedObjects
+
+        # Created on the main thread, as they read the writer options and
+        # Blender groups
+        self.__Export = None
+        self.__SplitNames = None
+        if Exporter.Config.SplitMode == 'NONE':
+            self.__Export = export_x.BackgroundExport(Exporter, Scene)
+        else:
+            self.__SplitNames = Exporter.GetSplitNames()
+
+        self.__Thread = threading.Thread(target=self.__Run)
+        self.__Thread.daemon = True
+
+    def Start(self):
+        self.__Thread.start()
+
+    def IsRunning(self):
+        return self.__Thread.is_alive()
+
+    def Wait(self):
+        self.__Thread.join()
+
+    def __Run(self):
+        try:
+            if self.__Export is None:
+                self.Exporter.ExportSidecars(self.Scene)
+                self.Exporter.ExportSplit(self.Scene, self.ChangedObjects,
+                    self.__SplitNames)
+            else:
+                self.__Export.Start()
+                self.__Export.Wait()
+                if self.__Export.Error is not None:
+                    raise self.__Export.Error
+        except Exception as Error:
+            self.Exporter.Log("Watch export failed: {}".format(Error),
+                MessageVerbose=False)
+        else:
+            self.Exporter.Log("Updated {}".format(self.Exporter.FilePath),
+                MessageVerbose=False)
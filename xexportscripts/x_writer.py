@@ -0,0 +1,669 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Serializes an x_scene.Scene into the DirectX .x text format.  Does not
+# depend on Blender, so it can be tested and profiled on its own.
+#
+# The compact profile writes the same data without indentation or comments,
+# and with trailing zeros trimmed from every number.
+
+import re
+
+import numpy
+
+# Number of array rows formatted with a single % operation.  Bounds the size
+# of the temporary strings for huge meshes.
+CHUNK_ROWS = 4096
+
+# Decimal places for each kind of value, unless overridden by XWriter's
+# Precision argument
+DEFAULT_PRECISION = {
+    "Positions" : 6,
+    "Normals" : 6,
+    "TextureCoords" : 6,
+    "VertexColors" : 6,
+    "Weights" : 6,
+    "Keys" : 6,
+    "Matrices" : 6,
+    "Materials" : 6}
+
+# The compact profile rounds values to their precision and formats them
+# with %g, which drops trailing zeros for free and is as fast as %f.  The
+# number of significant digits is chosen per chunk and replaces this marker.
+# %g switches to exponent notation below 1e-4, so those (rare) numbers are
+# rewritten afterwards.
+COMPACT_FLOAT = "%.#g"
+EXPONENT_NUMBER = re.compile(r"-?[0-9.]+e[-+][0-9]+")
+
+
+# Number of array rows XWriter.Write writes for Scene.  Used as the total
+# for progress reporting.
+def CountRows(Scene):
+    Rows = 0
+    for Frame in Scene.IterFrames():
+        Rows += 4
+        for Table in Frame.Instances:
+            Rows += 3 * Table.GetInstanceCount()
+            if Table.Colors is not None:
+                Rows += len(Table.Colors)
+    for Mesh in Scene.IterMeshes():
+        Rows += Mesh.GetVertexCount() + Mesh.GetFaceCount()
+        if Mesh.Normals is not None:
+            Rows += len(Mesh.Normals) + Mesh.GetFaceCount()
+        if Mesh.TextureCoords is not None:
+            Rows += len(Mesh.TextureCoords)
+        if Mesh.Materials:
+            Rows += len(Mesh.MaterialIndices)
+        if Mesh.AttributeRanges is not None:
+            Rows += len(Mesh.AttributeRanges)
+        if Mesh.VertexColors is not None:
+            Rows += len(Mesh.VertexColors)
+        if Mesh.ExtraTextureCoords:
+            Rows += Mesh.GetVertexCount()
+        for Skin in Mesh.SkinWeights:
+            Rows += 2 * len(Skin.Indices) + 4
+        for Target in Mesh.MorphTargets:
+            Rows += 2 * len(Target.Indices)
+    for Set in Scene.AnimationSets:
+        for Track in Set.Tracks:
+            Rows += Track.GetKeyCount() * len(Track.GetKeys())
+        for Track in Set.MorphTracks:
+            Rows += len(Track.TargetNames) + Track.GetKeyCount()
+    return Rows
+
+
+class XWriter:
+    def __init__(self, File, Progress=None, Compact=False, Precision=None,
+        MaterialReferences=False):
+        # Anything with a write(String) method
+        self.File = File
+        # Called with the number of rows after each chunk is written.  It may
+        # raise to abort the export.
+        self.Progress = Progress
+
+        self.Compact = Compact
+        # Maps the keys of DEFAULT_PRECISION to decimal places
+        self.Precision = dict(DEFAULT_PRECISION)
+        if Precision:
+            self.Precision.update(Precision)
+
+        # Refer to mesh materials by name, e.g. "{Material}", instead of
+        # writing them out.  The materials are then expected to be defined
+        # at the top level of this or another file.
+        self.MaterialReferences = MaterialReferences
+        self.__Whitespace = 0
+        self.__Prefix = ""
+
+    # "Public" Interface
+
+    def Write(self, Scene):
+        self.__WriteHeader(Scene)
+
+        for Material in Scene.Materials:
+            self.__WriteMaterial(Material)
+
+        for Mesh in Scene.Meshes:
+            self.__WriteMesh(Mesh)
+
+        for Frame in Scene.Frames:
+            self.__WriteFrame(Frame)
+
+        if Scene.FrameRate is not None:
+            self.__WriteLine("AnimTicksPerSecond {\n")
+            self.__Indent()
+            self.__WriteLine("%s;\n" % Scene.FrameRate)
+            self.__Unindent()
+            self.__WriteLine("}\n")
+
+        for Set in Scene.AnimationSets:
+            self.__WriteAnimationSet(Set)
+
+    # "Private" Methods
+
+    def __Indent(self):
+        self.__Whitespace += 1
+        if not self.Compact:
+            self.__Prefix = "  " * self.__Whitespace
+
+    def __Unindent(self):
+        self.__Whitespace = max(0, self.__Whitespace - 1)
+        if not self.Compact:
+            self.__Prefix = "  " * self.__Whitespace
+
+    # Returns " // Text", or nothing in the compact profile
+    def __Comment(self, Text):
+        if self.Compact:
+            return ""
+        return " // " + Text
+
+    # Returns the format for a single value of the given kind
+    def __Float(self, Kind):
+        if self.Compact:
+            return COMPACT_FLOAT
+        return "%%9.%df" % self.Precision[Kind]
+
+    # Returns the format for a row of Count values of the given kind
+    def __Floats(self, Kind, Count, Separator=";"):
+        return Separator.join([self.__Float(Kind)] * Count)
+
+    # Formats Values with Format.  The compact profile first rounds them to
+    # the precision of Kind, which is None for integer data.
+    def __Format(self, Format, Values, Kind):
+        if not self.Compact or Kind is None:
+            return Format % tuple(Values)
+
+        Decimals = self.Precision[Kind]
+        # Adding 0.0 turns -0.0 into 0.0
+        Values = numpy.round(numpy.asarray(Values, dtype=numpy.float64),
+            Decimals) + 0.0
+
+        # Enough significant digits for the integer part of the largest
+        # value plus the decimals, but no more than a double holds
+        IntegerDigits = 1
+        if len(Values):
+            IntegerDigits = len("%d" % numpy.abs(Values).max())
+        Digits = min(15, IntegerDigits + Decimals)
+
+        String = Format.replace(COMPACT_FLOAT, "%%.%dg" % Digits) % \
+            tuple(Values.tolist())
+        if "e" in String:
+            def Fixed(Match):
+                Number = "%.*f" % (Decimals, float(Match.group()))
+                return Number.rstrip("0").rstrip(".")
+            String = EXPONENT_NUMBER.sub(Fixed, String)
+        return String
+
+    def __WriteLine(self, String):
+        self.File.write(self.__Prefix + String)
+
+    # Writes each row of Array on its own line using RowFormat.  Rows are
+    # separated with Separator and the last one is followed by Terminator.
+    # Numbered puts each row's index in front of its values.  Kind selects the
+    # precision of the values.  Array may be anything that supports len() and
+    # slicing, e.g. an x_scene.ChunkedArray.
+    def __WriteRows(self, Array, RowFormat, Kind, Separator=",\n",
+        Terminator=";\n", Numbered=False):
+        Count = len(Array)
+        LineFormat = self.__Prefix + RowFormat
+        for Start in range(0, Count, CHUNK_ROWS):
+            Chunk = Array[Start:Start + CHUNK_ROWS]
+            if Numbered:
+                Chunk = numpy.column_stack((numpy.arange(Start,
+                    Start + len(Chunk)), Chunk))
+            if Start + CHUNK_ROWS >= Count:
+                End = Terminator
+            else:
+                End = Separator
+            Format = Separator.join([LineFormat] * len(Chunk)) + End
+            self.File.write(self.__Format(Format, Chunk.ravel().tolist(),
+                Kind))
+            if self.Progress is not None:
+                self.Progress(len(Chunk))
+
+    # Writes "n;i0,i1,...;" for each face
+    def __WriteFaces(self, Sizes, Indices):
+        FaceFormats = {}
+        Offsets = numpy.zeros(len(Sizes) + 1, dtype=numpy.int64)
+        numpy.cumsum(Sizes, out=Offsets[1:])
+
+        Count = len(Sizes)
+        for Start in range(0, Count, CHUNK_ROWS):
+            End = min(Start + CHUNK_ROWS, Count)
+            ChunkSizes = Sizes[Start:End]
+            ChunkIndices = Indices[Offsets[Start]:Offsets[End]]
+
+            # Interleave each face's size in front of its indices
+            Values = numpy.empty(len(ChunkSizes) + len(ChunkIndices),
+                dtype=numpy.int64)
+            SizePositions = (Offsets[Start:End] - Offsets[Start]) + \
+                numpy.arange(len(ChunkSizes))
+            IsIndex = numpy.ones(len(Values), dtype=bool)
+            IsIndex[SizePositions] = False
+            Values[SizePositions] = ChunkSizes
+            Values[IsIndex] = ChunkIndices
+
+            Formats = []
+            for Size in ChunkSizes.tolist():
+                Format = FaceFormats.get(Size)
+                if Format is None:
+                    Format = self.__Prefix + "%d;" + \
+                        ",".join(["%d"] * Size) + ";"
+                    FaceFormats[Size] = Format
+                Formats.append(Format)
+
+            if End == Count:
+                Tail = ";\n"
+            else:
+                Tail = ",\n"
+            self.File.write((",\n".join(Formats) + Tail) %
+                tuple(Values.tolist()))
+            if self.Progress is not None:
+                self.Progress(End - Start)
+
+    def __WriteMatrix(self, Matrix):
+        self.__WriteRows(numpy.asarray(Matrix).reshape(4, 4),
+            self.__Floats("Matrices", 4, ","), "Matrices", ",\n", ";;\n")
+
+    def __WriteHeader(self, Scene):
+        self.File.write("xof 0303txt 0032\n\n")
+
+        # Write the headers that are required by some engines as needed
+
+        if Scene.FrameRate is not None:
+            self.File.write("template AnimTicksPerSecond {\n\
+  <9E415A43-7BA6-4a73-8743-B73D47E88476>\n\
+  DWORD AnimTicksPerSecond;\n\
+}\n\n")
+        if Scene.HasSkinWeights():
+            self.File.write("template XSkinMeshHeader {\n\
+  <3cf169ce-ff7c-44ab-93c0-f78f62d172e2>\n\
+  WORD nMaxSkinWeightsPerVertex;\n\
+  WORD nMaxSkinWeightsPerFace;\n\
+  WORD nBones;\n\
+}\n\n\
+template SkinWeights {\n\
+  <6f0d123b-bad2-4167-a0d0-80224f25fabb>\n\
+  STRING transformNodeName;\n\
+  DWORD nWeights;\n\
+  array DWORD vertexIndices[nWeights];\n\
+  array float weights[nWeights];\n\
+  Matrix4x4 matrixOffset;\n\
+}\n\n")
+        if any(Mesh.ExtraTextureCoords for Mesh in Scene.IterMeshes()):
+            self.File.write("template VertexElement {\n\
+  <F752461C-1E23-48f6-B9F8-8350850F336F>\n\
+  DWORD Type;\n\
+  DWORD Method;\n\
+  DWORD Usage;\n\
+  DWORD UsageIndex;\n\
+}\n\n\
+template DeclData {\n\
+  <BF22E553-292C-4781-9FEA-62BD554BDD93>\n\
+  DWORD nElements;\n\
+  array VertexElement Elements[nElements];\n\
+  DWORD nDWords;\n\
+  array DWORD data[nDWords];\n\
+}\n\n")
+        # Not a standard template.  Loaders that do not know it skip it.
+        if any(Mesh.AttributeRanges is not None
+            for Mesh in Scene.IterMeshes()):
+            self.File.write("template MeshAttributeRange {\n\
+  <6986c78c-cc3c-4f3f-b213-af7f8c4f8012>\n\
+  DWORD attribId;\n\
+  DWORD faceStart;\n\
+  DWORD faceCount;\n\
+  DWORD vertexStart;\n\
+  DWORD vertexCount;\n\
+}\n\n\
+template MeshAttributeTable {\n\
+  <b99a811e-8587-4716-867d-c10f368dec2b>\n\
+  DWORD nRanges;\n\
+  array MeshAttributeRange ranges[nRanges];\n\
+}\n\n")
+        # Not standard templates either
+        if any(Mesh.MorphTargets for Mesh in Scene.IterMeshes()):
+            self.File.write("template MorphTarget {\n\
+  <d2a5a1f6-3b0e-4c69-9d52-6f1e8b7a4c30>\n\
+  STRING name;\n\
+  DWORD nOffsets;\n\
+  array DWORD vertexIndices[nOffsets];\n\
+  array Vector offsets[nOffsets];\n\
+}\n\n")
+        if any(Frame.Instances for Frame in Scene.IterFrames()):
+            self.File.write("template InstanceTable {\n\
+  <8e4c2f1a-7d35-4b96-a0e2-5c19d7f3b648>\n\
+  DWORD nInstances;\n\
+  array Vector positions[nInstances];\n\
+  array FloatKeys rotations[nInstances];\n\
+  array Vector scales[nInstances];\n\
+  DWORD nColors;\n\
+  array ColorRGBA colors[nColors];\n\
+  [Mesh <3D82AB44-62DA-11cf-AB39-0020AF71E433>]\n\
+}\n\n")
+        if any(Set.MorphTracks for Set in Scene.AnimationSets):
+            self.File.write("template MorphAnimation {\n\
+  <5c8e07b4-91d3-4a2f-b6e0-3f7a2d9c1e85>\n\
+  DWORD nTargets;\n\
+  array STRING targetNames[nTargets];\n\
+  DWORD nKeys;\n\
+  array TimedFloatKeys keys[nKeys];\n\
+  [Frame <3D82AB46-62DA-11cf-AB39-0020AF71E433>]\n\
+}\n\n")
+
+    def __WriteFrame(self, Frame):
+        self.__WriteLine("Frame %s {\n" % Frame.Name)
+        self.__Indent()
+
+        self.__WriteLine("FrameTransformMatrix {\n")
+        self.__Indent()
+        self.__WriteMatrix(Frame.Matrix)
+        self.__Unindent()
+        self.__WriteLine("}\n")
+
+        for Mesh in Frame.Meshes:
+            self.__WriteMesh(Mesh)
+
+        for Table in Frame.Instances:
+            self.__WriteInstanceTable(Table)
+
+        for Child in Frame.Children:
+            self.__WriteFrame(Child)
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment("End of " + Frame.Name))
+
+    # The transforms of the instances, rotations as w, x, y, z FloatKeys,
+    # followed by the meshes they are copies of
+    def __WriteInstanceTable(self, Table):
+        self.__WriteLine("InstanceTable %s {\n" % Table.Name)
+        self.__Indent()
+
+        self.__WriteLine("%s;\n" % Table.GetInstanceCount())
+        self.__WriteRows(Table.Positions, self.__Floats("Positions", 3) + ";",
+            "Positions")
+        self.__WriteRows(Table.Rotations, "4;" + self.__Floats("Keys", 4,
+            ",") + ";", "Keys")
+        self.__WriteRows(Table.Scales, self.__Floats("Positions", 3) + ";",
+            "Positions")
+
+        if Table.Colors is None:
+            self.__WriteLine("0;\n")
+        else:
+            self.__WriteLine("%s;\n" % len(Table.Colors))
+            self.__WriteRows(Table.Colors, self.__Floats("VertexColors", 4) +
+                ";", "VertexColors")
+
+        for Mesh in Table.Meshes:
+            self.__WriteMesh(Mesh)
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment(
+            "End of %s instances" % Table.Name))
+
+    def __WriteMesh(self, Mesh):
+        self.__WriteLine("Mesh {%s\n" % self.__Comment(Mesh.Name + " mesh"))
+        self.__Indent()
+
+        self.__WriteLine("%s;\n" % Mesh.GetVertexCount())
+        self.__WriteRows(Mesh.Positions, self.__Floats("Positions", 3) + ";",
+            "Positions")
+
+        self.__WriteLine("%s;\n" % Mesh.GetFaceCount())
+        self.__WriteFaces(Mesh.FaceSizes, Mesh.FaceIndices)
+
+        if Mesh.Normals is not None:
+            self.__WriteMeshNormals(Mesh)
+
+        if Mesh.TextureCoords is not None:
+            self.__WriteMeshTextureCoords(Mesh)
+
+        if Mesh.Materials:
+            self.__WriteMeshMaterialList(Mesh)
+
+        if Mesh.AttributeRanges is not None:
+            self.__WriteMeshAttributeTable(Mesh)
+
+        if Mesh.VertexColors is not None:
+            self.__WriteMeshVertexColors(Mesh)
+
+        if Mesh.ExtraTextureCoords:
+            self.__WriteMeshDeclData(Mesh)
+
+        if Mesh.SkinWeights:
+            self.__WriteMeshSkinWeights(Mesh)
+
+        if Mesh.MorphTargets:
+            self.__WriteMeshMorphTargets(Mesh)
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment("End of %s mesh" %
+            Mesh.Name))
+
+    def __WriteMeshNormals(self, Mesh):
+        self.__WriteLine("MeshNormals {%s\n" % self.__Comment(Mesh.Name +
+            " normals"))
+        self.__Indent()
+
+        self.__WriteLine("%s;\n" % len(Mesh.Normals))
+        self.__WriteRows(Mesh.Normals, self.__Floats("Normals", 3) + ";",
+            "Normals")
+
+        self.__WriteLine("%s;\n" % Mesh.GetFaceCount())
+        self.__WriteFaces(Mesh.FaceSizes, Mesh.NormalFaceIndices)
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment("End of %s normals" %
+            Mesh.Name))
+
+    def __WriteMeshTextureCoords(self, Mesh):
+        self.__WriteLine("MeshTextureCoords {%s\n" % self.__Comment(
+            Mesh.Name + " UV coordinates"))
+        self.__Indent()
+
+        self.__WriteLine("%s;\n" % len(Mesh.TextureCoords))
+        self.__WriteRows(Mesh.TextureCoords,
+            self.__Floats("TextureCoords", 2) + ";", "TextureCoords")
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment(
+            "End of %s UV coordinates" % Mesh.Name))
+
+    def __WriteMeshMaterialList(self, Mesh):
+        self.__WriteLine("MeshMaterialList {%s\n" % self.__Comment(
+            Mesh.Name + " material list"))
+        self.__Indent()
+
+        self.__WriteLine("%s;\n" % len(Mesh.Materials))
+        self.__WriteLine("%s;\n" % len(Mesh.MaterialIndices))
+        self.__WriteRows(Mesh.MaterialIndices, "%d", None, ",\n", ";;\n")
+
+        for Material in Mesh.Materials:
+            if self.MaterialReferences:
+                self.__WriteLine("{%s}\n" % Material.Name)
+            else:
+                self.__WriteMaterial(Material)
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment(
+            "End of %s material list" % Mesh.Name))
+
+    # The faces and vertices of each material, like D3DX's attribute table
+    def __WriteMeshAttributeTable(self, Mesh):
+        self.__WriteLine("MeshAttributeTable {%s\n" % self.__Comment(
+            Mesh.Name + " attribute table"))
+        self.__Indent()
+
+        self.__WriteLine("%s;\n" % len(Mesh.AttributeRanges))
+        self.__WriteRows(Mesh.AttributeRanges, "%d;%d;%d;%d;%d;", None,
+            ",\n", ";\n")
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment(
+            "End of %s attribute table" % Mesh.Name))
+
+    def __WriteMaterial(self, Material):
+        self.__WriteLine("Material %s {\n" % Material.Name)
+        self.__Indent()
+
+        Color = self.__Floats("Materials", 3)
+        Power = self.__Float("Materials")
+        if not self.Compact:
+            Power = " " + Power
+        self.__WriteLine(self.__Format(Color + ";%s;;\n" %
+            self.__Float("Materials"), Material.Diffuse, "Materials"))
+        self.__WriteLine(self.__Format(Power + ";\n", (Material.Power,),
+            "Materials"))
+        self.__WriteLine(self.__Format(Color + ";;\n", Material.Specular,
+            "Materials"))
+        self.__WriteLine(self.__Format(Color + ";;\n", Material.Emissive,
+            "Materials"))
+
+        if Material.TextureFilename:
+            self.__WriteLine("TextureFilename {\"%s\";}\n" %
+                Material.TextureFilename)
+
+        self.__Unindent()
+        self.__WriteLine("}\n")
+
+    def __WriteMeshVertexColors(self, Mesh):
+        self.__WriteLine("MeshVertexColors {%s\n" % self.__Comment(
+            Mesh.Name + " vertex colors"))
+        self.__Indent()
+
+        Colors = Mesh.VertexColors
+        self.__WriteLine("%s;\n" % len(Colors))
+
+        # Each entry is the vertex index followed by its RGBA color
+        self.__WriteRows(Colors, "%d;" + self.__Floats("VertexColors", 4) +
+            ";;", "VertexColors", Numbered=True)
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment(
+            "End of %s vertex colors" % Mesh.Name))
+
+    # The extra texture coordinate sets as TEXCOORD1 and up, each a
+    # D3DDECLTYPE_FLOAT2 element, with the floats written as their bits
+    def __WriteMeshDeclData(self, Mesh):
+        self.__WriteLine("DeclData {%s\n" % self.__Comment(
+            Mesh.Name + " vertex declaration"))
+        self.__Indent()
+
+        Count = len(Mesh.ExtraTextureCoords)
+        self.__WriteLine("%s;\n" % Count)
+        self.__WriteRows(numpy.arange(1, Count + 1), "1;0;5;%d;", None,
+            ",\n", ";\n")
+
+        Data = numpy.concatenate([numpy.ascontiguousarray(Coords,
+            dtype=numpy.float32) for Coords in Mesh.ExtraTextureCoords],
+            axis=1).view(numpy.uint32)
+        self.__WriteLine("%s;\n" % Data.size)
+        self.__WriteRows(Data, ",".join(["%d"] * (2 * Count)), None)
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment(
+            "End of %s vertex declaration" % Mesh.Name))
+
+    def __WriteMeshSkinWeights(self, Mesh):
+        self.__WriteLine("XSkinMeshHeader {\n")
+        self.__Indent()
+        self.__WriteLine("%s;\n" % Mesh.MaxSkinWeightsPerVertex)
+        self.__WriteLine("%s;\n" % Mesh.MaxSkinWeightsPerFace)
+        self.__WriteLine("%s;\n" % len(Mesh.SkinWeights))
+        self.__Unindent()
+        self.__WriteLine("}\n")
+
+        for Skin in Mesh.SkinWeights:
+            self.__WriteLine("SkinWeights {\n")
+            self.__Indent()
+            self.__WriteLine("\"%s\";\n" % Skin.FrameName)
+
+            self.__WriteLine("%s;\n" % len(Skin.Indices))
+            self.__WriteRows(Skin.Indices, "%d", None)
+            self.__WriteRows(Skin.Weights, self.__Float("Weights"), "Weights")
+
+            self.__WriteMatrix(Skin.OffsetMatrix)
+
+            self.__Unindent()
+            self.__WriteLine("}%s\n" % self.__Comment(
+                "End of %s skin weights" % Skin.FrameName))
+
+    # Targets that move no vertices of this mesh are left out
+    def __WriteMeshMorphTargets(self, Mesh):
+        for Target in Mesh.MorphTargets:
+            if not len(Target.Indices):
+                continue
+            self.__WriteLine("MorphTarget {\n")
+            self.__Indent()
+            self.__WriteLine("\"%s\";\n" % Target.Name)
+
+            self.__WriteLine("%s;\n" % len(Target.Indices))
+            self.__WriteRows(Target.Indices, "%d", None)
+            self.__WriteRows(Target.Offsets, self.__Floats("Positions", 3) +
+                ";", "Positions")
+
+            self.__Unindent()
+            self.__WriteLine("}%s\n" % self.__Comment(
+                "End of %s morph target" % Target.Name))
+
+    def __WriteAnimationSet(self, Set):
+        self.__WriteLine("AnimationSet %s {\n" % Set.Name)
+        self.__Indent()
+
+        for Track in Set.Tracks:
+            self.__WriteLine("Animation {\n")
+            self.__Indent()
+            self.__WriteLine("{%s}\n" % Track.FrameName)
+
+            for KeyType, Keys in Track.GetKeys():
+                self.__WriteAnimationKey(KeyType, Track.KeyTimes, Keys)
+
+            self.__Unindent()
+            self.__WriteLine("}\n")
+
+        for Track in Set.MorphTracks:
+            self.__WriteMorphAnimation(Track)
+
+        self.__Unindent()
+        self.__WriteLine("}%s\n" % self.__Comment(
+            "End of AnimationSet " + Set.Name))
+
+    # The weights of each key of Track, followed by the frame whose meshes
+    # have the targets
+    def __WriteMorphAnimation(self, Track):
+        self.__WriteLine("MorphAnimation {%s\n" % self.__Comment(
+            Track.FrameName + " morph targets"))
+        self.__Indent()
+
+        self.__WriteLine("%s;\n" % len(Track.TargetNames))
+        self.__WriteRows(numpy.array(["\"%s\"" % Name
+            for Name in Track.TargetNames]), "%s", None)
+
+        self.__WriteLine("%s;\n" % Track.GetKeyCount())
+        ValueCount = len(Track.TargetNames)
+        TimedKeys = numpy.empty((Track.GetKeyCount(), ValueCount + 1),
+            dtype=numpy.float64)
+        TimedKeys[:, 0] = Track.KeyTimes
+        TimedKeys[:, 1:] = Track.Weights
+        self.__WriteRows(TimedKeys, "%%d;%d;" % ValueCount +
+            self.__Floats("Keys", ValueCount, ",") + ";;", "Keys")
+
+        self.__WriteLine("{%s}\n" % Track.FrameName)
+        self.__Unindent()
+        self.__WriteLine("}\n")
+
+    def __WriteAnimationKey(self, KeyType, KeyTimes, Keys):
+        Names = {0 : "Rotation", 1 : "Scale", 2 : "Position", 4 : "Matrix"}
+        self.__WriteLine("AnimationKey {%s\n" % self.__Comment(
+            Names[KeyType]))
+        self.__Indent()
+        self.__WriteLine("%s;\n" % KeyType)
+        self.__WriteLine("%s;\n" % len(KeyTimes))
+
+        # Each key is its time, its value count and the values
+        ValueCount = Keys.shape[1]
+        TimedKeys = numpy.empty((len(Keys), ValueCount + 1),
+            dtype=numpy.float64)
+        TimedKeys[:, 0] = KeyTimes
+        TimedKeys[:, 1:] = Keys
+        self.__WriteRows(TimedKeys, "%%d;%d;" % ValueCount +
+            self.__Floats("Keys", ValueCount, ",") + ";;", "Keys")
+
+        self.__Unindent()
+        self.__WriteLine("}\n")
@@ -0,0 +1,621 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Serializes an x_scene.Scene into a compiled XNA Game Studio 4.0 Model
+# (.xnb) that ContentManager.Load<Model> reads directly, without running the
+# content pipeline.  The file is uncompressed and built for Windows.
+#
+# Every frame becomes a ModelBone and every mesh a ModelMesh with one part
+# per material.  Polygons are triangulated and vertices are split where
+# their normals differ.  Meshes get a BasicEffect, or a SkinnedEffect with
+# blend indices (model bone indexes) and weights if they have skin weights.
+# The Tag of a skinned ModelMesh is a Matrix[] holding the skin offset
+# matrix of each model bone.  Meshes with a BonePalette (see x_palette.py)
+# use blend indices into their own SkinWeights instead, and the Tag of each
+# of their ModelMeshParts is an int[] holding the model bone index of each
+# palette entry.  Animation sets are not part of an XNA Model and are not
+# written.
+#
+# XNA is right-handed while the scene is left-handed like DirectX, so, as
+# the XNA Framework's X importer does, z is negated in positions, normals
+# and matrices and the winding of the triangles is reversed.
+#
+# Textures converted to .dds files (see x_texture.py) are written by
+# SaveTextures as Texture2D assets next to the model, e.g. "wood.dds" ->
+# "wood.xnb", and the effects reference them by that name.  Other textures
+# cannot be loaded by XNA without the content pipeline, so their references
+# are left empty.
+
+import io
+import os
+import struct
+
+import numpy
+
+try:
+    from . import x_file
+    from . import x_scene
+    from . import x_texture
+except (ImportError, ValueError, SystemError):
+    import x_file
+    import x_scene
+    import x_texture
+
+XNB_VERSION = 5
+PLATFORM_WINDOWS = b"w"
+# Reach profile unless 32 bit indices or large textures are needed
+FLAG_HIDEF = 0x01
+# Largest texture the Reach profile loads
+REACH_MAX_TEXTURE_SIZE = 2048
+
+_FRAMEWORK = "Microsoft.Xna.Framework, Version=4.0.0.0, Culture=neutral, " \
+    "PublicKeyToken=842cf8be1de50553"
+_GRAPHICS = "Microsoft.Xna.Framework.Graphics, Version=4.0.0.0, " \
+    "Culture=neutral, PublicKeyToken=842cf8be1de50553"
+
+MODEL_READER = "Microsoft.Xna.Framework.Content.ModelReader, " + _GRAPHICS
+STRING_READER = "Microsoft.Xna.Framework.Content.StringReader, " + _FRAMEWORK
+VERTEX_DECLARATION_READER = \
+    "Microsoft.Xna.Framework.Content.VertexDeclarationReader, " + _GRAPHICS
+VERTEX_BUFFER_READER = \
+    "Microsoft.Xna.Framework.Content.VertexBufferReader, " + _GRAPHICS
+INDEX_BUFFER_READER = \
+    "Microsoft.Xna.Framework.Content.IndexBufferReader, " + _GRAPHICS
+BASIC_EFFECT_READER = \
+    "Microsoft.Xna.Framework.Content.BasicEffectReader, " + _GRAPHICS
+SKINNED_EFFECT_READER = \
+    "Microsoft.Xna.Framework.Content.SkinnedEffectReader, " + _GRAPHICS
+MATRIX_READER = "Microsoft.Xna.Framework.Content.MatrixReader, " + _FRAMEWORK
+MATRIX_ARRAY_READER = "Microsoft.Xna.Framework.Content.ArrayReader`1[[" \
+    "Microsoft.Xna.Framework.Matrix, %s]], %s" % (_FRAMEWORK, _FRAMEWORK)
+INT32_READER = "Microsoft.Xna.Framework.Content.Int32Reader, " + _FRAMEWORK
+INT32_ARRAY_READER = "Microsoft.Xna.Framework.Content.ArrayReader`1[[" \
+    "System.Int32, mscorlib, Version=4.0.0.0, Culture=neutral, " \
+    "PublicKeyToken=b77a5c561934e089]], %s" % _FRAMEWORK
+TEXTURE2D_READER = \
+    "Microsoft.Xna.Framework.Content.Texture2DReader, " + _GRAPHICS
+
+# SurfaceFormat of the .dds formats x_texture writes
+SURFACE_FORMATS = {"DXT1" : 4, "DXT5" : 6}
+
+# VertexElementFormat
+FORMAT_VECTOR2 = 1
+FORMAT_VECTOR3 = 2
+FORMAT_VECTOR4 = 3
+FORMAT_COLOR = 4
+FORMAT_BYTE4 = 5
+
+# VertexElementUsage
+USAGE_POSITION = 0
+USAGE_COLOR = 1
+USAGE_TEXTURE_COORDINATE = 2
+USAGE_NORMAL = 3
+USAGE_BLEND_INDICES = 6
+USAGE_BLEND_WEIGHT = 7
+
+# Influences per vertex a SkinnedEffect takes
+MAX_BLEND_WEIGHTS = 4
+
+
+# "Public" Interface
+
+# Number of progress units XnbWriter.Write reports for Scene
+def CountRows(Scene):
+    Rows = 0
+    Meshes = list(Scene.Meshes)
+    for Frame in Scene.IterFrames():
+        Meshes += Frame.Meshes
+    for Mesh in Meshes:
+        Rows += Mesh.GetVertexCount() + Mesh.GetFaceCount()
+    return Rows
+
+
+class XnbWriter:
+    def __init__(self, File, Progress=None):
+        # Anything with a write(bytes) method
+        self.File = File
+        # Called with the number of rows after each mesh is written.  It may
+        # raise to abort the export.
+        self.Progress = Progress
+
+        self.__Readers = []
+        self.__SharedResources = []
+        self.__Effects = {}
+        self.__HiDef = False
+
+    # "Public" Interface
+
+    def Write(self, Scene):
+        self.__Readers = []
+        self.__SharedResources = []
+        self.__Effects = {}
+        self.__HiDef = False
+
+        Asset = io.BytesIO()
+        self.__WriteModel(Asset, Scene)
+        _WriteXnb(self.File, self.__Readers, Asset.getvalue(),
+            self.__SharedResources, self.__HiDef)
+
+    # "Private" Methods
+
+    # Writes the 7 bit encoded, 1 based index of Reader in the manifest
+    def __WriteReader(self, Stream, Reader):
+        if Reader not in self.__Readers:
+            self.__Readers.append(Reader)
+        _Write7BitInt(Stream, self.__Readers.index(Reader) + 1)
+
+    def __WriteStringObject(self, Stream, String):
+        self.__WriteReader(Stream, STRING_READER)
+        _WriteString(Stream, String)
+
+    # Adds a shared resource and returns its 1 based index
+    def __AddSharedResource(self, Reader, Data):
+        Stream = io.BytesIO()
+        self.__WriteReader(Stream, Reader)
+        Stream.write(Data)
+        self.__SharedResources.append(Stream.getvalue())
+        return len(self.__SharedResources)
+
+    def __WriteModel(self, Stream, Scene):
+        self.__WriteReader(Stream, MODEL_READER)
+
+        # A Model has a single root bone, so several top level frames get a
+        # common parent
+        Bones = []
+        if len(Scene.Frames) == 1:
+            _GatherBones(Bones, Scene.Frames[0], None)
+        else:
+            Bones.append((x_scene.Frame("Root"), None))
+            for Frame in Scene.Frames:
+                _GatherBones(Bones, Frame, 0)
+        BoneIndexes = dict((Frame, Index)
+            for Index, (Frame, Parent) in enumerate(Bones))
+        BoneIndexesByName = dict((Frame.Name, Index)
+            for Index, (Frame, Parent) in enumerate(Bones))
+        BoneReference = _GetBoneReferenceFormat(len(Bones))
+
+        Stream.write(struct.pack("<I", len(Bones)))
+        for Frame, Parent in Bones:
+            self.__WriteStringObject(Stream, Frame.Name)
+            Stream.write(_Floats(_MirrorMatrix(Frame.Matrix)))
+        for Index, (Frame, Parent) in enumerate(Bones):
+            Stream.write(struct.pack(BoneReference, _BoneReference(Parent)))
+            Children = [ChildIndex for ChildIndex, (Child, ChildParent) in
+                enumerate(Bones) if ChildParent == Index]
+            Stream.write(struct.pack("<I", len(Children)))
+            for Child in Children:
+                Stream.write(struct.pack(BoneReference, _BoneReference(Child)))
+
+        Meshes = [(Mesh, 0) for Mesh in Scene.Meshes]
+        for Frame, Parent in Bones:
+            Meshes.extend((Mesh, BoneIndexes[Frame]) for Mesh in Frame.Meshes)
+
+        Stream.write(struct.pack("<I", len(Meshes)))
+        for Mesh, BoneIndex in Meshes:
+            self.__WriteMesh(Stream, Mesh, BoneIndex, BoneIndexesByName,
+                len(Bones), BoneReference)
+            if self.Progress is not None:
+                self.Progress(Mesh.GetVertexCount() + Mesh.GetFaceCount())
+
+        # Root bone and Tag
+        Stream.write(struct.pack(BoneReference, _BoneReference(0)))
+        _Write7BitInt(Stream, 0)
+
+    def __WriteMesh(self, Stream, Mesh, BoneIndex, BoneIndexesByName,
+        BoneCount, BoneReference):
+        Vertexes = _BuildVertexes(Mesh, BoneIndexesByName)
+        Triangles, TriangleMaterials = _Triangulate(Mesh, Vertexes.Remap)
+
+        self.__WriteStringObject(Stream, Mesh.Name)
+        Stream.write(struct.pack(BoneReference, _BoneReference(BoneIndex)))
+
+        # Bounding sphere around the center of the bounding box
+        Center = numpy.zeros(3, dtype=numpy.float32)
+        Radius = 0.0
+        if len(Vertexes.Positions):
+            Center = (Vertexes.Positions.min(axis=0) +
+                Vertexes.Positions.max(axis=0)) / 2
+            Radius = numpy.sqrt(((Vertexes.Positions - Center) ** 2).sum(
+                axis=1).max())
+        Stream.write(_Floats(Center))
+        Stream.write(struct.pack("<f", Radius))
+
+        # Tag
+        if Mesh.SkinWeights:
+            OffsetMatrices = numpy.tile(x_scene.IdentityMatrix(),
+                (BoneCount, 1, 1))
+            for Skin in Mesh.SkinWeights:
+                OffsetMatrices[BoneIndexesByName[Skin.FrameName]] = \
+                    Skin.OffsetMatrix
+            self.__WriteReader(Stream, MATRIX_ARRAY_READER)
+            if MATRIX_READER not in self.__Readers:
+                self.__Readers.append(MATRIX_READER)
+            Stream.write(struct.pack("<I", BoneCount))
+            Stream.write(_Floats(_MirrorMatrix(OffsetMatrices)))
+        else:
+            _Write7BitInt(Stream, 0)
+
+        VertexBuffer = self.__AddSharedResource(VERTEX_BUFFER_READER,
+            self.__GetVertexBufferData(Vertexes))
+        IndexBuffer = self.__AddSharedResource(INDEX_BUFFER_READER,
+            self.__GetIndexBufferData(Triangles, len(Vertexes.Positions)))
+
+        MaterialIndexes = numpy.unique(TriangleMaterials)
+        Stream.write(struct.pack("<I", len(MaterialIndexes)))
+        for MaterialIndex in MaterialIndexes:
+            Start, Stop = numpy.searchsorted(TriangleMaterials,
+                (MaterialIndex, MaterialIndex + 1))
+            # VertexOffset, NumVertices, StartIndex, PrimitiveCount
+            Stream.write(struct.pack("<iiii", 0, len(Vertexes.Positions),
+                Start * 3, Stop - Start))
+            # Tag
+            if Mesh.BonePalette and Mesh.SkinWeights:
+                self.__WriteReader(Stream, INT32_ARRAY_READER)
+                if INT32_READER not in self.__Readers:
+                    self.__Readers.append(INT32_READER)
+                Stream.write(struct.pack("<I", len(Mesh.SkinWeights)))
+                Stream.write(numpy.array([BoneIndexesByName[Skin.FrameName]
+                    for Skin in Mesh.SkinWeights], dtype='<i4').tobytes())
+            else:
+                _Write7BitInt(Stream, 0)
+
+            Material = x_scene.Material("Default")
+            if MaterialIndex < len(Mesh.Materials):
+                Material = Mesh.Materials[MaterialIndex]
+            Effect = self.__GetEffect(Material, Vertexes)
+
+            for Resource in (VertexBuffer, IndexBuffer, Effect):
+                _Write7BitInt(Stream, Resource)
+
+    def __GetVertexBufferData(self, Vertexes):
+        Stream = io.BytesIO()
+
+        # The declaration is written inline, without a reader index
+        if VERTEX_DECLARATION_READER not in self.__Readers:
+            self.__Readers.append(VERTEX_DECLARATION_READER)
+        Stream.write(struct.pack("<II", Vertexes.Stride,
+            len(Vertexes.Elements)))
+        for Offset, Format, Usage, UsageIndex in Vertexes.Elements:
+            Stream.write(struct.pack("<IiiI", Offset, Format, Usage,
+                UsageIndex))
+
+        Stream.write(struct.pack("<I", len(Vertexes.Positions)))
+        Stream.write(Vertexes.Data.tobytes())
+        return Stream.getvalue()
+
+    def __GetIndexBufferData(self, Triangles, VertexCount):
+        Stream = io.BytesIO()
+        SixteenBits = VertexCount <= 0x10000
+        if SixteenBits:
+            Indexes = Triangles.astype('<u2')
+        else:
+            Indexes = Triangles.astype('<u4')
+            self.__HiDef = True
+        Data = Indexes.tobytes()
+        Stream.write(struct.pack("<?I", SixteenBits, len(Data)))
+        Stream.write(Data)
+        return Stream.getvalue()
+
+    # Returns the shared resource index of the effect for Material, adding
+    # it the first time it is needed
+    def __GetEffect(self, Material, Vertexes):
+        WeightsPerVertex = 0
+        if Vertexes.BlendIndices is not None:
+            # SkinnedEffect takes 1, 2 or 4 weights
+            WeightsPerVertex = MAX_BLEND_WEIGHTS
+            for Count in (1, 2):
+                if Vertexes.MaxWeights <= Count:
+                    WeightsPerVertex = Count
+                    break
+        VertexColors = Vertexes.Colors is not None
+
+        Key = (Material.Name, WeightsPerVertex, VertexColors)
+        if Key in self.__Effects:
+            return self.__Effects[Key]
+
+        Stream = io.BytesIO()
+        _WriteString(Stream, GetTextureAsset(Material.TextureFilename))
+        if WeightsPerVertex:
+            Reader = SKINNED_EFFECT_READER
+            Stream.write(struct.pack("<i", WeightsPerVertex))
+        else:
+            Reader = BASIC_EFFECT_READER
+        Stream.write(_Floats(Material.Diffuse[:3]))
+        Stream.write(_Floats(Material.Emissive))
+        Stream.write(_Floats(Material.Specular))
+        Stream.write(struct.pack("<ff", Material.Power, Material.Diffuse[3]))
+        if not WeightsPerVertex:
+            Stream.write(struct.pack("<?", VertexColors))
+
+        self.__Effects[Key] = self.__AddSharedResource(Reader,
+            Stream.getvalue())
+        return self.__Effects[Key]
+
+
+# Asset name of the Texture2D SaveTextures writes for TextureFilename, or
+# "" if it writes none
+def GetTextureAsset(TextureFilename):
+    Name, Extension = os.path.splitext(TextureFilename or "")
+    if Extension.lower() != ".dds":
+        return ""
+    return Name
+
+
+# Writes a Texture2D .xnb of Levels, the bytes of each mip level of a Width
+# by Height texture in Format, "DXT1" or "DXT5", largest first
+def WriteTexture(File, Format, Width, Height, Levels):
+    Asset = io.BytesIO()
+    # Index of TEXTURE2D_READER
+    _Write7BitInt(Asset, 1)
+    Asset.write(struct.pack("<iIII", SURFACE_FORMATS[Format], Width, Height,
+        len(Levels)))
+    for Level in Levels:
+        Asset.write(struct.pack("<I", len(Level)))
+        Asset.write(Level)
+    _WriteXnb(File, [TEXTURE2D_READER], Asset.getvalue(),
+        HiDef=max(Width, Height) > REACH_MAX_TEXTURE_SIZE)
+
+
+# Writes the Texture2D .xnb of each .dds texture of Scene's materials into
+# Directory, reading the .dds files from SourceDirectory, Directory unless
+# given.  Reserved holds paths the textures must not replace, such as the
+# model itself.  Returns the paths written.
+def SaveTextures(Scene, Directory, SourceDirectory=None, Reserved=()):
+    if SourceDirectory is None:
+        SourceDirectory = Directory
+    Reserved = set(os.path.abspath(Path) for Path in Reserved)
+
+    Materials = list(Scene.Materials)
+    for Mesh in Scene.IterMeshes():
+        Materials += Mesh.Materials
+    Textures = sorted(set(Material.TextureFilename for Material in Materials
+        if GetTextureAsset(Material.TextureFilename)))
+
+    Paths = []
+    for TextureFilename in Textures:
+        Path = os.path.join(Directory, GetTextureAsset(TextureFilename) +
+            ".xnb")
+        if os.path.abspath(Path) in Reserved:
+            raise ValueError("Texture %s would replace %s" % (
+                TextureFilename, Path))
+        with open(os.path.join(SourceDirectory, TextureFilename),
+            'rb') as File:
+            Texture = x_texture.ReadDDS(File)
+        Paths.append(x_file.Save(Path, lambda File: WriteTexture(File,
+            *Texture)))
+    return Paths
+
+
+# "Private" Methods
+
+# Writes an .xnb file holding the primary asset Asset, which uses Readers
+# and SharedResources
+def _WriteXnb(File, Readers, Asset, SharedResources=(), HiDef=False):
+    Content = io.BytesIO()
+    _Write7BitInt(Content, len(Readers))
+    for Reader in Readers:
+        _WriteString(Content, Reader)
+        # Reader version
+        Content.write(struct.pack("<i", 0))
+    _Write7BitInt(Content, len(SharedResources))
+    Content.write(Asset)
+    for Resource in SharedResources:
+        Content.write(Resource)
+    Data = Content.getvalue()
+
+    Flags = 0
+    if HiDef:
+        Flags |= FLAG_HIDEF
+    # The size includes the 10 byte header
+    File.write(b"XNB" + PLATFORM_WINDOWS + struct.pack("<BBI", XNB_VERSION,
+        Flags, 10 + len(Data)))
+    File.write(Data)
+
+
+# Converts the matrices in Matrix, in the scene's left-handed space, to the
+# right-handed space of XNA: S M S with S mirroring z
+def _MirrorMatrix(Matrix):
+    Matrix = numpy.array(Matrix, dtype=numpy.float64)
+    Matrix[..., 2, :] *= -1
+    Matrix[..., :, 2] *= -1
+    return Matrix
+
+
+# Appends Frame and its descendants to Bones as (Frame, parent index) pairs,
+# parents first
+def _GatherBones(Bones, Frame, Parent):
+    Index = len(Bones)
+    Bones.append((Frame, Parent))
+    for Child in Frame.Children:
+        _GatherBones(Bones, Child, Index)
+
+
+# Bone references are a byte if they fit, 0 meaning no bone
+def _GetBoneReferenceFormat(BoneCount):
+    if BoneCount < 255:
+        return "<B"
+    return "<I"
+
+
+def _BoneReference(Index):
+    if Index is None:
+        return 0
+    return Index + 1
+
+
+def _Floats(Array):
+    return numpy.ascontiguousarray(Array, dtype='<f4').tobytes()
+
+
+def _Write7BitInt(Stream, Value):
+    while Value >= 0x80:
+        Stream.write(struct.pack("<B", (Value & 0x7F) | 0x80))
+        Value >>= 7
+    Stream.write(struct.pack("<B", Value))
+
+
+def _WriteString(Stream, String):
+    Data = String.encode("utf-8")
+    _Write7BitInt(Stream, len(Data))
+    Stream.write(Data)
+
+
+# The vertex buffer contents of a mesh, one vertex per distinct position
+# and normal pair
+class _Vertexes:
+    def __init__(self):
+        self.Positions = None
+        self.Normals = None
+        self.TextureCoords = None
+        self.ExtraTextureCoords = []
+        self.Colors = None
+        self.BlendIndices = None
+        self.BlendWeights = None
+        self.MaxWeights = 0
+
+        # Vertex of each entry of the mesh's FaceIndices
+        self.Remap = None
+
+        # (Offset, VertexElementFormat, VertexElementUsage, usage index)
+        # and the interleaved (Vertices, Stride) bytes
+        self.Elements = []
+        self.Stride = 0
+        self.Data = None
+
+
+def _BuildVertexes(Mesh, BoneIndexesByName):
+    Vertexes = _Vertexes()
+
+    Corners = Mesh.FaceIndices.reshape(-1, 1)
+    if Mesh.Normals is not None:
+        Corners = numpy.column_stack((Mesh.FaceIndices,
+            Mesh.NormalFaceIndices))
+    Unique, Vertexes.Remap = x_scene.DeduplicateRows(Corners, 1)
+    Sources = Unique[:, 0]
+
+    # Mirrored in z, see _MirrorMatrix
+    Vertexes.Positions = numpy.asarray(Mesh.Positions)[Sources]
+    Vertexes.Positions[:, 2] *= -1
+    if Mesh.Normals is not None:
+        Vertexes.Normals = numpy.asarray(Mesh.Normals)[Unique[:, 1]]
+        Vertexes.Normals[:, 2] *= -1
+    if Mesh.TextureCoords is not None:
+        Vertexes.TextureCoords = numpy.asarray(Mesh.TextureCoords)[Sources]
+    Vertexes.ExtraTextureCoords = [numpy.asarray(Coords)[Sources]
+        for Coords in Mesh.ExtraTextureCoords]
+    if Mesh.VertexColors is not None:
+        Colors = numpy.asarray(Mesh.VertexColors)[Sources]
+        Vertexes.Colors = numpy.clip(numpy.round(Colors * 255), 0,
+            255).astype(numpy.uint8)
+    if Mesh.SkinWeights:
+        BlendIndices, BlendWeights, Vertexes.MaxWeights = \
+            _GetBlendWeights(Mesh, BoneIndexesByName)
+        Vertexes.BlendIndices = BlendIndices[Sources]
+        Vertexes.BlendWeights = BlendWeights[Sources]
+
+    Columns = [(Vertexes.Positions, FORMAT_VECTOR3, USAGE_POSITION, 0),
+        (Vertexes.Normals, FORMAT_VECTOR3, USAGE_NORMAL, 0),
+        (Vertexes.TextureCoords, FORMAT_VECTOR2, USAGE_TEXTURE_COORDINATE,
+            0)]
+    Columns += [(Coords, FORMAT_VECTOR2, USAGE_TEXTURE_COORDINATE, Index + 1)
+        for Index, Coords in enumerate(Vertexes.ExtraTextureCoords)]
+    Columns += [(Vertexes.Colors, FORMAT_COLOR, USAGE_COLOR, 0),
+        (Vertexes.BlendIndices, FORMAT_BYTE4, USAGE_BLEND_INDICES, 0),
+        (Vertexes.BlendWeights, FORMAT_VECTOR4, USAGE_BLEND_WEIGHT, 0)]
+    Columns = [(numpy.ascontiguousarray(Array, dtype=Array.dtype.newbyteorder(
+        '<')).view(numpy.uint8).reshape(len(Array), -1), Format, Usage,
+        UsageIndex) for Array, Format, Usage, UsageIndex in Columns
+        if Array is not None]
+
+    Vertexes.Data = numpy.empty((len(Vertexes.Positions), sum(
+        Column[0].shape[1] for Column in Columns)), dtype=numpy.uint8)
+    for Column, Format, Usage, UsageIndex in Columns:
+        Vertexes.Elements.append((Vertexes.Stride, Format, Usage,
+            UsageIndex))
+        Vertexes.Data[:, Vertexes.Stride:Vertexes.Stride +
+            Column.shape[1]] = Column
+        Vertexes.Stride += Column.shape[1]
+    return Vertexes
+
+
+# Returns the (Vertices, 4) bone indexes and normalized weights of the
+# strongest influences on each of Mesh's vertices, and the largest number of
+# influences on any vertex.  Bone indexes are model bone indexes, or palette
+# indexes for meshes with a BonePalette.
+def _GetBlendWeights(Mesh, BoneIndexesByName):
+    VertexIndexes = numpy.concatenate([Skin.Indices
+        for Skin in Mesh.SkinWeights])
+    Weights = numpy.concatenate([Skin.Weights for Skin in Mesh.SkinWeights])
+    BoneIndexes = [BoneIndexesByName[Skin.FrameName]
+        for Skin in Mesh.SkinWeights]
+    if Mesh.BonePalette:
+        BoneIndexes = range(len(Mesh.SkinWeights))
+    Bones = numpy.concatenate([numpy.repeat(BoneIndex, len(Skin.Indices))
+        for BoneIndex, Skin in zip(BoneIndexes, Mesh.SkinWeights)])
+    if len(Bones) and Bones.max() > 255:
+        raise ValueError("Mesh %s is skinned to bone %d, but XNA blend "
+            "indices only reach 255" % (Mesh.Name, Bones.max()))
+
+    # Strongest influence first within each vertex
+    Order = numpy.lexsort((-Weights, VertexIndexes))
+    VertexIndexes = VertexIndexes[Order]
+    Counts = numpy.bincount(VertexIndexes, minlength=Mesh.GetVertexCount())
+    Slots = numpy.arange(len(Order)) - numpy.repeat(numpy.cumsum(Counts) -
+        Counts, Counts)
+    Kept = Slots < MAX_BLEND_WEIGHTS
+
+    BlendIndices = numpy.zeros((Mesh.GetVertexCount(), MAX_BLEND_WEIGHTS),
+        dtype=numpy.uint8)
+    BlendWeights = numpy.zeros((Mesh.GetVertexCount(), MAX_BLEND_WEIGHTS),
+        dtype=numpy.float32)
+    BlendIndices[VertexIndexes[Kept], Slots[Kept]] = Bones[Order][Kept]
+    BlendWeights[VertexIndexes[Kept], Slots[Kept]] = Weights[Order][Kept]
+
+    Totals = BlendWeights.sum(axis=1, keepdims=True)
+    Totals[Totals == 0] = 1
+    BlendWeights /= Totals
+
+    MaxWeights = 0
+    if len(Counts):
+        MaxWeights = min(int(Counts.max()), MAX_BLEND_WEIGHTS)
+    return BlendIndices, BlendWeights, MaxWeights
+
+
+# Splits Mesh's polygons into fans of triangles, reversing the winding to
+# face the same way after mirroring.  Returns the (Triangles, 3) vertex
+# indexes, sorted by material, and the material index of each triangle.
+def _Triangulate(Mesh, Remap):
+    Sizes = Mesh.FaceSizes
+    TriangleCounts = numpy.maximum(Sizes - 2, 0)
+    Faces = numpy.repeat(numpy.arange(len(Sizes)), TriangleCounts)
+    Steps = numpy.arange(len(Faces)) - numpy.repeat(numpy.cumsum(
+        TriangleCounts) - TriangleCounts, TriangleCounts)
+
+    First = Mesh.GetFaceOffsets()[Faces]
+    Corners = numpy.column_stack((First, First + Steps + 2,
+        First + Steps + 1))
+    Triangles = Remap[Corners]
+
+    Materials = numpy.zeros(len(Faces), dtype=numpy.int32)
+    if Mesh.MaterialIndices is not None and len(Mesh.MaterialIndices):
+        Materials = numpy.asarray(Mesh.MaterialIndices)[Faces]
+
+    Order = numpy.argsort(Materials, kind='mergesort')
+    return Triangles[Order], Materials[Order]